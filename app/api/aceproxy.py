@@ -1,18 +1,23 @@
 """
 AceProxy API endpoints - Proxy to native aiohttp streaming server
 """
+import asyncio
 import logging
 from typing import Optional, List, Dict
 from datetime import datetime
 
 from fastapi import APIRouter, HTTPException, Request, Response, Depends
-from fastapi.responses import StreamingResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
 import aiohttp
 
 from app.utils.auth import get_db
 from app.models import Channel
 from app.config import get_config
+from app.services.buffer_budget import BufferBudgetExceeded
+from app.services.hls import PLAYLIST_CONTENT_TYPE, HLSUnavailable, with_uri_prefix
+from app.services.metrics import PROMETHEUS_CONTENT_TYPE, render_prometheus
+from app.services.stream_info_cache import StreamUnavailable
 
 logger = logging.getLogger(__name__)
 
@@ -78,7 +83,7 @@ def deduplicate_clients(clients_info: List[dict], time_threshold: int = 10) -> L
     return result
 
 
-# Endpoints compatible with pyacexy - now proxying to aiohttp server
+# Endpoints compatible with pyacexy - served by the in-process aiohttp streaming server
 @router.get("/ace/getstream")
 @router.get("/ace/getstream/")
 async def ace_getstream(
@@ -88,7 +93,8 @@ async def ace_getstream(
 ):
     """
     Main AceStream proxy endpoint (pyacexy compatible)
-    Stream AceStream content via HTTP - PROXIES to native aiohttp server
+    Stream AceStream content via HTTP - subscribes directly to the shared stream
+    of the aiohttp streaming server (no loopback connection)
     Query params:
     - id: AceStream content ID
     - infohash: Torrent infohash
@@ -100,43 +106,41 @@ async def ace_getstream(
     if id and infohash:
         raise HTTPException(status_code=400, detail="Only one of id or infohash can be specified")
     
-    # Get streaming server config
-    config = get_config()
+    if 'pid' in request.query_params:
+        raise HTTPException(status_code=400, detail="PID parameter is not allowed")
+    
+    aiohttp_server = request.app.state.aiohttp_streaming_server
+    if not aiohttp_server:
+        raise HTTPException(status_code=503, detail="Streaming server not available")
     
-    # Build URL to aiohttp streaming server (internal)
     stream_id = id or infohash
-    aiohttp_url = f"http://{config.acestream_streaming_host}:{config.acestream_streaming_port}/ace/getstream?{'id' if id else 'infohash'}={stream_id}"
+    username = request.query_params.get('username', 'Anonymous')
+    client_ip = request.query_params.get('client_ip', request.client.host)
+    client_ua = request.query_params.get('client_ua', request.headers.get('User-Agent', 'Unknown'))
     
-    # Add any extra query parameters
-    for key, value in request.query_params.items():
-        if key not in ('id', 'infohash'):
-            aiohttp_url += f"&{key}={value}"
+    # Extra query parameters are passed on to the engine
+    extra_params = {k: v for k, v in request.query_params.items()
+                    if k not in ('id', 'infohash', 'pid', 'username', 'client_ip', 'client_ua')}
     
-    logger.info(f"Proxying stream {stream_id} to aiohttp server")
+    if not aiohttp_server.attachable:
+        # Streaming server on its own loop: the player connects to it directly
+        params = {'id' if id else 'infohash': stream_id, 'username': username, **extra_params}
+        return RedirectResponse(aiohttp_server.stream_url(request.url.hostname, params), status_code=302)
     
-    # Proxy to aiohttp server
-    async def stream_proxy():
-        """Proxy stream from aiohttp server"""
-        timeout = aiohttp.ClientTimeout(sock_read=60)
-        try:
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(aiohttp_url) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"Aiohttp server error: {response.status} - {error_text}")
-                        return
-                    
-                    async for chunk in response.content.iter_chunked(8192):
-                        if chunk:
-                            yield chunk
-        except Exception as e:
-            logger.error(f"Error proxying stream: {e}")
+    logger.info(f"Client {client_ip} (user: {username}) requesting stream {stream_id}")
+    
+    try:
+        ongoing = await aiohttp_server.open_stream(stream_id, extra_params)
+    except BufferBudgetExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to start stream {stream_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start stream: {e}")
     
     return StreamingResponse(
-        stream_proxy(),
+        aiohttp_server.iter_client_bytes(ongoing, client_ip, client_ua, username),
         media_type="video/MP2T",
         headers={
-            "Transfer-Encoding": "chunked",
             "Cache-Control": "no-cache",
             "Access-Control-Allow-Origin": "*",
         }
@@ -181,6 +185,173 @@ async def ace_status(
         raise HTTPException(status_code=503, detail="Streaming server not available")
 
 
+async def hls_playlist_response(aiohttp_server, key: str, client_ip: str, client_ua: str,
+                                username: str = "Anonymous", extra_params: Optional[dict] = None,
+                                uri_prefix: str = "") -> Response:
+    """
+    HLS playlist of a stream served in-process (attachable streaming server),
+    segment URIs prefixed with uri_prefix
+    """
+    try:
+        playlist = await aiohttp_server.hls_playlist(key, client_ip, client_ua, username, extra_params)
+    except BufferBudgetExceeded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except StreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Failed to start stream: {e}",
+                            headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except HLSUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error(f"Failed to start stream {key}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start stream: {e}")
+    
+    if uri_prefix:
+        playlist = with_uri_prefix(playlist, uri_prefix)
+    return Response(content=playlist, media_type=PLAYLIST_CONTENT_TYPE, headers={
+        "Cache-Control": "no-cache",
+        "Access-Control-Allow-Origin": "*",
+    })
+
+
+@router.get("/ace/hls/{key}/index.m3u8")
+async def ace_hls_playlist(request: Request, key: str):
+    """
+    HLS rendition of a stream: live playlist, cut from the shared TS stream
+    Query params as /ace/getstream (username, client_ip, client_ua, engine parameters)
+    """
+    aiohttp_server = request.app.state.aiohttp_streaming_server
+    if not aiohttp_server:
+        raise HTTPException(status_code=503, detail="Streaming server not available")
+    
+    username = request.query_params.get('username', 'Anonymous')
+    extra_params = {k: v for k, v in request.query_params.items()
+                    if k not in ('id', 'infohash', 'pid', 'username', 'client_ip', 'client_ua')}
+    
+    if not aiohttp_server.attachable:
+        params = {'username': username, **extra_params}
+        return RedirectResponse(aiohttp_server.hls_url(request.url.hostname, key, params), status_code=302)
+    
+    return await hls_playlist_response(
+        aiohttp_server, key,
+        request.query_params.get('client_ip', request.client.host),
+        request.query_params.get('client_ua', request.headers.get('User-Agent', 'Unknown')),
+        username, extra_params
+    )
+
+
+@router.get("/ace/hls/{key}/{sequence}.ts")
+async def ace_hls_segment(request: Request, key: str, sequence: int):
+    """One HLS segment: the same bytes for every viewer, cacheable for good"""
+    aiohttp_server = request.app.state.aiohttp_streaming_server
+    if not aiohttp_server:
+        raise HTTPException(status_code=503, detail="Streaming server not available")
+    
+    if not aiohttp_server.attachable:
+        playlist_url = aiohttp_server.hls_url(request.url.hostname, key, {})
+        return RedirectResponse(playlist_url.split("index.m3u8")[0] + f"{sequence}.ts", status_code=302)
+    
+    data = await aiohttp_server.hls_segment(key, sequence)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    # Sequence numbers are never reused
+    return Response(content=data, media_type="video/MP2T", headers={
+        "Cache-Control": "public, max-age=86400, immutable",
+        "Access-Control-Allow-Origin": "*",
+    })
+
+
+async def manifest_playlist_response(aiohttp_server, key: str, client_ip: str, client_ua: str,
+                                     username: str = "Anonymous", extra_params: Optional[dict] = None,
+                                     uri_prefix: str = "") -> Response:
+    """
+    Engine HLS playlist of a stream served in-process (attachable streaming server),
+    segment URIs prefixed with uri_prefix
+    """
+    try:
+        playlist = await aiohttp_server.manifest_playlist(key, client_ip, client_ua, username, extra_params)
+    except StreamUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Failed to start stream: {e}",
+                            headers={"Retry-After": str(int(e.retry_after) + 1)})
+    except (HLSUnavailable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=502, detail=f"Engine playlist unavailable: {e}")
+    except Exception as e:
+        logger.error(f"Failed to start engine HLS session for {key}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to start stream: {e}")
+    
+    if uri_prefix:
+        playlist = with_uri_prefix(playlist, uri_prefix)
+    return Response(content=playlist, media_type=PLAYLIST_CONTENT_TYPE, headers={
+        "Cache-Control": "no-cache",
+        "Access-Control-Allow-Origin": "*",
+    })
+
+
+@router.get("/ace/manifest.m3u8")
+async def ace_manifest(
+    request: Request,
+    id: Optional[str] = None,
+    infohash: Optional[str] = None
+):
+    """
+    Engine HLS output of a stream (engine compatible): one engine session per
+    stream, each segment fetched once and served to every viewer from a cache
+    Query params as /ace/getstream
+    """
+    if not id and not infohash:
+        raise HTTPException(status_code=400, detail="Missing id or infohash parameter")
+    
+    if id and infohash:
+        raise HTTPException(status_code=400, detail="Only one of id or infohash can be specified")
+    
+    if 'pid' in request.query_params:
+        raise HTTPException(status_code=400, detail="PID parameter is not allowed")
+    
+    aiohttp_server = request.app.state.aiohttp_streaming_server
+    if not aiohttp_server:
+        raise HTTPException(status_code=503, detail="Streaming server not available")
+    
+    stream_id = id or infohash
+    username = request.query_params.get('username', 'Anonymous')
+    extra_params = {k: v for k, v in request.query_params.items()
+                    if k not in ('id', 'infohash', 'pid', 'username', 'client_ip', 'client_ua')}
+    
+    if not aiohttp_server.attachable:
+        params = {'id' if id else 'infohash': stream_id, 'username': username, **extra_params}
+        return RedirectResponse(aiohttp_server.manifest_url(request.url.hostname, params), status_code=302)
+    
+    return await manifest_playlist_response(
+        aiohttp_server, stream_id,
+        request.query_params.get('client_ip', request.client.host),
+        request.query_params.get('client_ua', request.headers.get('User-Agent', 'Unknown')),
+        username, extra_params
+    )
+
+
+@router.get("/ace/manifest/{key}/{epoch}/{sequence}.ts")
+async def ace_manifest_segment(request: Request, key: str, epoch: int, sequence: int):
+    """One engine HLS segment, from the segment cache"""
+    aiohttp_server = request.app.state.aiohttp_streaming_server
+    if not aiohttp_server:
+        raise HTTPException(status_code=503, detail="Streaming server not available")
+    
+    if not aiohttp_server.attachable:
+        playlist_url = aiohttp_server.manifest_url(request.url.hostname, {'id': key})
+        return RedirectResponse(playlist_url.split("manifest.m3u8")[0] + f"manifest/{key}/{epoch}/{sequence}.ts",
+                                status_code=302)
+    
+    try:
+        data = await aiohttp_server.manifest_segment(key, epoch, sequence)
+    except (HLSUnavailable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=502, detail=f"Engine segment unavailable: {e}")
+    if data is None:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    # Epoch and sequence numbers are never reused
+    return Response(content=data, media_type="video/MP2T", headers={
+        "Cache-Control": "public, max-age=86400, immutable",
+        "Access-Control-Allow-Origin": "*",
+    })
+
+
 # Additional management endpoints (use AceProxyService for stats/management)
 @router.get("/api/aceproxy/streams")
 async def get_all_streams(request: Request, db: Session = Depends(get_db)):
@@ -196,27 +367,19 @@ async def get_all_streams(request: Request, db: Session = Depends(get_db)):
                 "streams": []
             }
         
-        # Get snapshot to avoid holding lock too long
+        # Plain data snapshot (the streaming server may run on another event loop)
         streams_list = []
-        async with aiohttp_server.streams_lock:
-            stream_items = list(aiohttp_server.streams.items())
-        
-        # Now process streams without holding the global lock
-        for stream_id, ongoing_stream in stream_items:
+        for stream in await aiohttp_server.streams_snapshot():
+            stream_id = stream["stream_id"]
             # Look up channel name in database
-            channel = db.query(Channel).filter(Channel.acestream_id == stream_id).first()
+            if stream["source"] in ("acestream", "engine_hls"):
+                channel = db.query(Channel).filter(Channel.acestream_id == stream_id).first()
+            else:
+                channel = db.query(Channel).filter(Channel.stream_url == stream_id).first()
             channel_name = channel.name if channel else stream_id[:20] + "..."
             
-            # Get RAW client info from streaming server
-            async with ongoing_stream.lock:
-                raw_clients = []
-                for client_info in ongoing_stream.clients.values():
-                    raw_clients.append({
-                        "username": client_info.username,
-                        "ip": client_info.ip,
-                        "user_agent": client_info.user_agent,
-                        "connected_at": client_info.connected_at.isoformat()
-                    })
+            # RAW client info from streaming server
+            raw_clients = stream["clients"] + stream.get("hls_viewers", [])
             
             # DEDUPLICATION: Merge duplicate connections from same user
             # (e.g., IPTV Smarters opens 2 connections: app + video player)
@@ -228,8 +391,9 @@ async def get_all_streams(request: Request, db: Session = Depends(get_db)):
                 "clients": deduped_clients,
                 "client_count": len(deduped_clients),  # Deduplicated count
                 "physical_connections": len(raw_clients),  # Total physical connections (for debugging)
-                "created_at": ongoing_stream.created_at.isoformat() if hasattr(ongoing_stream, 'created_at') else None,
-                "is_active": ongoing_stream.fetch_task and not ongoing_stream.fetch_task.done()
+                "created_at": stream["created_at"],
+                "is_active": stream["is_active"],
+                "warm": stream.get("warm", False)
             })
         
         return {
@@ -242,6 +406,51 @@ async def get_all_streams(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail="Streaming server not available")
 
 
+@router.get("/api/aceproxy/startup")
+async def get_startup_stats(
+    request: Request,
+    id: Optional[str] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """
+    Stream start latency per channel, slowest first (by p95 time to first data)
+    Query params:
+    - id: AceStream content ID or stream URL (optional - only this channel)
+    - limit: Maximum number of channels returned
+    """
+    aiohttp_server = request.app.state.aiohttp_streaming_server
+    if not aiohttp_server:
+        return {"status": "success", "total_channels": 0, "channels": []}
+    
+    try:
+        snapshot = await aiohttp_server.startup_snapshot(id)
+    except Exception as e:
+        logger.error(f"Error getting startup statistics: {e}")
+        raise HTTPException(status_code=503, detail="Streaming server not available")
+    
+    channels = []
+    for key, stats in snapshot.items():
+        if stats["source"] == "acestream":
+            channel = db.query(Channel).filter(Channel.acestream_id == key).first()
+        else:
+            channel = db.query(Channel).filter(Channel.stream_url == key).first()
+        channels.append({
+            "stream_id": key,
+            "channel_id": channel.id if channel else None,
+            "channel_name": channel.name if channel else key[:20] + "...",
+            **stats
+        })
+    
+    # Slowest channels first; channels that never started go last
+    channels.sort(key=lambda c: c["phases"]["total"]["p95"] or -1, reverse=True)
+    return {
+        "status": "success",
+        "total_channels": len(channels),
+        "channels": channels[:limit]
+    }
+
+
 @router.get("/api/aceproxy/streams/{stream_id}")
 async def get_stream_info(stream_id: str, request: Request):
     """Get information about a specific stream"""
@@ -278,22 +487,55 @@ async def close_stream(stream_id: str, request: Request):
 async def get_aceproxy_stats(request: Request):
     """Get overall AceProxy statistics"""
     config = get_config()
+    aiohttp_server = request.app.state.aiohttp_streaming_server
+    if not aiohttp_server:
+        raise HTTPException(status_code=503, detail="Streaming server not available")
+    
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://{config.acestream_streaming_host}:{config.acestream_streaming_port}/ace/status") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return {
-                        "status": "success",
-                        "stats": {
-                            "total_streams": data.get("streams", 0),
-                            "total_clients": 0,  # Not tracked in pyacexy pattern
-                            "server_type": "aiohttp native pyacexy",
-                            "streaming_port": config.acestream_streaming_port
-                        }
-                    }
-                else:
-                    raise HTTPException(status_code=503, detail="Streaming server not available")
-    except aiohttp.ClientError as e:
-        logger.error(f"Error querying aiohttp server: {e}")
+        snapshots = await aiohttp_server.metrics_snapshot()
+    except Exception as e:
+        logger.error(f"Error getting streaming metrics: {e}")
         raise HTTPException(status_code=503, detail="Streaming server not available")
+    
+    # Buffer memory, summed over workers (each worker has its share of the budget)
+    buffers = {"limit": 0, "used": 0, "shrunk": 0, "evicted": 0, "rejected": 0, "streams": {}}
+    for snapshot in snapshots:
+        for field in ("limit", "used", "shrunk", "evicted", "rejected"):
+            buffers[field] += snapshot["buffers"].get(field, 0)
+        buffers["streams"].update(snapshot["buffers"].get("streams", {}))
+    
+    # Pre-warming: joins served by a warm stream vs joins that waited for the engine
+    prewarm = {field: sum(s[field] for s in snapshots)
+               for field in ("prewarm_started", "prewarm_hits", "prewarm_unused", "cold_starts")}
+    joins = prewarm["prewarm_hits"] + prewarm["cold_starts"]
+    prewarm["hit_rate"] = round(prewarm["prewarm_hits"] / joins, 3) if joins else None
+    prewarmer = getattr(request.app.state, "prewarmer", None)
+    prewarm.update(prewarmer.snapshot() if prewarmer else {"streams": 0, "warm": []})
+    
+    return {
+        "status": "success",
+        "stats": {
+            "total_streams": sum(s["streams"] for s in snapshots),
+            "total_clients": sum(s["clients"] for s in snapshots),
+            "upstream_bytes": sum(s["upstream_bytes"] for s in snapshots),
+            "client_bytes": sum(s["client_bytes"] for s in snapshots),
+            "buffers": buffers,
+            "prewarm": prewarm,
+            "server_type": "aiohttp native pyacexy",
+            "streaming_port": config.acestream_streaming_port
+        }
+    }
+
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus metrics of the streaming server (all workers)"""
+    aiohttp_server = request.app.state.aiohttp_streaming_server
+    snapshots = []
+    if aiohttp_server:
+        try:
+            snapshots = await aiohttp_server.metrics_snapshot()
+        except Exception as e:
+            logger.error(f"Error getting streaming metrics: {e}")
+            raise HTTPException(status_code=503, detail="Streaming server not available")
+    return Response(render_prometheus(snapshots), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -43,14 +43,9 @@ async def get_dashboard_stats(request: Request, db: Session = Depends(get_db)):
     try:
         aiohttp_server = request.app.state.aiohttp_streaming_server
         if aiohttp_server:
-            # Get snapshot to avoid holding lock too long
-            async with aiohttp_server.streams_lock:
-                streams_snapshot = list(aiohttp_server.streams.values())
-            
+            streams_snapshot = await aiohttp_server.streams_snapshot()
             active_streams = len(streams_snapshot)
-            for stream in streams_snapshot:
-                async with stream.lock:
-                    total_clients += len(stream.clients)
+            total_clients = sum(len(stream["clients"]) for stream in streams_snapshot)
     except Exception as e:
         logger.error(f"Error getting active streams: {e}")
     
@@ -59,10 +54,12 @@ async def get_dashboard_stats(request: Request, db: Session = Depends(get_db)):
         "status": "disabled",
         "available": False
     }
+    acestream_engines = []
     try:
         aceproxy = request.app.state.aceproxy_service
         if aceproxy:
             acestream_engine_status = await aceproxy.check_engine_health()
+            acestream_engines = await aceproxy.check_engines_health()
     except Exception as e:
         logger.error(f"Error checking AceStream engine health: {e}")
         acestream_engine_status = {
@@ -83,7 +80,8 @@ async def get_dashboard_stats(request: Request, db: Session = Depends(get_db)):
         "epg_sources": total_epg_sources,
         "active_streams": active_streams,
         "active_connections": total_clients,
-        "acestream_engine": acestream_engine_status
+        "acestream_engine": acestream_engine_status,
+        "acestream_engines": acestream_engines
     }
 
 
@@ -110,6 +108,8 @@ async def get_channels(
             "logo_url": channel.logo_url,
             "is_online": channel.is_online,
             "is_active": channel.is_active,
+            "startup_p50": channel.startup_p50,
+            "startup_p95": channel.startup_p95,
             "created_at": channel.created_at.isoformat()
         }
         for channel in channels
@@ -163,5 +163,25 @@ async def update_epg(db: Session = Depends(get_db)):
 @router.post("/channels/check")
 async def check_channels(db: Session = Depends(get_db)):
     """Check channel status"""
-    # TODO: Implement channel status check
+    from main import channel_checker
+    
+    if not channel_checker:
+        return {"status": "error", "message": "Channel checker not initialized"}
+    
+    if not channel_checker.trigger():
+        return {"status": "running", "message": "Channel check already running",
+                "progress": channel_checker.snapshot()}
+    
+    logger.info("=== MANUAL CHANNEL CHECK TRIGGERED VIA API ===")
     return {"status": "triggered", "message": "Channel check will start shortly"}
+
+
+@router.get("/channels/check")
+async def get_channel_check_status():
+    """Progress of the current or last channel check"""
+    from main import channel_checker
+    
+    if not channel_checker:
+        return {"status": "error", "message": "Channel checker not initialized"}
+    
+    return {"status": "ok", "progress": channel_checker.snapshot()}
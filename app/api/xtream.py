@@ -7,15 +7,17 @@ import asyncio
 import aiohttp
 from datetime import datetime, timedelta
 from typing import Optional, List
-from urllib.parse import quote
+from urllib.parse import parse_qsl, quote, urlparse
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import RedirectResponse, StreamingResponse, Response
 from sqlalchemy.orm import Session
 
 from app.models import User, Channel, Category, EPGProgram
 from app.services.epg_service import EPGService
 from app.services.aceproxy_service import AceProxyService
+from app.services.buffer_budget import BufferBudgetExceeded
+from app.api.aceproxy import hls_playlist_response, manifest_playlist_response
 from app.utils.auth import verify_user, get_db
 from app.config import get_config
 
@@ -79,6 +81,23 @@ class StreamHelper:
             logger.info(f"Streaming from {url} terminated")
 
 
+def is_playlist_url(url: str) -> bool:
+    """Whether a URL points to a playlist (HLS) rather than a continuous stream"""
+    return urlparse(url).path.lower().endswith(('.m3u8', '.m3u'))
+
+
+def engine_manifest_params(url: str) -> Optional[dict]:
+    """Query of an AceStream engine HLS URL (/ace/manifest.m3u8?id=...), None for other URLs"""
+    parsed = urlparse(url)
+    if not parsed.path.endswith("/ace/manifest.m3u8"):
+        return None
+    params = dict(parse_qsl(parsed.query))
+    if not params.get("id") and not params.get("infohash"):
+        return None
+    params.pop("pid", None)
+    return params
+
+
 class ClientTracker:
     """
     Track client connections to streams.
@@ -433,9 +452,82 @@ async def stream_live_channel(
     # Track client
     CLIENT.add_client(request.client.host, str(request.client.port), stream_url)
     
+    # AceStream channels attach directly to the in-process fan-out (no loopback HTTP hop)
+    streaming_server = getattr(request.app.state, "aiohttp_streaming_server", None)
+    if channel.acestream_id and streaming_server:
+        extra_params = {k: v for k, v in request.query_params.items()
+                        if k not in ('id', 'infohash', 'pid', 'username', 'client_ip', 'client_ua')}
+        if extension == "m3u8":
+            # HLS rendition of the shared stream, its segments are the same for every user
+            if not streaming_server.attachable:
+                redirect_url = streaming_server.hls_url(
+                    request.url.hostname, channel.acestream_id, {"username": username, **extra_params}
+                )
+                logger.info(f"Redirecting {stream_id} to {redirect_url}")
+                return RedirectResponse(redirect_url, status_code=302)
+            return await hls_playlist_response(
+                streaming_server, channel.acestream_id, real_client_ip, real_user_agent, username,
+                extra_params, uri_prefix=f"{get_base_url(request)}/ace/hls/{channel.acestream_id}/"
+            )
+        
+        if not streaming_server.attachable:
+            # Streaming server on its own loop: the player connects to it directly
+            redirect_url = streaming_server.stream_url(
+                request.url.hostname, {"id": channel.acestream_id, "username": username, **extra_params}
+            )
+            logger.info(f"Redirecting {stream_id} to {redirect_url}")
+            return RedirectResponse(redirect_url, status_code=302)
+        
+        logger.info(f"Streaming {stream_id} from shared stream {channel.acestream_id}")
+        try:
+            ongoing = await streaming_server.open_stream(channel.acestream_id, extra_params)
+        except BufferBudgetExceeded as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            logger.error(f"Failed to start stream {channel.acestream_id}: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to start stream: {e}")
+        
+        return StreamingResponse(
+            streaming_server.iter_client_bytes(ongoing, real_client_ip, real_user_agent, username),
+            media_type="video/mp2t",
+            headers={"Cache-Control": "no-cache"}
+        )
+    
+    # Engine HLS URLs (acestream_search --hls) share one engine session per stream
+    manifest_params = engine_manifest_params(stream_url) if not channel.acestream_id else None
+    if manifest_params and streaming_server:
+        if not streaming_server.attachable:
+            redirect_url = streaming_server.manifest_url(
+                request.url.hostname, {"username": username, **manifest_params}
+            )
+            logger.info(f"Redirecting {stream_id} to {redirect_url}")
+            return RedirectResponse(redirect_url, status_code=302)
+        key = manifest_params.pop("id", None) or manifest_params.pop("infohash")
+        manifest_params.pop("infohash", None)
+        return await manifest_playlist_response(
+            streaming_server, key, request.client.host, request.headers.get("User-Agent", "Unknown"),
+            username, manifest_params, uri_prefix=f"{get_base_url(request)}/ace/"
+        )
+    
+    # Direct MPEG-TS sources share one upstream connection per URL as well
+    # (HLS playlists are fetched per viewer, their segments go through /live/.../<file>)
+    if (not channel.acestream_id and streaming_server and streaming_server.attachable
+            and not is_playlist_url(stream_url)):
+        logger.info(f"Streaming {stream_id} from shared stream {stream_url}")
+        try:
+            ongoing = await streaming_server.open_url(stream_url)
+        except BufferBudgetExceeded as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return StreamingResponse(
+            streaming_server.iter_client_bytes(ongoing, request.client.host,
+                                               request.headers.get("User-Agent", "Unknown"), username),
+            media_type="video/mp2t",
+            headers={"Cache-Control": "no-cache"}
+        )
+    
     logger.info(f"Streaming {stream_id} from: {stream_url}")
     
-    # Stream the content (both AceStream and direct streams go through StreamHelper)
+    # Stream the content (playlists, or no streaming server running)
     return StreamingResponse(
         StreamHelper.receive_stream(stream_url),
         media_type="video/mp2t"
@@ -208,6 +208,8 @@ class Config:
     ACESTREAM_ENGINE_HOST: str = None
     ACESTREAM_ENGINE_PORT: int = None
     ACESTREAM_TIMEOUT: int = None
+    ACESTREAM_ENGINES: List[str] = None
+    ACESTREAM_ENGINE_CHECK_INTERVAL: int = None
     
     # AceStream Streaming Server (internal)
     ACESTREAM_STREAMING_HOST: str = None
@@ -215,6 +217,32 @@ class Config:
     ACESTREAM_CHUNK_SIZE: int = None
     ACESTREAM_EMPTY_TIMEOUT: float = None
     ACESTREAM_NO_RESPONSE_TIMEOUT: float = None
+    ACESTREAM_BUFFER_SIZE: int = None
+    ACESTREAM_BUFFER_BUDGET: int = None
+    ACESTREAM_WRITE_COALESCE_MS: int = None
+    ACESTREAM_PERFORMANCE_PROFILE: bool = None
+    ACESTREAM_SOCKET_SEND_BUFFER: int = None
+    ACESTREAM_ENGINE_CONNECTIONS_PER_HOST: int = None
+    ACESTREAM_INFO_FAILURE_TTL: int = None
+    ACESTREAM_INFO_FAILURE_MAX_TTL: int = None
+    ACESTREAM_PREWARM_STREAMS: int = None
+    ACESTREAM_PREWARM_STRATEGY: str = None
+    ACESTREAM_PREWARM_INTERVAL: int = None
+    ACESTREAM_HLS_SEGMENT_SECONDS: float = None
+    ACESTREAM_HLS_WINDOW: int = None
+    ACESTREAM_HLS_PROXY_CACHE_SIZE: int = None
+    ACESTREAM_BACKLOG_SECONDS: float = None
+    ACESTREAM_BACKLOG_BYTES: int = None
+    ACESTREAM_LINGER_SECONDS: float = None
+    ACESTREAM_RECONNECT_ATTEMPTS: int = None
+    ACESTREAM_RECONNECT_DELAY: float = None
+    ACESTREAM_SLOW_CLIENT_POLICY: str = None
+    ACESTREAM_SKIP_LAG_SECONDS: float = None
+    ACESTREAM_STREAMING_THREAD: bool = None
+    ACESTREAM_STREAMING_PUBLIC_URL: str = None
+    ACESTREAM_STREAMING_WORKERS: int = None
+    ACESTREAM_STREAMING_WORKER_PORT: int = None
+    ACESTREAM_STARTUP_STATS_INTERVAL: int = None
     
     # Scraper Configuration
     SCRAPER_URLS: List[str] = None
@@ -224,6 +252,10 @@ class Config:
     EPG_SOURCES: List[str] = None
     EPG_UPDATE_INTERVAL: int = None
     EPG_CACHE_FILE: str = None
+    CHANNEL_CHECK_INTERVAL: int = None
+    CHANNEL_CHECK_CONCURRENCY: int = None
+    CHANNEL_CHECK_PER_HOST: int = None
+    CHANNEL_CHECK_TIMEOUT: int = None
     
     # Database Configuration
     DATABASE_URL: str = None
@@ -255,6 +287,9 @@ class Config:
                                                      min_value=1, max_value=65535)
         cls.ACESTREAM_TIMEOUT = cls._parse_int("ACESTREAM_TIMEOUT", 
                                                 min_value=1, max_value=300)
+        cls.ACESTREAM_ENGINES = cls._parse_list("ACESTREAM_ENGINES", allow_empty=True)
+        cls.ACESTREAM_ENGINE_CHECK_INTERVAL = cls._parse_int("ACESTREAM_ENGINE_CHECK_INTERVAL", default=30,
+                                                              min_value=5, max_value=3600)
         
         # AceStream Streaming Server (internal)
         cls.ACESTREAM_STREAMING_HOST = cls._get_env("ACESTREAM_STREAMING_HOST")
@@ -266,6 +301,53 @@ class Config:
                                                         min_value=1.0, max_value=600.0)
         cls.ACESTREAM_NO_RESPONSE_TIMEOUT = cls._parse_float("ACESTREAM_NO_RESPONSE_TIMEOUT", 
                                                               min_value=1.0, max_value=60.0)
+        cls.ACESTREAM_BUFFER_SIZE = cls._parse_int("ACESTREAM_BUFFER_SIZE", default=4194304,
+                                                    min_value=262144, max_value=268435456)
+        cls.ACESTREAM_BUFFER_BUDGET = cls._parse_int("ACESTREAM_BUFFER_BUDGET", default=0,
+                                                      min_value=0, max_value=68719476736)
+        cls.ACESTREAM_WRITE_COALESCE_MS = cls._parse_int("ACESTREAM_WRITE_COALESCE_MS", default=30,
+                                                          min_value=0, max_value=200)
+        cls.ACESTREAM_PERFORMANCE_PROFILE = cls._parse_bool("ACESTREAM_PERFORMANCE_PROFILE", default=False)
+        cls.ACESTREAM_SOCKET_SEND_BUFFER = cls._parse_int("ACESTREAM_SOCKET_SEND_BUFFER", default=0,
+                                                           min_value=0, max_value=67108864)
+        cls.ACESTREAM_ENGINE_CONNECTIONS_PER_HOST = cls._parse_int("ACESTREAM_ENGINE_CONNECTIONS_PER_HOST",
+                                                                    default=0, min_value=0, max_value=10000)
+        cls.ACESTREAM_INFO_FAILURE_TTL = cls._parse_int("ACESTREAM_INFO_FAILURE_TTL", default=30,
+                                                         min_value=0, max_value=3600)
+        cls.ACESTREAM_INFO_FAILURE_MAX_TTL = cls._parse_int("ACESTREAM_INFO_FAILURE_MAX_TTL", default=300,
+                                                             min_value=0, max_value=86400)
+        cls.ACESTREAM_PREWARM_STREAMS = cls._parse_int("ACESTREAM_PREWARM_STREAMS", default=0,
+                                                        min_value=0, max_value=64)
+        cls.ACESTREAM_PREWARM_STRATEGY = cls._get_env("ACESTREAM_PREWARM_STRATEGY", default="mixed").lower()
+        cls.ACESTREAM_PREWARM_INTERVAL = cls._parse_int("ACESTREAM_PREWARM_INTERVAL", default=10,
+                                                         min_value=2, max_value=600)
+        cls.ACESTREAM_HLS_SEGMENT_SECONDS = cls._parse_float("ACESTREAM_HLS_SEGMENT_SECONDS", default=4.0,
+                                                              min_value=1.0, max_value=30.0)
+        cls.ACESTREAM_HLS_WINDOW = cls._parse_int("ACESTREAM_HLS_WINDOW", default=6,
+                                                   min_value=3, max_value=30)
+        cls.ACESTREAM_HLS_PROXY_CACHE_SIZE = cls._parse_int("ACESTREAM_HLS_PROXY_CACHE_SIZE", default=67108864,
+                                                             min_value=1048576, max_value=4294967296)
+        cls.ACESTREAM_BACKLOG_SECONDS = cls._parse_float("ACESTREAM_BACKLOG_SECONDS", default=2.0,
+                                                          min_value=0.0, max_value=60.0)
+        cls.ACESTREAM_BACKLOG_BYTES = cls._parse_int("ACESTREAM_BACKLOG_BYTES", default=0,
+                                                      min_value=0, max_value=268435456)
+        cls.ACESTREAM_LINGER_SECONDS = cls._parse_float("ACESTREAM_LINGER_SECONDS", default=10.0,
+                                                         min_value=0.0, max_value=600.0)
+        cls.ACESTREAM_RECONNECT_ATTEMPTS = cls._parse_int("ACESTREAM_RECONNECT_ATTEMPTS", default=3,
+                                                           min_value=0, max_value=20)
+        cls.ACESTREAM_RECONNECT_DELAY = cls._parse_float("ACESTREAM_RECONNECT_DELAY", default=1.0,
+                                                          min_value=0.0, max_value=60.0)
+        cls.ACESTREAM_SLOW_CLIENT_POLICY = cls._get_env("ACESTREAM_SLOW_CLIENT_POLICY", default="skip").lower()
+        cls.ACESTREAM_SKIP_LAG_SECONDS = cls._parse_float("ACESTREAM_SKIP_LAG_SECONDS", default=10.0,
+                                                           min_value=0.5, max_value=600.0)
+        cls.ACESTREAM_STREAMING_THREAD = cls._parse_bool("ACESTREAM_STREAMING_THREAD", default=False)
+        cls.ACESTREAM_STREAMING_PUBLIC_URL = cls._get_env("ACESTREAM_STREAMING_PUBLIC_URL", default="")
+        cls.ACESTREAM_STREAMING_WORKERS = cls._parse_int("ACESTREAM_STREAMING_WORKERS", default=1,
+                                                          min_value=1, max_value=64)
+        cls.ACESTREAM_STREAMING_WORKER_PORT = cls._parse_int("ACESTREAM_STREAMING_WORKER_PORT", default=0,
+                                                              min_value=0, max_value=65535)
+        cls.ACESTREAM_STARTUP_STATS_INTERVAL = cls._parse_int("ACESTREAM_STARTUP_STATS_INTERVAL", default=300,
+                                                               min_value=10, max_value=86400)
         
         # Scraper Configuration
         cls.SCRAPER_URLS = cls._parse_list("SCRAPER_URLS", allow_empty=True)
@@ -278,6 +360,16 @@ class Config:
                                                   min_value=3600, max_value=604800)
         cls.EPG_CACHE_FILE = cls._get_env("EPG_CACHE_FILE")
         
+        # Channel Check Configuration
+        cls.CHANNEL_CHECK_INTERVAL = cls._parse_int("CHANNEL_CHECK_INTERVAL", default=3600,
+                                                     min_value=0, max_value=604800)
+        cls.CHANNEL_CHECK_CONCURRENCY = cls._parse_int("CHANNEL_CHECK_CONCURRENCY", default=16,
+                                                        min_value=1, max_value=256)
+        cls.CHANNEL_CHECK_PER_HOST = cls._parse_int("CHANNEL_CHECK_PER_HOST", default=4,
+                                                     min_value=1, max_value=64)
+        cls.CHANNEL_CHECK_TIMEOUT = cls._parse_int("CHANNEL_CHECK_TIMEOUT", default=20,
+                                                    min_value=1, max_value=300)
+        
         # Database Configuration
         cls.DATABASE_URL = cls._get_env("DATABASE_URL")
         cls.DATABASE_ECHO = cls._parse_bool("DATABASE_ECHO")
@@ -353,6 +445,31 @@ class Config:
         if cls.ACESTREAM_ENGINE_PORT == cls.ACESTREAM_STREAMING_PORT:
             validations.append("ACESTREAM_ENGINE_PORT and ACESTREAM_STREAMING_PORT cannot be the same")
         
+        if 0 < cls.ACESTREAM_BUFFER_BUDGET < 262144 * max(1, cls.ACESTREAM_STREAMING_WORKERS):
+            validations.append("ACESTREAM_BUFFER_BUDGET must leave at least 256 KiB per streaming worker")
+        
+        if cls.ACESTREAM_SLOW_CLIENT_POLICY not in ('skip', 'disconnect'):
+            validations.append("ACESTREAM_SLOW_CLIENT_POLICY must be 'skip' or 'disconnect'")
+        if cls.ACESTREAM_PREWARM_STRATEGY not in ('neighbors', 'popular', 'mixed'):
+            validations.append("ACESTREAM_PREWARM_STRATEGY must be 'neighbors', 'popular' or 'mixed'")
+        
+        # Own ports of the streaming workers must not collide with the other ports
+        if cls.ACESTREAM_STREAMING_WORKERS > 1:
+            first_port = cls.ACESTREAM_STREAMING_WORKER_PORT or cls.ACESTREAM_STREAMING_PORT + 1
+            worker_ports = range(first_port, first_port + cls.ACESTREAM_STREAMING_WORKERS)
+            if worker_ports[-1] > 65535:
+                validations.append("ACESTREAM_STREAMING_WORKER_PORT range exceeds 65535")
+            for name in ('SERVER_PORT', 'ACESTREAM_ENGINE_PORT', 'ACESTREAM_STREAMING_PORT'):
+                if getattr(cls, name) in worker_ports:
+                    validations.append(f"Streaming worker ports {worker_ports[0]}-{worker_ports[-1]} "
+                                       f"include {name}")
+        
+        # Engine pool entries must be host:port
+        for engine in cls.ACESTREAM_ENGINES:
+            host, _, port = engine.rpartition(':')
+            if not host or not port.isdigit() or not 1 <= int(port) <= 65535:
+                validations.append(f"Invalid ACESTREAM_ENGINES entry: {engine} (must be host:port)")
+        
         # URL validation for scraper and EPG
         for url in cls.SCRAPER_URLS:
             if not url.startswith(('http://', 'https://')):
@@ -416,6 +533,16 @@ class ConfigAccessor:
     def get_epg_sources_list(self) -> List[str]:
         """Get EPG sources list"""
         return Config.EPG_SOURCES
+    
+    def get_acestream_engines_list(self) -> List[tuple]:
+        """Get AceStream engine pool as (host, port) tuples, defaulting to the main engine"""
+        if not Config.ACESTREAM_ENGINES:
+            return [(Config.ACESTREAM_ENGINE_HOST, Config.ACESTREAM_ENGINE_PORT)]
+        engines = []
+        for engine in Config.ACESTREAM_ENGINES:
+            host, _, port = engine.rpartition(':')
+            engines.append((host, int(port)))
+        return engines
 
 
 # Global config instance for easy access
@@ -118,6 +118,12 @@ class Channel(Base):
     last_checked: Mapped[Optional[datetime]] = mapped_column(DateTime)
     last_error: Mapped[Optional[str]] = mapped_column(Text)
     
+    # Stream start time (seconds to first data, rolling over recent starts)
+    startup_p50: Mapped[Optional[float]] = mapped_column(Float)
+    startup_p95: Mapped[Optional[float]] = mapped_column(Float)
+    startup_samples: Mapped[Optional[int]] = mapped_column(Integer)
+    startup_failures: Mapped[Optional[int]] = mapped_column(Integer)
+    
     # Source info
     source_url_id: Mapped[Optional[int]] = mapped_column(ForeignKey("scraper_urls.id"))
     
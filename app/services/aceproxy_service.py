@@ -12,6 +12,11 @@ from datetime import datetime
 import aiohttp
 from aiohttp import web, ClientSession
 
+from app.services.buffer_budget import BufferBudget, BufferBudgetExceeded
+from app.services.engine_pool import EnginePool, check_engine_health
+from app.services.idle_tracker import IdleTracker
+from app.services.stream_info_cache import StreamInfoCache
+
 logger = logging.getLogger(__name__)
 
 
@@ -38,7 +43,7 @@ class OngoingStream:
         self.first_chunk = asyncio.Event()
         self.fetch_task: Optional[asyncio.Task] = None
         self.created_at = datetime.utcnow()
-        self.client_last_active: Dict[str, float] = {}  # Track client activity
+        self.skips = 0  # Lagging clients whose queued chunks were dropped
         
 
 class AceProxyService:
@@ -48,9 +53,12 @@ class AceProxyService:
         self,
         acestream_host: str = "localhost",
         acestream_port: int = 6878,
-        buffer_size: int = 5 * 1024 * 1024,
+        buffer_size: int = 50 * 32768,  # Queue per client, in bytes (50 chunks)
         timeout: int = 15,
         chunk_size: int = 32768,  # 32KB chunks (vs 8KB) - fewer operations
+        engine_pool: Optional[EnginePool] = None,
+        buffer_budget: Optional[BufferBudget] = None,
+        stream_info_cache: Optional[StreamInfoCache] = None,
     ):
         self.acestream_host = acestream_host
         self.acestream_port = acestream_port
@@ -58,18 +66,24 @@ class AceProxyService:
         self.timeout = timeout
         self.chunk_size = chunk_size
         self.base_url = f"http://{acestream_host}:{acestream_port}"
+        self.engine_pool = engine_pool
+        self.buffer_budget = buffer_budget  # Shared with the streaming server when in-process
+        self.stream_info_cache = stream_info_cache or StreamInfoCache()  # Likewise
         
         self.streams: Dict[str, OngoingStream] = {}
         self.streams_lock = asyncio.Lock()
         self.session: Optional[ClientSession] = None
+        self.idle_tracker = IdleTracker(30.0)  # Clients that stop reading their queue
         
     async def start(self):
         """Start the proxy service"""
         self.session = ClientSession()
+        self.idle_tracker.start()
         logger.info(f"AceProxy service started - connecting to {self.base_url}")
         
     async def stop(self):
         """Stop the proxy service"""
+        await self.idle_tracker.stop()
         if self.session:
             await self.session.close()
         
@@ -82,52 +96,27 @@ class AceProxyService:
     
     async def check_engine_health(self) -> dict:
         """Check AceStream engine health status"""
-        try:
-            url = f"{self.base_url}/webui/api/service?method=get_version"
-            timeout = aiohttp.ClientTimeout(total=5)
-            
-            async with self.session.get(url, timeout=timeout) as response:
-                if response.status != 200:
-                    return {
-                        "status": "error",
-                        "available": False,
-                        "message": f"HTTP {response.status}"
-                    }
-                
-                data = await response.json()
-                
-                # Check if error is null (successful response)
-                if data.get("error") is None:
-                    return {
-                        "status": "healthy",
-                        "available": True,
-                        "version": data.get("result", {}).get("version", "unknown"),
-                        "platform": data.get("result", {}).get("platform", "unknown")
-                    }
-                else:
-                    return {
-                        "status": "error",
-                        "available": False,
-                        "message": data.get("error", "Unknown error")
-                    }
-        except asyncio.TimeoutError:
-            return {
-                "status": "timeout",
-                "available": False,
-                "message": "Connection timeout"
-            }
-        except Exception as e:
-            return {
-                "status": "error",
-                "available": False,
-                "message": str(e)
-            }
+        return await check_engine_health(self.session, self.base_url)
+    
+    async def check_engines_health(self) -> list:
+        """Health and load of every engine in the pool"""
+        if not self.engine_pool:
+            return [dict(await self.check_engine_health(), engine=f"{self.acestream_host}:{self.acestream_port}")]
+        return self.engine_pool.snapshot()
     
     async def _fetch_stream_info(self, stream_id: str) -> AceStreamInfo:
-        """Fetch stream information from AceStream engine"""
+        """
+        Fetch stream information from AceStream engine
+        
+        Raises:
+            StreamUnavailable: If the engine failed to start this stream moments ago
+        """
+        self.stream_info_cache.check(stream_id)
         temp_pid = str(uuid.uuid4())
         
-        url = f"{self.base_url}/ace/getstream"
+        # Ask the engine that serves (or would serve) this stream
+        base_url = self.engine_pool.select(stream_id).base_url if self.engine_pool else self.base_url
+        url = f"{base_url}/ace/getstream"
         params = {
             'id': stream_id,
             'format': 'json',
@@ -161,9 +150,11 @@ class AceProxyService:
                     stream_id=stream_id
                 )
         except asyncio.TimeoutError:
+            self.stream_info_cache.record_failure(stream_id, "Timeout fetching stream info")
             raise Exception(f"Timeout fetching stream info for {stream_id}")
         except Exception as e:
             logger.error(f"Error fetching stream info: {e}")
+            self.stream_info_cache.record_failure(stream_id, str(e))
             raise
     
     async def _close_stream(self, ongoing: OngoingStream):
@@ -206,19 +197,14 @@ class AceProxyService:
                 
                 # Read chunks and distribute to ALL clients (like pyacexy _start_acestream_fetch)
                 chunk_count = 0
-                last_cleanup = asyncio.get_event_loop().time()
                 
                 async for chunk in ace_response.content.iter_chunked(self.chunk_size):
                     if ongoing.done.is_set():
                         break
                     
                     chunk_count += 1
-                    current_time = asyncio.get_event_loop().time()
-                    
-                    # Periodically cleanup stale clients (every 15 seconds, like pyacexy)
-                    if current_time - last_cleanup > 15:
-                        last_cleanup = current_time
-                        await self._cleanup_stale_clients(ongoing, current_time)
+                    if chunk_count == 1:
+                        self.stream_info_cache.record_success(ongoing.stream_id)
                     
                     # Get snapshot of clients (quick, inside lock)
                     async with ongoing.lock:
@@ -231,7 +217,7 @@ class AceProxyService:
                     for client_id, client_queue in clients_snapshot:
                         # Create task for each client (non-blocking distribution)
                         task = asyncio.create_task(
-                            self._send_to_client(chunk, client_id, client_queue, current_time, ongoing, chunk_count)
+                            self._send_to_client(chunk, client_id, client_queue, ongoing, chunk_count)
                         )
                         tasks.append((client_id, task))
                     
@@ -252,7 +238,6 @@ class AceProxyService:
                         if dead_clients:
                             for client_id in dead_clients:
                                 ongoing.clients.pop(client_id, None)
-                                ongoing.client_last_active.pop(client_id, None)
                             logger.info(f"Removed {len(dead_clients)} dead clients from {ongoing.stream_id}")
                         
                         # If no clients left, stop
@@ -271,28 +256,11 @@ class AceProxyService:
             ongoing.done.set()
             logger.info(f"Stream {ongoing.stream_id} fetch completed")
     
-    async def _cleanup_stale_clients(self, ongoing: OngoingStream, current_time: float):
-        """Remove clients that haven't been active (like pyacexy stale cleanup)"""
-        stale_clients = []
-        
-        for client_id, last_active in ongoing.client_last_active.items():
-            # If client hasn't been active in 30 seconds, consider it stale
-            if current_time - last_active > 30:
-                logger.warning(f"Client {client_id} inactive for {current_time - last_active:.0f}s, removing")
-                stale_clients.append(client_id)
-        
-        if stale_clients:
-            for client_id in stale_clients:
-                ongoing.clients.pop(client_id, None)
-                ongoing.client_last_active.pop(client_id, None)
-            logger.info(f"Removed {len(stale_clients)} stale clients from {ongoing.stream_id}")
-    
     async def _send_to_client(
         self, 
         chunk: bytes, 
         client_id: str, 
         client_queue: asyncio.Queue,
-        current_time: float,
         ongoing: OngoingStream,
         chunk_count: int
     ) -> bool:
@@ -301,19 +269,19 @@ class AceProxyService:
             # Try non-blocking first
             try:
                 client_queue.put_nowait(chunk)
-                ongoing.client_last_active[client_id] = current_time
                 if chunk_count == 1:
                     ongoing.first_chunk.set()
                 return True
             except asyncio.QueueFull:
-                # Queue full - wait with timeout
-                try:
-                    await asyncio.wait_for(client_queue.put(chunk), timeout=0.1)
-                    ongoing.client_last_active[client_id] = current_time
-                    return True
-                except asyncio.TimeoutError:
-                    # Client too slow
-                    return False
+                # A whole queue behind: skip to the newest chunk instead of dropping the client
+                skipped = 0
+                while not client_queue.empty():
+                    client_queue.get_nowait()
+                    skipped += 1
+                client_queue.put_nowait(chunk)
+                ongoing.skips += 1
+                logger.info(f"Client {client_id} too slow for {ongoing.stream_id}, skipped {skipped} chunks")
+                return True
         except Exception as e:
             logger.debug(f"Error sending to client {client_id}: {e}")
             return False
@@ -388,6 +356,7 @@ class AceProxyService:
             'stream_id': stream_id,
             'clients': len(ongoing.clients),
             'total_queue_size': sum(q.qsize() for q in ongoing.clients.values()),
+            'skips': ongoing.skips,
             'created_at': ongoing.created_at.isoformat(),
             'acestream_stats': ace_stats
         }
@@ -407,13 +376,27 @@ class AceProxyService:
         return result
     
     async def check_stream_available(self, stream_id: str) -> bool:
-        """Check if a stream is available"""
-        try:
-            await self._fetch_stream_info(stream_id)
+        """
+        Check if a stream is available
+        
+        Streams playing or started recently are available without asking the
+        engine, streams that failed recently are not. Otherwise the stream is
+        started on the engine and stopped again.
+        """
+        if stream_id in self.streams or self.stream_info_cache.started_recently(stream_id):
             return True
+        try:
+            acestream_info = await self._fetch_stream_info(stream_id)
         except Exception as e:
             logger.debug(f"Stream {stream_id} not available: {e}")
             return False
+        try:
+            async with self.session.get(f"{acestream_info.command_url}?method=stop") as response:
+                await response.read()
+        except Exception as e:
+            logger.debug(f"Error stopping availability check of {stream_id}: {e}")
+        self.stream_info_cache.record_success(stream_id)
+        return True
     
     async def stream_content(self, stream_id: str):
         """Stream content from AceStream (generator for FastAPI StreamingResponse)"""
@@ -446,30 +429,45 @@ class AceProxyService:
             # Wait for stream to start
             await asyncio.wait_for(ongoing.started.wait(), timeout=self.timeout)
         
-        # Create client queue (each client has its own queue)
-        # With 32KB chunks, 50 elements = ~1.6MB buffer (same as before with 100x8KB)
+        # Create client queue (each client has its own queue), out of the buffer budget
+        # when there is one: shrunk down to 4 chunks when it runs low
+        allocation = None
+        queue_bytes = self.buffer_size
+        if self.buffer_budget:
+            allocation = self.buffer_budget.reserve(stream_id, self.buffer_size, 4 * self.chunk_size)
+            if allocation is None:
+                self.buffer_budget.rejected += 1
+                if not ongoing.clients:
+                    asyncio.create_task(self._cleanup_stream(stream_id, ongoing))
+                raise BufferBudgetExceeded(f"Buffer memory budget of {self.buffer_budget.limit} bytes exhausted")
+            queue_bytes = allocation.size
         client_id = str(uuid.uuid4())
-        client_queue = asyncio.Queue(maxsize=50)
+        client_queue = asyncio.Queue(maxsize=max(1, queue_bytes // self.chunk_size))
+        chunk_count = 0
+        
+        def progress():
+            # Chunks consumed, or None when there is nothing to consume
+            return None if client_queue.empty() else chunk_count
+        
+        def idle():
+            if ongoing.clients.pop(client_id, None) is not None:
+                logger.warning(f"Client {client_id} inactive for {self.idle_tracker.timeout:.0f}s, removing")
         
         async with ongoing.lock:
             ongoing.clients[client_id] = client_queue
-            ongoing.client_last_active[client_id] = asyncio.get_event_loop().time()
             client_count = len(ongoing.clients)
+        idle_entry = self.idle_tracker.track(progress, idle)
         
         logger.info(f"Client {client_id} streaming {stream_id} ({client_count} clients)")
         
         try:
             # Stream chunks from client's own queue
-            chunk_count = 0
-            while not ongoing.done.is_set():
+            while not ongoing.done.is_set() and client_id in ongoing.clients:
                 try:
                     # Get chunk from this client's queue (blocking with timeout)
                     chunk = await asyncio.wait_for(client_queue.get(), timeout=2.0)
                     yield chunk
                     chunk_count += 1
-                    # Update activity periodically (every 50 chunks to reduce overhead)
-                    if chunk_count % 50 == 0:
-                        ongoing.client_last_active[client_id] = asyncio.get_event_loop().time()
                 except asyncio.TimeoutError:
                     # Check if stream is still active
                     if ongoing.done.is_set():
@@ -480,9 +478,11 @@ class AceProxyService:
                     break
         finally:
             # Remove client
+            self.idle_tracker.untrack(idle_entry)
+            if self.buffer_budget:
+                self.buffer_budget.release(allocation)
             async with ongoing.lock:
                 ongoing.clients.pop(client_id, None)
-                ongoing.client_last_active.pop(client_id, None)
                 remaining = len(ongoing.clients)
             
             logger.info(f"Client {client_id} disconnected from {stream_id} ({remaining} clients remaining)")
@@ -1,19 +1,42 @@
 """
 AceStream Streaming Server using aiohttp with pyacexy native pattern
-This server runs on a separate port and handles streaming with direct write (no queues)
+This server runs on a separate port and handles streaming with a shared buffer:
+the upstream reader publishes chunks once, each client is drained by its own writer
 """
 import asyncio
+import hashlib
+import itertools
 import logging
+import time
 import uuid
 from datetime import datetime
-from typing import Optional, Dict, Set, NamedTuple
+from typing import AsyncIterator, Optional, Dict, List, Set, NamedTuple
 from urllib.parse import urlencode
 
 import aiohttp
 from aiohttp import web, ClientSession
 
+from app.services.buffer_budget import BufferAllocation, BufferBudget, BufferBudgetExceeded
+from app.services.engine_hls import EngineHLSProxy
+from app.services.engine_pool import AceEngine, EnginePool
+from app.services.hls import PLAYLIST_CONTENT_TYPE, HLSPackager, HLSUnavailable
+from app.services.idle_tracker import IdleTracker
+from app.services.metrics import PROMETHEUS_CONTENT_TYPE, StreamingMetrics, render_prometheus
+from app.services.mpegts import TS_PACKET_SIZE, TS_SYNC_BYTE, TSInspector
+from app.services.performance import tune_client_socket, upstream_connector
+from app.services.ring_buffer import RingBuffer
+from app.services.slow_clients import SlowClientPolicy
+from app.services.startup_stats import StartupStats
+from app.services.stream_info_cache import StreamInfoCache, StreamUnavailable
+
 logger = logging.getLogger(__name__)
 
+# Time one client write in this many for the write latency histogram
+WRITE_LATENCY_SAMPLING = 16
+
+# Smallest ring buffer a stream is shrunk to when the buffer budget runs low
+MIN_BUFFER_SIZE = 256 * 1024
+
 
 class ClientInfo(NamedTuple):
     """Client connection information"""
@@ -21,11 +44,11 @@ class ClientInfo(NamedTuple):
     user_agent: str
     username: str
     connected_at: datetime
-    response: web.StreamResponse
+    response: Optional[web.StreamResponse]  # None for in-process consumers
 
 
 class AceStreamInfo:
-    """AceStream session information"""
+    """AceStream session information (direct HTTP sources only have a playback_url)"""
     
     def __init__(self, playback_url: str, stat_url: str, command_url: str, stream_id: str):
         self.playback_url = playback_url
@@ -34,28 +57,203 @@ class AceStreamInfo:
         self.stream_id = stream_id
 
 
+def worker_for(key: str, workers: int) -> int:
+    """
+    Index of the streaming worker that owns a stream (rendezvous hashing)
+    
+    Stable across processes, and adding a worker only moves the streams it wins.
+    """
+    if workers <= 1:
+        return 0
+    return max(range(workers), key=lambda index: hashlib.md5(f"{index}:{key}".encode()).digest())
+
+
+def _looks_like_ts(data: bytes) -> bool:
+    """Whether data starts like an MPEG-TS packet sequence"""
+    if not data or data[0] != TS_SYNC_BYTE:
+        return False
+    return len(data) <= TS_PACKET_SIZE or data[TS_PACKET_SIZE] == TS_SYNC_BYTE
+
+
 class OngoingStream:
-    """Represents an ongoing stream with multiple clients (pyacexy pattern)"""
+    """
+    Represents an ongoing stream with multiple clients (pyacexy pattern)
     
-    def __init__(self, stream_id: str, acestream: AceStreamInfo):
+    The source is either an AceStream id served by an engine ("acestream") or a
+    plain HTTP stream URL ("http"), one upstream connection each. The upstream reader publishes every chunk once into a preallocated ring buffer.
+    Each client is drained by its own writer (its request handler) and is tracked
+    only by an integer byte cursor into the ring, so memory per stream is fixed
+    and a slow client only delays itself. Upstream data goes through a TS
+    inspector first, so the ring only ever holds whole 188-byte packets, keyframe
+    offsets are known for late joiners and PAT/PMT are cached for them. HTTP
+    sources that turn out not to be MPEG-TS are relayed unchanged.
+    """
+    
+    def __init__(self, stream_id: str, acestream: AceStreamInfo, buffer_size: int = 4 * 1024 * 1024,
+                 engine: Optional[AceEngine] = None, extra_params: Optional[dict] = None,
+                 source: str = "acestream", coalesce_delay: float = 0.0, coalesce_max: int = 65536):
         self.stream_id = stream_id
         self.acestream = acestream
+        self.source = source
+        self.engine = engine  # Engine the stream is pinned to
+        self.extra_params = extra_params or {}  # Kept to request the stream again on reconnect
         self.clients: Dict[int, ClientInfo] = {}  # Map response ID to ClientInfo
         self.lock = asyncio.Lock()
         self.done = asyncio.Event()
         self.started = asyncio.Event()
         self.first_chunk = asyncio.Event()
         self.fetch_task: Optional[asyncio.Task] = None
-        self.client_last_write: Dict[int, float] = {}  # Track last successful write per client
+        self.client_writers: Dict[int, asyncio.Task] = {}  # Writer task per client
+        self.client_cursors: Dict[int, int] = {}  # Absolute ring offset per client
         self.created_at = datetime.now()  # Track when stream was created
+        
+        self.buffer = RingBuffer(buffer_size)
+        self.allocation: Optional[BufferAllocation] = None  # Share of the buffer budget
+        self._data_event = asyncio.Event()
+        self._data_waiting = False
+        
+        # Write coalescing: idle writers are woken once coalesce_bytes are pending
+        # (about coalesce_delay of stream) or coalesce_delay after the first of them
+        self.coalesce_delay = coalesce_delay
+        self.coalesce_max = coalesce_max
+        self.coalesce_bytes = TS_PACKET_SIZE * 7
+        self._pending_bytes = 0
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+        
+        self.inspector = TSInspector()
+        self.passthrough = False  # Not MPEG-TS: published without inspection
+        self.publish_started: Optional[float] = None  # Monotonic time of first publish
+        
+        # Linger: upstream kept alive for a while after the last client leaves
+        self.linger_handle: Optional[asyncio.TimerHandle] = None
+        self.linger_saves = 0  # Joins that found the stream lingering
+        
+        # Pre-warming: kept attached upstream without clients while warm (see set_warm)
+        self.warm = False
+        self.prewarmed = False  # Started by the pre-warmer rather than by a viewer
+        self.warm_joins = 0  # Joins that found the stream warm and without viewers
+        
+        # HLS rendition, cut from the published data while HLS viewers poll it
+        self.hls: Optional[HLSPackager] = None
+        self.hls_handle: Optional[asyncio.TimerHandle] = None
+        
+        # Upstream reconnects done while clients stayed attached
+        self.reconnects = 0
+        self.last_reconnect: Optional[datetime] = None
+        
+        # Lagging clients moved forward to a keyframe instead of being disconnected
+        self.skips = 0
+        
+        # Start latency: seconds per phase until the first chunk (see startup_stats)
+        self.start_requested = time.monotonic()
+        self.startup: Dict[str, float] = {}
+    
+    def publish(self, chunk: bytes):
+        """Align a chunk on TS packets, copy it into the ring buffer and wake up idle writers"""
+        if self.publish_started is None:
+            self.publish_started = time.monotonic()
+            if self.source != "acestream" and not _looks_like_ts(chunk):
+                logger.info(f"Stream {self.stream_id} is not MPEG-TS, relaying it unchanged")
+                self.passthrough = True
+        packets = chunk if self.passthrough else self.inspector.feed(chunk)
+        if packets:
+            if self.hls is not None and not self.passthrough:
+                self.hls.feed(packets, self.buffer.head)
+            self.buffer.write(packets)
+            if not self._data_waiting:
+                return  # Every writer is busy, they pick the data up on their next read
+            self._pending_bytes += len(packets)
+            if self.coalesce_delay <= 0 or self._pending_bytes >= self.coalesce_bytes:
+                self.wake_writers()
+            elif self._wake_handle is None:
+                self._wake_handle = asyncio.get_event_loop().call_later(self.coalesce_delay, self.wake_writers)
+    
+    @property
+    def watched(self) -> bool:
+        """Whether clients are attached or HLS viewers are polling"""
+        return bool(self.clients) or self.hls is not None
+    
+    def byte_rate(self) -> float:
+        """Stream byte rate: measured from PCR when available, else average since the first chunk"""
+        if self.inspector.bitrate:
+            return self.inspector.bitrate / 8
+        if self.publish_started is None:
+            return 0.0
+        elapsed = time.monotonic() - self.publish_started
+        return self.buffer.head / elapsed if elapsed > 0 else 0.0
+    
+    def join_offset(self, backlog_bytes: int) -> int:
+        """
+        Cursor for a new client: the most recent random access point inside the
+        backlog window, or the live edge if there is none
+        """
+        buffer = self.buffer
+        random_access_points = self.inspector.random_access_points
+        if backlog_bytes > 0 and random_access_points:
+            oldest_allowed = max(buffer.tail, buffer.head - backlog_bytes)
+            latest = random_access_points[-1]
+            if oldest_allowed <= latest < buffer.head:
+                return latest
+        return buffer.head
+    
+    def wake_writers(self):
+        """Wake up all writers waiting for new data (or for the end of the stream)"""
+        if self._wake_handle:
+            self._wake_handle.cancel()
+            self._wake_handle = None
+        self._pending_bytes = 0
+        if self._data_waiting:
+            self._data_waiting = False
+            self._data_event.set()
+            self._data_event = asyncio.Event()
+            if self.coalesce_delay > 0:
+                # Adapt the batch to the bitrate: coalesce_delay worth of stream per write
+                self.coalesce_bytes = min(self.coalesce_max,
+                                          max(TS_PACKET_SIZE * 7, int(self.byte_rate() * self.coalesce_delay)))
+    
+    async def wait_for_data(self, cursor: int):
+        """Wait until there is data after cursor or the stream ends"""
+        while cursor >= self.buffer.head and not self.done.is_set():
+            self._data_waiting = True
+            await self._data_event.wait()
+    
+    def buffer_stats(self) -> dict:
+        """Ring buffer occupancy and client cursor lag (bytes)"""
+        buffer = self.buffer
+        lags = [buffer.lag(cursor) for cursor in self.client_cursors.values()]
+        return {
+            'capacity': buffer.capacity,
+            'used': buffer.used,
+            'occupancy': round(buffer.used / buffer.capacity, 3),
+            'bytes_published': buffer.head,
+            'max_client_lag': max(lags) if lags else 0,
+            'avg_client_lag': int(sum(lags) / len(lags)) if lags else 0,
+        }
+    
+    def ts_stats(self) -> dict:
+        """Transport stream information gathered by the inspector"""
+        inspector = self.inspector
+        return {
+            'bitrate': int(inspector.bitrate) if inspector.bitrate else int(self.byte_rate() * 8),
+            'bitrate_source': 'pcr' if inspector.bitrate else 'average',
+            'pcr_pid': inspector.pcr_pid,
+            'passthrough': self.passthrough,
+            'has_psi': inspector.pat_packet is not None,
+            'dropped_bytes': inspector.dropped_bytes,
+        }
 
 
 class AiohttpStreamingServer:
     """
     AceStream HTTP Streaming Server using aiohttp
-    Native pyacexy pattern: direct write to StreamResponse (no queues, no tasks)
+    One upstream reader per stream publishes into a ring buffer, every client
+    request handler drains it into its own StreamResponse (no queues)
     """
     
+    # In-process consumers may attach with open_stream()/iter_client(): they run on
+    # the same event loop (see StreamingServerThread for the isolated variant)
+    attachable = True
+    
     def __init__(
         self,
         acestream_host: str = "localhost",
@@ -66,6 +264,29 @@ class AiohttpStreamingServer:
         chunk_size: int = 8192,  # 8KB like pyacexy
         empty_timeout: float = 60.0,
         no_response_timeout: float = 10.0,
+        buffer_size: int = 4 * 1024 * 1024,
+        max_write_size: int = 65536,
+        backlog_seconds: float = 2.0,
+        backlog_bytes: int = 0,
+        linger_seconds: float = 10.0,
+        engine_pool: Optional[EnginePool] = None,
+        reconnect_attempts: int = 3,
+        reconnect_delay: float = 1.0,
+        stale_timeout: float = 30.0,
+        slow_client_policy: str = "skip",
+        skip_lag_seconds: float = 10.0,
+        buffer_budget: int = 0,
+        write_coalesce_delay: float = 0.03,
+        performance_profile: bool = False,
+        socket_send_buffer: int = 0,
+        upstream_limit_per_host: int = 0,
+        info_failure_ttl: float = 30.0,
+        info_failure_max_ttl: float = 300.0,
+        hls_segment_seconds: float = 4.0,
+        hls_window: int = 6,
+        hls_proxy_cache_bytes: int = 64 * 1024 * 1024,
+        worker_index: int = 0,
+        worker_ports: Optional[List[int]] = None,
     ):
         self.acestream_host = acestream_host
         self.acestream_port = acestream_port
@@ -75,20 +296,65 @@ class AiohttpStreamingServer:
         self.chunk_size = chunk_size
         self.empty_timeout = empty_timeout
         self.no_response_timeout = no_response_timeout
+        self.buffer_size = buffer_size
+        self.max_write_size = max_write_size
+        self.backlog_seconds = backlog_seconds
+        self.backlog_bytes = backlog_bytes
+        self.linger_seconds = linger_seconds
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.slow_clients = SlowClientPolicy(slow_client_policy, skip_lag_seconds)
+        # Memory of all ring buffers of this process (0: unlimited)
+        self.buffer_budget = BufferBudget(buffer_budget)
+        # Idle writers wait up to this long for more data, so each write carries more (0: write every chunk)
+        self.write_coalesce_delay = write_coalesce_delay
+        # Performance profile: tuned viewer sockets and upstream connector (uvloop is chosen by the runner)
+        self.performance_profile = performance_profile
+        self.socket_send_buffer = socket_send_buffer
+        self.upstream_limit_per_host = upstream_limit_per_host
+        # Keys whose engine start failed recently are refused without asking the engine again
+        self.stream_info_cache = StreamInfoCache(info_failure_ttl, info_failure_max_ttl)
+        # HLS output: segment length and playlist window; the rendition is dropped
+        # when its playlist has not been requested for hls_idle_timeout
+        self.hls_segment_seconds = hls_segment_seconds
+        self.hls_window = hls_window
+        self.hls_idle_timeout = max(20.0, hls_window * hls_segment_seconds)
+        # Shared pool from the application, or a private one for the single configured engine
+        self._owns_engine_pool = engine_pool is None
+        self.engine_pool = engine_pool or EnginePool([(acestream_host, acestream_port)], scheme=scheme)
         self.endpoint = "/ace/getstream"
         
+        # Multi-worker mode: listen_port is shared (SO_REUSEPORT) by all workers, each
+        # stream is owned by one worker, reachable on its own port in worker_ports
+        self.worker_index = worker_index
+        self.worker_ports = worker_ports or []
+        self.peer_host = "127.0.0.1" if listen_host in ("", "0.0.0.0", "::") else listen_host
+        self.private_site: Optional[web.TCPSite] = None
+        
         self.streams: Dict[str, OngoingStream] = {}
         self.streams_lock = asyncio.Lock()
+        self._pending: Dict[str, asyncio.Future] = {}  # Single-flight stream creation per key
         self.session: Optional[ClientSession] = None
         self.app: Optional[web.Application] = None
         self.runner: Optional[web.AppRunner] = None
         self.site: Optional[web.TCPSite] = None
+        self.linger_saves = 0  # Joins served by a lingering upstream (all streams)
+        self.startup_stats = StartupStats()
+        self.metrics = StreamingMetrics()
+        # Engine HLS output (/ace/manifest.m3u8): one engine session per stream, segments cached
+        self.hls_proxy = EngineHLSProxy(self.engine_pool, self.stream_info_cache, self.metrics,
+                                        hls_proxy_cache_bytes, self.hls_idle_timeout, no_response_timeout)
+        self.loop_lag_interval = 0.5
+        self._loop_lag_task: Optional[asyncio.Task] = None
+        # Clients without a completed write for stale_timeout are removed (one wheel for all streams)
+        self.idle_tracker = IdleTracker(stale_timeout)
+        self._client_ids = itertools.count(1)
     
-    async def _fetch_stream_info(self, stream_id: str, extra_params: dict) -> AceStreamInfo:
+    async def _fetch_stream_info(self, stream_id: str, extra_params: dict, engine: AceEngine) -> AceStreamInfo:
         """Fetch stream information from AceStream engine"""
         temp_pid = str(uuid.uuid4())
         
-        url = f"{self.scheme}://{self.acestream_host}:{self.acestream_port}{self.endpoint}"
+        url = f"{engine.base_url}{self.endpoint}"
         
         params = extra_params.copy()
         params['format'] = 'json'
@@ -121,8 +387,129 @@ class AiohttpStreamingServer:
                 stream_id=stream_id
             )
     
+    async def _get_or_create_stream(self, key: str, extra_params: dict) -> OngoingStream:
+        """
+        Get the ongoing stream for key, creating it if needed (single-flight)
+        
+        streams_lock is only held for dictionary lookups, never across engine I/O.
+        Concurrent requests for the same key share one _fetch_stream_info call,
+        requests for different keys proceed in parallel.
+        """
+        async with self.streams_lock:
+            ongoing = self.streams.get(key)
+            if ongoing is not None and not ongoing.done.is_set():
+                logger.info(f"Reusing existing stream for {key}")
+                return ongoing
+            
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                error = self.stream_info_cache.failure(key)
+                if error is not None:
+                    self.metrics.starts_refused += 1
+                    raise error
+                pending = asyncio.get_event_loop().create_future()
+                self._pending[key] = pending
+        
+        if not owner:
+            logger.info(f"Waiting for stream {key} being created by another request")
+            # Shield so a cancelled waiter does not cancel the shared future
+            return await asyncio.shield(pending)
+        
+        try:
+            allocation = await self._allocate_buffer(key)
+        except BufferBudgetExceeded as e:
+            self._pending.pop(key, None)
+            pending.set_exception(e)
+            pending.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        
+        # Reserve the engine right away so parallel starts see its load
+        engine = self.engine_pool.place(key)
+        logger.info(f"Creating new stream for {key} on engine {engine.key}")
+        requested = time.monotonic()
+        try:
+            acestream = await self._fetch_stream_info(key, extra_params, engine)
+            ongoing = OngoingStream(key, acestream, allocation.size, engine, extra_params,
+                                    coalesce_delay=self.write_coalesce_delay, coalesce_max=self.max_write_size)
+            ongoing.allocation = allocation
+            ongoing.start_requested = requested
+            ongoing.startup['info'] = time.monotonic() - requested
+            self.engine_pool.attach(key, engine, acestream.stat_url)
+            async with self.streams_lock:
+                self.streams[key] = ongoing
+            pending.set_result(ongoing)
+            return ongoing
+        except asyncio.CancelledError:
+            self.buffer_budget.release(allocation)
+            self.engine_pool.detach(key, engine)
+            pending.cancel()
+            raise
+        except Exception as e:
+            self.buffer_budget.release(allocation)
+            self.engine_pool.detach(key, engine)
+            self.engine_pool.report_failure(engine)
+            self.metrics.engine_errors += 1
+            self.startup_stats.record_failure(key, "acestream", str(e))
+            self.stream_info_cache.record_failure(key, str(e))
+            pending.set_exception(e)
+            pending.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            self._pending.pop(key, None)
+    
+    async def _allocate_buffer(self, key: str) -> BufferAllocation:
+        """
+        Reserve the ring buffer of a new stream in the buffer budget
+        
+        Lingering streams (no viewers) are stopped to make room first, then the
+        buffer is shrunk down to MIN_BUFFER_SIZE (shorter backlog).
+        
+        Raises:
+            BufferBudgetExceeded: If not even the smallest buffer fits
+        """
+        budget = self.buffer_budget
+        allocation = budget.reserve(key, self.buffer_size, self.buffer_size)
+        while allocation is None and await self._evict_lingering_stream():
+            allocation = budget.reserve(key, self.buffer_size, self.buffer_size)
+        if allocation is None:
+            allocation = budget.reserve(key, self.buffer_size, min(self.buffer_size, MIN_BUFFER_SIZE))
+        if allocation is None:
+            budget.rejected += 1
+            logger.error(f"Buffer budget of {budget.limit} bytes exhausted, rejecting stream {key}")
+            raise BufferBudgetExceeded(f"Buffer memory budget of {budget.limit} bytes exhausted")
+        return allocation
+    
+    async def _evict_lingering_stream(self) -> bool:
+        """
+        Stop the stream lingering the longest (else a pre-warmed stream without
+        viewers) and wait for its buffer to be released
+        """
+        async with self.streams_lock:
+            lingering = [s for s in self.streams.values() if s.linger_handle and not s.clients]
+            warm = [s for s in self.streams.values() if s.warm and not s.clients]
+        if lingering:
+            ongoing = min(lingering, key=lambda s: s.linger_handle.when())
+            logger.info(f"Stopping lingering stream {ongoing.stream_id} to free buffer memory")
+            ongoing.linger_handle.cancel()
+            ongoing.linger_handle = None
+        elif warm:
+            ongoing = min(warm, key=lambda s: s.created_at)
+            logger.info(f"Stopping pre-warmed stream {ongoing.stream_id} to free buffer memory")
+            ongoing.warm = False
+        else:
+            return False
+        self.buffer_budget.evicted += 1
+        task = ongoing.fetch_task
+        if task and not task.done():
+            task.cancel()
+            await asyncio.wait([task], timeout=self.no_response_timeout)
+        return True
+    
     async def _close_stream(self, acestream: AceStreamInfo):
         """Close stream on AceStream engine"""
+        if not acestream.command_url:
+            return  # Direct HTTP source, nothing to stop
         try:
             url = f"{acestream.command_url}?method=stop"
             logger.debug(f"Closing stream: {url}")
@@ -138,127 +525,753 @@ class AiohttpStreamingServer:
     
     async def _fetch_acestream(self, ongoing: OngoingStream):
         """
-        Fetch stream from AceStream and distribute to all clients
-        NATIVE PYACEXY PATTERN: Direct write to StreamResponse (no queues)
+        Fetch stream from AceStream and publish it into the shared buffer
+        The reader never writes to client sockets: each client has its own writer
+        
+        When the upstream fails while clients are attached, the stream is requested
+        again from the engine and reading resumes from the new playback URL. Clients
+        stay connected and keep draining the buffer meanwhile. Up to
+        reconnect_attempts reconnects are tried in a row; a session that delivers
+        data again restores the full budget.
         """
         logger.info(f"Starting AceStream fetch for {ongoing.stream_id}")
+        self.metrics.streams_started += 1
         
-        # sock_read timeout (like pyacexy)
-        timeout = aiohttp.ClientTimeout(sock_read=self.empty_timeout)
-        
+        attempts = 0
+        reason = "stopped"
         try:
-            logger.debug(f"Connecting to AceStream: {ongoing.acestream.playback_url}")
-            async with self.session.get(ongoing.acestream.playback_url, timeout=timeout) as ace_response:
-                logger.debug(f"AceStream response status: {ace_response.status}")
-                if ace_response.status != 200:
-                    logger.error(f"AceStream returned status {ace_response.status}")
-                    ongoing.started.set()
-                    return
+            while True:
+                published = ongoing.buffer.head
+                try:
+                    await self._read_upstream(ongoing)
+                    reason = "upstream ended"
+                except asyncio.TimeoutError:
+                    reason = f"no data for {self.empty_timeout}s"
+                    self.metrics.engine_errors += 1
+                    logger.info(f"Stream {ongoing.stream_id} timed out ({reason})")
+                except Exception as e:
+                    reason = str(e)
+                    self.metrics.engine_errors += 1
+                    logger.error(f"Error fetching AceStream: {e}")
                 
-                # Signal connection established (like pyacexy)
-                ongoing.started.set()
-                logger.info(f"Stream {ongoing.stream_id} connected, reading chunks")
+                if not ongoing.watched:
+                    break
+                if ongoing.buffer.head > published:
+                    attempts = 0
                 
-                # Read chunks and distribute to ALL clients (PYACEXY PATTERN)
-                chunk_count = 0
-                last_cleanup = asyncio.get_event_loop().time()
+                resumed = False
+                while not resumed and ongoing.watched and attempts < self.reconnect_attempts:
+                    attempts += 1
+                    delay = self.reconnect_delay * (2 ** (attempts - 1))
+                    logger.warning(f"Stream {ongoing.stream_id} upstream lost ({reason}), reconnecting in "
+                                   f"{delay:.1f}s ({attempts}/{self.reconnect_attempts}) with "
+                                   f"{len(ongoing.clients)} client(s) attached")
+                    await asyncio.sleep(delay)
+                    resumed = await self._reconnect(ongoing)
                 
-                async for chunk in ace_response.content.iter_chunked(self.chunk_size):
-                    if not chunk:
-                        break
-                    
-                    chunk_count += 1
-                    if chunk_count % 100 == 0:
-                        logger.debug(f"Stream {ongoing.stream_id} sent {chunk_count} chunks")
-                    
-                    # Periodic stale client cleanup (every 15 seconds, like pyacexy)
-                    current_time = asyncio.get_event_loop().time()
-                    if current_time - last_cleanup > 15:
-                        last_cleanup = current_time
-                        async with ongoing.lock:
-                            stale_client_ids = []
-                            for client_id, client_info in list(ongoing.clients.items()):
-                                last_write = ongoing.client_last_write.get(client_id, 0)
-                                # Inactive for 30 seconds = stale
-                                if current_time - last_write > 30:
-                                    logger.warning(f"Client {client_info.ip} inactive for {current_time - last_write:.0f}s, removing")
-                                    stale_client_ids.append(client_id)
-                            
-                            for client_id in stale_client_ids:
-                                client_info = ongoing.clients.pop(client_id, None)
-                                ongoing.client_last_write.pop(client_id, None)
-                                if client_info:
-                                    try:
-                                        await client_info.response.write_eof()
-                                    except:
-                                        pass
-                            
-                            if stale_client_ids:
-                                logger.info(f"Removed {len(stale_client_ids)} stale client(s)")
-                    
-                    # DIRECT WRITE TO ALL CLIENTS (PYACEXY NATIVE PATTERN - NO QUEUES!)
-                    async with ongoing.lock:
-                        dead_client_ids = []
-                        current_time = asyncio.get_event_loop().time()
-                        
-                        for client_id, client_info in list(ongoing.clients.items()):
-                            try:
-                                # Direct write (like pyacexy: await client_response.write(chunk))
-                                await client_info.response.write(chunk)
-                                # Track successful write
-                                ongoing.client_last_write[client_id] = current_time
-                                # Signal first chunk
-                                if chunk_count == 1:
-                                    ongoing.first_chunk.set()
-                            except Exception as e:
-                                logger.warning(f"Error writing to client {client_info.ip}: {e}")
-                                dead_client_ids.append(client_id)
-                        
-                        # Remove dead clients
-                        if dead_client_ids:
-                            for client_id in dead_client_ids:
-                                client_info = ongoing.clients.pop(client_id, None)
-                                ongoing.client_last_write.pop(client_id, None)
-                                if client_info:
-                                    try:
-                                        await client_info.response.write_eof()
-                                    except:
-                                        pass
-                            client_count = len(ongoing.clients)
-                            logger.info(f"Removed {len(dead_client_ids)} dead client(s), {client_count} remaining")
-                        
-                        # Stop if no clients left
-                        if not ongoing.clients:
-                            logger.info(f"No clients left for stream {ongoing.stream_id}, stopping")
-                            break
-                            
-        except asyncio.TimeoutError:
-            logger.info(f"Stream {ongoing.stream_id} timed out (no data for {self.empty_timeout}s)")
-            ongoing.started.set()
-        except Exception as e:
-            logger.error(f"Error fetching AceStream: {e}")
-            ongoing.started.set()
+                if not resumed:
+                    if self.reconnect_attempts > 0 and ongoing.watched:
+                        logger.error(f"Stream {ongoing.stream_id} could not be resumed after {attempts} reconnect(s)")
+                    break
         finally:
-            # Clean up all remaining clients
-            async with ongoing.lock:
-                for client_info in list(ongoing.clients.values()):
-                    try:
-                        await client_info.response.write_eof()
-                    except:
-                        pass
-                ongoing.clients.clear()
+            if ongoing.linger_handle:
+                ongoing.linger_handle.cancel()
+                ongoing.linger_handle = None
             
-            # Close the stream
-            await self._close_stream(ongoing.acestream)
+            if ongoing.prewarmed and not ongoing.warm_joins:
+                self.metrics.prewarm_unused += 1
+            ongoing.warm = False
             
-            # Signal done
+            if ongoing.hls_handle:
+                ongoing.hls_handle.cancel()
+                ongoing.hls_handle = None
+            if ongoing.hls:
+                ongoing.hls.close()
+            
+            if not ongoing.first_chunk.is_set():
+                self.startup_stats.record_failure(ongoing.stream_id, ongoing.source, reason)
+                if reason != "stopped":
+                    self.stream_info_cache.record_failure(ongoing.stream_id, reason)
+            
+            # Signal done: every writer drains what it can and ends its own response
+            ongoing.started.set()
             ongoing.done.set()
+            ongoing.wake_writers()
             
-            # Remove from active streams
+            # Remove from active streams first, a new stream of the key may start meanwhile
             async with self.streams_lock:
-                if ongoing.stream_id in self.streams:
+                if self.streams.get(ongoing.stream_id) is ongoing:
                     del self.streams[ongoing.stream_id]
-                    logger.info(f"Stream {ongoing.stream_id} cleaned up")
+            
+            # Close the stream
+            await self._close_stream(ongoing.acestream)
+            # The engine pin belongs to the key: keep it when a newer stream of the key owns it
+            if (ongoing.engine and ongoing.stream_id not in self.streams
+                    and ongoing.stream_id not in self._pending):
+                self.engine_pool.detach(ongoing.stream_id, ongoing.engine)
+            
+            self.buffer_budget.release(ongoing.allocation)
+            logger.info(f"Stream {ongoing.stream_id} cleaned up")
+    
+    async def _read_upstream(self, ongoing: OngoingStream):
+        """
+        Read the current playback URL into the shared buffer until it ends,
+        fails, or no clients are left
+        """
+        # sock_read timeout (like pyacexy)
+        timeout = aiohttp.ClientTimeout(sock_read=self.empty_timeout)
+        
+        logger.debug(f"Connecting to AceStream: {ongoing.acestream.playback_url}")
+        connect_started = time.monotonic()
+        async with self.session.get(ongoing.acestream.playback_url, timeout=timeout) as ace_response:
+            logger.debug(f"AceStream response status: {ace_response.status}")
+            if ace_response.status != 200:
+                raise Exception(f"AceStream returned status {ace_response.status}")
+            
+            # Signal connection established (like pyacexy)
+            connected = time.monotonic()
+            if not ongoing.first_chunk.is_set():
+                ongoing.startup['connect'] = connected - connect_started
+            ongoing.started.set()
+            logger.info(f"Stream {ongoing.stream_id} connected, reading chunks")
+            
+            chunk_count = 0
+            async for chunk in ace_response.content.iter_chunked(self.chunk_size):
+                if not chunk:
+                    break
+                
+                chunk_count += 1
+                if chunk_count % 100 == 0:
+                    logger.debug(f"Stream {ongoing.stream_id} published {chunk_count} chunks")
+                
+                # Publish once, writers pick it up at their own pace
+                self.metrics.upstream_bytes += len(chunk)
+                ongoing.publish(chunk)
+                if not ongoing.first_chunk.is_set():
+                    now = time.monotonic()
+                    ongoing.startup['first_chunk'] = now - connected
+                    ongoing.startup['total'] = now - ongoing.start_requested
+                    self.startup_stats.record(ongoing.stream_id, ongoing.source, ongoing.startup)
+                    self.stream_info_cache.record_success(ongoing.stream_id)
+                    ongoing.first_chunk.set()
+                
+                # Stop if no clients left (unless the linger timer owns the shutdown)
+                if not ongoing.watched and self.linger_seconds <= 0:
+                    logger.info(f"No clients left for stream {ongoing.stream_id}, stopping")
+                    break
+    
+    async def _reconnect(self, ongoing: OngoingStream) -> bool:
+        """
+        Prepare the next upstream connection: stop the failed engine session and
+        request the stream again (direct HTTP sources simply reconnect to their URL)
+        """
+        if ongoing.source == "acestream":
+            await self._close_stream(ongoing.acestream)
+            
+            engine = ongoing.engine
+            if engine is None or not engine.healthy:
+                # Move to another engine if the pinned one went down
+                self.engine_pool.detach(ongoing.stream_id, engine)
+                engine = self.engine_pool.place(ongoing.stream_id)
+            
+            try:
+                acestream = await self._fetch_stream_info(ongoing.stream_id, ongoing.extra_params, engine)
+            except Exception as e:
+                logger.warning(f"Reconnect of stream {ongoing.stream_id} on engine {engine.key} failed: {e}")
+                self.engine_pool.report_failure(engine)
+                self.metrics.engine_errors += 1
+                ongoing.engine = engine
+                return False
+            
+            ongoing.acestream = acestream
+            ongoing.engine = engine
+            self.engine_pool.attach(ongoing.stream_id, engine, acestream.stat_url)
+        
+        ongoing.inspector.discontinuity()
+        if ongoing.hls:
+            ongoing.hls.discontinuity()
+        ongoing.reconnects += 1
+        ongoing.last_reconnect = datetime.now()
+        self.metrics.reconnects += 1
+        
+        where = f" on engine {ongoing.engine.key}" if ongoing.engine else ""
+        logger.info(f"Stream {ongoing.stream_id} resumed{where} ({ongoing.reconnects} reconnect(s) so far)")
+        return True
+    
+    def _client_progress(self, ongoing: OngoingStream, client_id: int) -> Optional[int]:
+        """
+        Idle tracker probe: the client's cursor, or None while it waits for data
+        
+        A client that is caught up (or has not joined yet) is not stuck, however
+        long the upstream takes, so reconnects never make clients stale.
+        """
+        cursor = ongoing.client_cursors.get(client_id)
+        if cursor is None or cursor >= ongoing.buffer.head:
+            return None
+        return cursor
+    
+    def _client_idle(self, ongoing: OngoingStream, client_id: int):
+        """Idle tracker callback: cancel a writer that has not completed a write for stale_timeout"""
+        client_info = ongoing.clients.pop(client_id, None)
+        if client_info is None:
+            return
+        logger.warning(f"Client {client_info.ip} of stream {ongoing.stream_id} inactive for "
+                       f"{self.idle_tracker.timeout:.0f}s, removing")
+        self.metrics.clients_stale += 1
+        self.metrics.client_detached()
+        ongoing.client_cursors.pop(client_id, None)
+        writer = ongoing.client_writers.pop(client_id, None)
+        if writer and not writer.done():
+            writer.cancel()
+        if not ongoing.clients:
+            self._start_linger(ongoing)
+    
+    def _start_linger(self, ongoing: OngoingStream):
+        """
+        Keep the upstream alive for linger_seconds after the last client left
+        Must be called with ongoing.lock held
+        """
+        if (self.linger_seconds <= 0 or ongoing.done.is_set() or ongoing.linger_handle or ongoing.warm
+                or ongoing.hls is not None):
+            return
+        logger.info(f"No clients left for stream {ongoing.stream_id}, lingering for {self.linger_seconds}s")
+        loop = asyncio.get_event_loop()
+        ongoing.linger_handle = loop.call_later(self.linger_seconds, self._linger_expired, ongoing)
+    
+    def _linger_expired(self, ongoing: OngoingStream):
+        """Linger timer callback: stop the upstream if nobody came back"""
+        ongoing.linger_handle = None
+        if ongoing.watched:
+            return
+        logger.info(f"Linger expired for stream {ongoing.stream_id}, stopping")
+        if ongoing.fetch_task and not ongoing.fetch_task.done():
+            ongoing.fetch_task.cancel()
+    
+    def _backlog_bytes(self, ongoing: OngoingStream) -> int:
+        """Backlog window for new clients, in bytes"""
+        if self.backlog_bytes > 0:
+            return self.backlog_bytes
+        return int(self.backlog_seconds * ongoing.byte_rate())
+    
+    async def open_stream(self, key: str, extra_params: Optional[dict] = None) -> OngoingStream:
+        """
+        Get or create the shared stream for an AceStream id or infohash
+        
+        Raises:
+            BufferBudgetExceeded: If there is no buffer memory left for a new stream
+            Exception: If the engine could not start the stream
+        """
+        return await self._get_or_create_stream(key, extra_params or {})
+    
+    async def open_url(self, url: str) -> OngoingStream:
+        """
+        Get or create the shared stream for a direct HTTP source, keyed by its URL
+        
+        All viewers of the URL share one upstream connection, exactly like the
+        viewers of an AceStream id share one engine session.
+        
+        Raises:
+            BufferBudgetExceeded: If there is no buffer memory left for a new stream
+        """
+        async with self.streams_lock:
+            ongoing = self.streams.get(url)
+            if ongoing is not None and not ongoing.done.is_set():
+                logger.info(f"Reusing existing stream for {url}")
+                return ongoing
+        
+        # May stop lingering streams, which needs streams_lock
+        allocation = await self._allocate_buffer(url)
+        
+        async with self.streams_lock:
+            ongoing = self.streams.get(url)
+            if ongoing is not None and not ongoing.done.is_set():
+                # Created by another request meanwhile
+                self.buffer_budget.release(allocation)
+                return ongoing
+            
+            # Nothing to negotiate: the URL itself is the playback URL
+            logger.info(f"Creating new stream for {url}")
+            ongoing = OngoingStream(url, AceStreamInfo(url, "", "", url), allocation.size, source="http",
+                                    coalesce_delay=self.write_coalesce_delay, coalesce_max=self.max_write_size)
+            ongoing.allocation = allocation
+            self.streams[url] = ongoing
+            return ongoing
+    
+    async def set_warm(self, keys: List[str]) -> List[str]:
+        """
+        Keep these AceStream ids attached upstream, with or without viewers (pre-warming)
+        
+        Streams missing from keys are no longer warm and linger like any stream
+        whose last viewer left. New warm streams are only started with spare
+        buffer memory, so pre-warming never evicts or shrinks a watched stream,
+        and keys owned by another worker are ignored.
+        
+        Returns:
+            Keys warm now
+        """
+        wanted = [key for key in keys if self._owner_port(key) is None]
+        async with self.streams_lock:
+            current = [s for s in self.streams.values() if s.warm and s.stream_id not in wanted]
+        for ongoing in current:
+            async with ongoing.lock:
+                ongoing.warm = False
+                if not ongoing.clients:
+                    self._start_linger(ongoing)
+        
+        async def warm(key: str) -> Optional[str]:
+            async with self.streams_lock:
+                ongoing = self.streams.get(key)
+            if ongoing is None or ongoing.done.is_set():
+                available = self.buffer_budget.available
+                if available is not None and available < self.buffer_size:
+                    return None
+                try:
+                    ongoing = await self._get_or_create_stream(key, {})
+                except Exception as e:
+                    logger.info(f"Pre-warming stream {key} failed: {e}")
+                    return None
+            async with ongoing.lock:
+                if ongoing.done.is_set():
+                    return None
+                if not ongoing.warm:
+                    ongoing.warm = True
+                    if ongoing.linger_handle:
+                        ongoing.linger_handle.cancel()
+                        ongoing.linger_handle = None
+                if ongoing.fetch_task is None or ongoing.fetch_task.done():
+                    logger.info(f"Pre-warming stream {key}")
+                    ongoing.prewarmed = True
+                    self.metrics.prewarm_started += 1
+                    ongoing.fetch_task = asyncio.create_task(self._fetch_acestream(ongoing))
+            return key
+        
+        return [key for key in await asyncio.gather(*(warm(key) for key in wanted)) if key]
+    
+    async def _attach_client(self, ongoing: OngoingStream, client_id: int,
+                             client_info: ClientInfo) -> Optional[bool]:
+        """
+        Add a client to a stream and start its upstream reader if needed (PYACEXY PATTERN)
+        
+        Returns whether the reader was just started (wait for the first chunk), or
+        None when the stream is already finalized: it must not be restarted, its
+        engine session and buffer are gone.
+        """
+        key = ongoing.stream_id
+        async with ongoing.lock:
+            if ongoing.done.is_set():
+                return None
+            ongoing.clients[client_id] = client_info
+            ongoing.client_writers[client_id] = asyncio.current_task()
+            self.metrics.client_attached()
+            client_count = len(ongoing.clients)
+            logger.info(f"Stream {key} now has {client_count} client(s)")
+            
+            if ongoing.warm and client_count == 1:
+                ongoing.warm_joins += 1
+                self.metrics.prewarm_hits += 1
+                logger.info(f"Stream {key} joined while pre-warmed")
+            
+            # A join during the linger window reuses the warm upstream session
+            if ongoing.linger_handle:
+                ongoing.linger_handle.cancel()
+                ongoing.linger_handle = None
+                ongoing.linger_saves += 1
+                self.linger_saves += 1
+                logger.info(f"Stream {key} resumed from linger")
+            
+            # Check if stream is already active
+            if ongoing.fetch_task is None or ongoing.fetch_task.done():
+                # Start stream
+                self.metrics.cold_starts += 1
+                ongoing.fetch_task = asyncio.create_task(self._fetch_acestream(ongoing))
+                return True
+        return False
+    
+    async def iter_client(
+        self,
+        ongoing: OngoingStream,
+        client_ip: str,
+        user_agent: str,
+        username: str = "Anonymous",
+        response: Optional[web.StreamResponse] = None,
+    ) -> AsyncIterator[memoryview]:
+        """
+        Attach one client to a stream and yield the data to send it
+        
+        This is the client's writer: it starts the upstream reader if needed and
+        drains the shared buffer at the pace the consumer writes. Data is yielded as
+        zero-copy views into the ring buffer, so each one must be written (or copied)
+        before the next is requested. Used by the /ace/getstream handler and
+        directly by in-process endpoints (Xtream /live), which avoids a loopback
+        HTTP hop. Close the iterator with aclose() when stopping early. A stream
+        that was finalized after the caller got it is not restarted: the client
+        joins the current stream of its key instead.
+        """
+        key = ongoing.stream_id
+        client_id = next(self._client_ids)
+        client_info = ClientInfo(
+            ip=client_ip,
+            user_agent=user_agent,
+            username=username,
+            connected_at=datetime.now(),
+            response=response
+        )
+        
+        need_to_wait = await self._attach_client(ongoing, client_id, client_info)
+        if need_to_wait is None:
+            # Finalized (linger expired, upstream failed) after the caller got it:
+            # join the current stream of the key instead of restarting this one
+            logger.info(f"Stream {key} ended before client {client_ip} joined, reopening")
+            if ongoing.source == "acestream":
+                ongoing = await self._get_or_create_stream(key, ongoing.extra_params)
+            else:
+                ongoing = await self.open_url(key)
+            need_to_wait = await self._attach_client(ongoing, client_id, client_info)
+            if need_to_wait is None:
+                return
+        
+        idle_entry = self.idle_tracker.track(
+            lambda: self._client_progress(ongoing, client_id),
+            lambda: self._client_idle(ongoing, client_id),
+        )
+        try:
+            # If we just started, wait for first chunk
+            if need_to_wait:
+                try:
+                    await asyncio.wait_for(ongoing.started.wait(), timeout=10.0)
+                    await asyncio.wait_for(ongoing.first_chunk.wait(), timeout=5.0)
+                except asyncio.TimeoutError:
+                    logger.error(f"Timeout waiting for stream {key} to start")
+                    return
+            
+            buffer = ongoing.buffer
+            metrics = self.metrics
+            slow_clients = self.slow_clients
+            writes = 0
+            # Start from the latest keyframe in the backlog (instant join) or the live edge
+            cursor = ongoing.join_offset(self._backlog_bytes(ongoing))
+            ongoing.client_cursors[client_id] = cursor
+            if cursor < buffer.head:
+                logger.debug(f"Client joins {key} with {buffer.lag(cursor)} bytes of backlog")
+            
+            # Program tables first, so the player does not wait for the next PAT/PMT
+            psi_header = ongoing.inspector.psi_header()
+            if psi_header:
+                yield memoryview(psi_header)
+            max_lag = slow_clients.max_lag(ongoing)
+            
+            while client_id in ongoing.clients:
+                if cursor >= buffer.head:
+                    if ongoing.done.is_set():
+                        break
+                    await ongoing.wait_for_data(cursor)
+                    continue
+                
+                if buffer.head - cursor > max_lag or cursor < buffer.tail:
+                    # This client cannot keep up (or was lapped by the upstream reader)
+                    target = slow_clients.recover(ongoing, cursor)
+                    if target is None:
+                        logger.warning(f"Client too slow for stream {key} "
+                                       f"({buffer.lag(cursor)} bytes behind), disconnecting")
+                        metrics.clients_dropped += 1
+                        break
+                    logger.info(f"Client {client_ip} too slow for stream {key}, "
+                                f"skipping {target - cursor} bytes ahead")
+                    metrics.client_skips += 1
+                    metrics.skipped_bytes += target - cursor
+                    ongoing.skips += 1
+                    cursor = target
+                    ongoing.client_cursors[client_id] = cursor
+                    max_lag = slow_clients.max_lag(ongoing)
+                    # Fresh program tables, the player resynchronises on the keyframe
+                    psi_header = ongoing.inspector.psi_header()
+                    if psi_header:
+                        yield memoryview(psi_header)
+                    continue
+                
+                # Zero-copy view of everything available up to the wrap point
+                data = buffer.read(cursor, self.max_write_size)
+                size = len(data)
+                cursor += size
+                writes += 1
+                if writes % WRITE_LATENCY_SAMPLING:
+                    yield data
+                else:
+                    write_started = time.monotonic()
+                    yield data
+                    metrics.write_latency.observe(time.monotonic() - write_started)
+                metrics.client_bytes += size
+                metrics.client_writes += 1
+                ongoing.client_cursors[client_id] = cursor
+        finally:
+            # Remove this client (no awaits: also runs while being cancelled or closed)
+            self.idle_tracker.untrack(idle_entry)
+            was_present = client_id in ongoing.clients
+            ongoing.clients.pop(client_id, None)
+            ongoing.client_writers.pop(client_id, None)
+            ongoing.client_cursors.pop(client_id, None)
+            if was_present:
+                self.metrics.client_detached()
+                logger.info(f"Handler cleanup: removed client from {key}, {len(ongoing.clients)} remaining")
+            if not ongoing.clients:
+                self._start_linger(ongoing)
+    
+    async def iter_client_bytes(
+        self,
+        ongoing: OngoingStream,
+        client_ip: str,
+        user_agent: str,
+        username: str = "Anonymous",
+    ) -> AsyncIterator[bytes]:
+        """
+        Same as iter_client, for consumers that need bytes (ASGI response bodies)
+        
+        Each view is copied once, right before it is handed over.
+        """
+        chunks = self.iter_client(ongoing, client_ip, user_agent, username)
+        try:
+            async for data in chunks:
+                yield bytes(data)
+        finally:
+            await chunks.aclose()
+    
+    async def hls_playlist(
+        self,
+        key: str,
+        client_ip: str,
+        user_agent: str,
+        username: str = "Anonymous",
+        extra_params: Optional[dict] = None,
+    ) -> str:
+        """
+        Live HLS playlist of an AceStream id or infohash, starting the stream if needed
+        
+        The first request attaches an HLSPackager to the stream, seeded with the
+        ring buffer backlog from its oldest keyframe, so a stream that is already
+        running has segments at once. The rendition (and the upstream, unless TS
+        clients are attached) stays alive while its playlist or segments are
+        requested. Segment URIs are relative: {sequence}.ts next to the playlist.
+        
+        Raises:
+            BufferBudgetExceeded: If there is no buffer memory left for a new stream
+            StreamUnavailable: If the engine failed to start the stream moments ago
+            HLSUnavailable: If no segment was cut in time
+            Exception: If the engine could not start the stream
+        """
+        ongoing = await self._get_or_create_stream(key, extra_params or {})
+        async with ongoing.lock:
+            if ongoing.done.is_set():
+                raise HLSUnavailable(f"Stream {key} ended")
+            packager = ongoing.hls
+            if packager is None:
+                packager = ongoing.hls = HLSPackager(key, ongoing.inspector, ongoing.byte_rate,
+                                                     self.hls_segment_seconds, self.hls_window,
+                                                     self.buffer_budget)
+                self._seed_hls(ongoing)
+                if ongoing.warm and not ongoing.clients:
+                    ongoing.warm_joins += 1
+                    self.metrics.prewarm_hits += 1
+                    logger.info(f"Stream {key} joined over HLS while pre-warmed")
+                logger.info(f"HLS output started for stream {key} "
+                            f"({len(packager.segments)} segment(s) from the backlog)")
+            self._hls_touch(ongoing)
+            packager.seen(client_ip, user_agent, username)
+            if ongoing.fetch_task is None or ongoing.fetch_task.done():
+                self.metrics.cold_starts += 1
+                ongoing.fetch_task = asyncio.create_task(self._fetch_acestream(ongoing))
+        
+        self.metrics.hls_playlists += 1
+        if not await packager.wait_for_segment(self.no_response_timeout + 3 * self.hls_segment_seconds):
+            raise HLSUnavailable(f"No HLS segment of stream {key} yet")
+        return packager.playlist()
+    
+    async def hls_segment(self, key: str, sequence: int) -> Optional[bytes]:
+        """A segment of the HLS rendition of a stream, None when it is not (or no longer) held"""
+        ongoing = self.streams.get(key)
+        if ongoing is None or ongoing.hls is None:
+            return None
+        ongoing.hls.touch()
+        data = ongoing.hls.segment(sequence)
+        if data is not None:
+            self.metrics.hls_segments_served += 1
+            self.metrics.hls_bytes += len(data)
+        return data
+    
+    def _seed_hls(self, ongoing: OngoingStream):
+        """Feed the ring buffer backlog to a new HLS packager (it starts at the oldest keyframe)"""
+        buffer = ongoing.buffer
+        cursor = buffer.tail
+        while cursor < buffer.head:
+            data = buffer.read(cursor)
+            ongoing.hls.feed(data, cursor)
+            cursor += len(data)
+    
+    def _hls_touch(self, ongoing: OngoingStream):
+        """An HLS request came in: keep the stream alive, cancel its linger"""
+        if ongoing.linger_handle:
+            ongoing.linger_handle.cancel()
+            ongoing.linger_handle = None
+            ongoing.linger_saves += 1
+            self.linger_saves += 1
+            logger.info(f"Stream {ongoing.stream_id} resumed from linger over HLS")
+        if ongoing.hls_handle is None:
+            loop = asyncio.get_event_loop()
+            ongoing.hls_handle = loop.call_later(self.hls_idle_timeout, self._hls_expired, ongoing)
+    
+    def _hls_expired(self, ongoing: OngoingStream):
+        """HLS timer callback: drop the rendition when nobody requested it for hls_idle_timeout"""
+        ongoing.hls_handle = None
+        packager = ongoing.hls
+        if packager is None:
+            return
+        idle = time.monotonic() - packager.last_request
+        if idle < self.hls_idle_timeout:
+            loop = asyncio.get_event_loop()
+            ongoing.hls_handle = loop.call_later(self.hls_idle_timeout - idle, self._hls_expired, ongoing)
+            return
+        logger.info(f"No HLS requests for stream {ongoing.stream_id} in {self.hls_idle_timeout:.0f}s, "
+                    f"dropping its segments")
+        ongoing.hls = None
+        packager.close()
+        if not ongoing.clients:
+            self._start_linger(ongoing)
+    
+    def _redirect_to_owner(self, request: web.Request, owner_port: int):
+        """Another worker owns the stream: hand the player over to it"""
+        host = request.host
+        hostname = host[:host.index(']') + 1] if host.startswith('[') else host.split(':')[0]
+        raise web.HTTPTemporaryRedirect(f"{request.scheme}://{hostname}:{owner_port}{request.path_qs}")
+    
+    async def handle_hls_playlist(self, request: web.Request) -> web.Response:
+        """Handle /ace/hls/{key}/index.m3u8: live HLS playlist of a stream"""
+        key = request.match_info['key']
+        owner_port = self._owner_port(key)
+        if owner_port is not None:
+            self._redirect_to_owner(request, owner_port)
+        
+        username = request.query.get('username', 'Anonymous')
+        client_ip = request.query.get('client_ip', request.remote)
+        client_ua = request.query.get('client_ua', request.headers.get('User-Agent', 'Unknown'))
+        extra_params = {k: v for k, v in request.query.items()
+                        if k not in ('id', 'infohash', 'pid', 'username', 'client_ip', 'client_ua')}
+        try:
+            playlist = await self.hls_playlist(key, client_ip, client_ua, username, extra_params)
+        except BufferBudgetExceeded as e:
+            return web.Response(status=503, text=str(e))
+        except StreamUnavailable as e:
+            logger.info(f"Stream {key} refused: {e}")
+            return web.Response(status=503, text=f"Failed to start stream: {e}",
+                                headers={'Retry-After': str(int(e.retry_after) + 1)})
+        except HLSUnavailable as e:
+            return web.Response(status=503, text=str(e), headers={'Retry-After': '1'})
+        except Exception as e:
+            logger.error(f"Failed to fetch stream info: {e}")
+            return web.Response(status=500, text=f"Failed to start stream: {e}")
+        
+        return web.Response(text=playlist, headers={
+            'Content-Type': PLAYLIST_CONTENT_TYPE,
+            'Cache-Control': 'no-cache',
+            'Access-Control-Allow-Origin': '*',
+        })
+    
+    async def handle_hls_segment(self, request: web.Request) -> web.Response:
+        """Handle /ace/hls/{key}/{sequence}.ts: one HLS segment, the same bytes for every viewer"""
+        key = request.match_info['key']
+        owner_port = self._owner_port(key)
+        if owner_port is not None:
+            self._redirect_to_owner(request, owner_port)
+        
+        data = await self.hls_segment(key, int(request.match_info['sequence']))
+        if data is None:
+            return web.Response(status=404, text="Segment not found")
+        # Sequence numbers are never reused, a segment can be cached for good
+        return web.Response(body=data, headers={
+            'Content-Type': 'video/MP2T',
+            'Cache-Control': 'public, max-age=86400, immutable',
+            'Access-Control-Allow-Origin': '*',
+        })
+    
+    async def manifest_playlist(
+        self,
+        key: str,
+        client_ip: str,
+        user_agent: str,
+        username: str = "Anonymous",
+        extra_params: Optional[dict] = None,
+    ) -> str:
+        """
+        Engine HLS playlist of a stream (see EngineHLSProxy), segment URIs relative
+        to /ace/manifest.m3u8
+        
+        Raises:
+            StreamUnavailable: If the engine failed to start the stream moments ago
+            HLSUnavailable: If the engine did not deliver a playlist
+            Exception: If the engine could not start the stream
+        """
+        return await self.hls_proxy.playlist(key, client_ip, user_agent, username, extra_params)
+    
+    async def manifest_segment(self, key: str, epoch: int, sequence: int) -> Optional[bytes]:
+        """
+        A segment of an engine HLS session, from the cache when possible; None when unknown
+        
+        Raises:
+            HLSUnavailable: If the engine did not deliver it
+        """
+        return await self.hls_proxy.segment(key, epoch, sequence)
+    
+    async def handle_manifest(self, request: web.Request) -> web.Response:
+        """Handle /ace/manifest.m3u8: engine HLS playlist, segments served from our cache"""
+        key = request.query.get('id', '') or request.query.get('infohash', '')
+        if not key:
+            return web.Response(status=400, text="Missing id or infohash parameter")
+        if 'pid' in request.query:
+            return web.Response(status=400, text="PID parameter is not allowed")
+        owner_port = self._owner_port(key)
+        if owner_port is not None:
+            self._redirect_to_owner(request, owner_port)
+        
+        username = request.query.get('username', 'Anonymous')
+        client_ip = request.query.get('client_ip', request.remote)
+        client_ua = request.query.get('client_ua', request.headers.get('User-Agent', 'Unknown'))
+        extra_params = {k: v for k, v in request.query.items()
+                        if k not in ('id', 'infohash', 'pid', 'username', 'client_ip', 'client_ua')}
+        try:
+            playlist = await self.manifest_playlist(key, client_ip, client_ua, username, extra_params)
+        except StreamUnavailable as e:
+            logger.info(f"Stream {key} refused: {e}")
+            return web.Response(status=503, text=f"Failed to start stream: {e}",
+                                headers={'Retry-After': str(int(e.retry_after) + 1)})
+        except (HLSUnavailable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return web.Response(status=502, text=f"Engine playlist unavailable: {e}")
+        except Exception as e:
+            logger.error(f"Failed to start engine HLS session: {e}")
+            return web.Response(status=500, text=f"Failed to start stream: {e}")
+        
+        return web.Response(text=playlist, headers={
+            'Content-Type': PLAYLIST_CONTENT_TYPE,
+            'Cache-Control': 'no-cache',
+            'Access-Control-Allow-Origin': '*',
+        })
+    
+    async def handle_manifest_segment(self, request: web.Request) -> web.Response:
+        """Handle /ace/manifest/{key}/{epoch}/{sequence}.ts: engine HLS segment from the cache"""
+        key = request.match_info['key']
+        owner_port = self._owner_port(key)
+        if owner_port is not None:
+            self._redirect_to_owner(request, owner_port)
+        
+        try:
+            data = await self.manifest_segment(key, int(request.match_info['epoch']),
+                                               int(request.match_info['sequence']))
+        except (HLSUnavailable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return web.Response(status=502, text=f"Engine segment unavailable: {e}")
+        if data is None:
+            return web.Response(status=404, text="Segment not found")
+        return web.Response(body=data, headers={
+            'Content-Type': 'video/MP2T',
+            'Cache-Control': 'public, max-age=86400, immutable',
+            'Access-Control-Allow-Origin': '*',
+        })
     
     async def handle_getstream(self, request: web.Request) -> web.StreamResponse:
         """
@@ -284,6 +1297,10 @@ class AiohttpStreamingServer:
         
         key = stream_id or infohash
         
+        owner_port = self._owner_port(key)
+        if owner_port is not None:
+            self._redirect_to_owner(request, owner_port)
+        
         logger.info(f"Client {client_ip} (user: {username}) requesting stream {key} (UA: {client_ua})")
         
         # Get extra parameters (exclude username, id, infohash, pid, client_ip, client_ua)
@@ -291,19 +1308,17 @@ class AiohttpStreamingServer:
                        if k not in ('id', 'infohash', 'pid', 'username', 'client_ip', 'client_ua')}
         
         # Get or create ongoing stream
-        async with self.streams_lock:
-            if key not in self.streams:
-                logger.info(f"Creating new stream for {key}")
-                try:
-                    acestream = await self._fetch_stream_info(key, extra_params)
-                    ongoing = OngoingStream(key, acestream)
-                    self.streams[key] = ongoing
-                except Exception as e:
-                    logger.error(f"Failed to fetch stream info: {e}")
-                    return web.Response(status=500, text=f"Failed to start stream: {e}")
-            else:
-                logger.info(f"Reusing existing stream for {key}")
-                ongoing = self.streams[key]
+        try:
+            ongoing = await self._get_or_create_stream(key, extra_params)
+        except BufferBudgetExceeded as e:
+            return web.Response(status=503, text=str(e))
+        except StreamUnavailable as e:
+            logger.info(f"Stream {key} refused: {e}")
+            return web.Response(status=503, text=f"Failed to start stream: {e}",
+                                headers={'Retry-After': str(int(e.retry_after) + 1)})
+        except Exception as e:
+            logger.error(f"Failed to fetch stream info: {e}")
+            return web.Response(status=500, text=f"Failed to start stream: {e}")
         
         # Create response for this client
         response = web.StreamResponse()
@@ -314,57 +1329,21 @@ class AiohttpStreamingServer:
         
         # Prepare response FIRST (before adding to clients)
         await response.prepare(request)
+        if self.performance_profile:
+            tune_client_socket(request.transport, self.socket_send_buffer)
         
-        # Add client and start stream if needed (PYACEXY PATTERN)
-        need_to_wait = False
-        async with ongoing.lock:
-            # Create client info with REAL client data (not proxy data)
-            client_info = ClientInfo(
-                ip=client_ip,  # Real client IP from Xtream API
-                user_agent=client_ua,  # Real User-Agent from Xtream API
-                username=username,
-                connected_at=datetime.now(),
-                response=response
-            )
-            # Add client to list with ClientInfo
-            response_id = id(response)
-            ongoing.clients[response_id] = client_info
-            client_count = len(ongoing.clients)
-            logger.info(f"Stream {key} now has {client_count} client(s)")
-            
-            # Check if stream is already active
-            if ongoing.fetch_task is None or ongoing.fetch_task.done():
-                # Start stream
-                need_to_wait = True
-                ongoing.fetch_task = asyncio.create_task(self._fetch_acestream(ongoing))
-        
-        # If we just started, wait for first chunk
-        if need_to_wait:
-            try:
-                await asyncio.wait_for(ongoing.started.wait(), timeout=10.0)
-                await asyncio.wait_for(ongoing.first_chunk.wait(), timeout=5.0)
-            except asyncio.TimeoutError:
-                logger.error(f"Timeout waiting for stream {key} to start")
-                async with ongoing.lock:
-                    ongoing.clients.pop(response_id, None)
-                return web.Response(status=503, text="Stream failed to start")
-        
+        # This handler is the client's writer
+        client_stream = self.iter_client(ongoing, client_ip, client_ua, username, response)
         try:
-            # Wait for stream to finish (client disconnect handled by write errors)
-            await ongoing.done.wait()
+            async for data in client_stream:
+                await response.write(data)
             logger.debug(f"Stream finished for {key}")
+        except asyncio.CancelledError:
+            logger.debug(f"Writer for {key} cancelled")
         except Exception as e:
             logger.debug(f"Client exception: {e}")
         finally:
-            # Remove this client
-            async with ongoing.lock:
-                was_present = response_id in ongoing.clients
-                ongoing.clients.pop(response_id, None)
-                ongoing.client_last_write.pop(response_id, None)
-                client_count = len(ongoing.clients)
-                if was_present:
-                    logger.info(f"Handler cleanup: removed client from {key}, {client_count} remaining")
-            
+            await client_stream.aclose()
             try:
                 await response.write_eof()
             except:
@@ -372,66 +1351,307 @@ class AiohttpStreamingServer:
         
         return response
     
+    async def streams_snapshot(self) -> List[dict]:
+        """Active streams and their clients as plain data, for the management API"""
+        async with self.streams_lock:
+            streams = list(self.streams.values())
+        
+        snapshot = []
+        for ongoing in streams:
+            async with ongoing.lock:
+                clients = [{
+                    'username': client_info.username,
+                    'ip': client_info.ip,
+                    'user_agent': client_info.user_agent,
+                    'connected_at': client_info.connected_at.isoformat()
+                } for client_info in ongoing.clients.values()]
+                hls_viewers = ongoing.hls.active_viewers(self.hls_idle_timeout) if ongoing.hls else []
+            snapshot.append({
+                'stream_id': ongoing.stream_id,
+                'source': ongoing.source,
+                'clients': clients,
+                'created_at': ongoing.created_at.isoformat(),
+                'is_active': bool(ongoing.fetch_task and not ongoing.fetch_task.done()),
+                'warm': ongoing.warm,
+                'hls_viewers': hls_viewers,
+            })
+        return snapshot + self.hls_proxy.snapshot()
+    
+    def _owner_port(self, key: str) -> Optional[int]:
+        """Private port of the worker owning key, or None when this worker owns it"""
+        if len(self.worker_ports) <= 1:
+            return None
+        owner = worker_for(key, len(self.worker_ports))
+        if owner == self.worker_index:
+            return None
+        return self.worker_ports[owner]
+    
+    async def _peer_json(self, port: int, path: str) -> dict:
+        """GET a JSON document from another worker"""
+        timeout = aiohttp.ClientTimeout(total=self.no_response_timeout)
+        async with self.session.get(f"http://{self.peer_host}:{port}{path}", timeout=timeout) as response:
+            if response.status != 200:
+                raise Exception(f"Worker on port {port} returned {response.status}")
+            return await response.json()
+    
+    async def _local_status(self) -> dict:
+        """Global status of the streams served by this process"""
+        async with self.streams_lock:
+            return {
+                'streams': len(self.streams),
+                'clients': self.metrics.clients,
+                'buffer_bytes': sum(s.buffer.capacity for s in self.streams.values()),
+                'lingering': sum(1 for s in self.streams.values() if s.linger_handle),
+                'linger_saves': self.linger_saves,
+                'reconnects': self.metrics.reconnects,
+                'skips': self.metrics.client_skips,
+                'starts_refused': self.metrics.starts_refused,
+                'warm': sum(1 for s in self.streams.values() if s.warm),
+                'hls': sum(1 for s in self.streams.values() if s.hls),
+                'engine_hls': len(self.hls_proxy.sessions),
+                'buffer_budget': self.buffer_budget.limit,
+                'engines': self.engine_pool.snapshot()
+            }
+    
+    async def _aggregated_status(self) -> dict:
+        """Global status summed over all workers (engine load included)"""
+        async def worker_status(index: int, port: int) -> dict:
+            if index == self.worker_index:
+                return await self._local_status()
+            return await self._peer_json(port, "/ace/status?local=1")
+        
+        results = await asyncio.gather(
+            *(worker_status(index, port) for index, port in enumerate(self.worker_ports)),
+            return_exceptions=True
+        )
+        
+        status = {'streams': 0, 'clients': 0, 'buffer_bytes': 0, 'lingering': 0, 'linger_saves': 0,
+                  'reconnects': 0, 'skips': 0, 'starts_refused': 0, 'warm': 0, 'hls': 0,
+                  'engine_hls': 0, 'buffer_budget': 0}
+        engines: Dict[str, dict] = {}
+        workers = []
+        for index, (port, result) in enumerate(zip(self.worker_ports, results)):
+            if isinstance(result, BaseException):
+                logger.warning(f"Status of streaming worker {index} unavailable: {result}")
+                workers.append({'worker': index, 'port': port, 'error': str(result)})
+                continue
+            for field in status:
+                status[field] += result.get(field, 0)
+            workers.append({'worker': index, 'port': port, 'streams': result.get('streams', 0)})
+            # Each worker has its own view of the engines: add up the load it puts on them
+            for engine in result.get('engines', []):
+                merged = engines.setdefault(engine['engine'], dict(engine, active_streams=0, speed_down=0, peers=0))
+                merged['active_streams'] += engine.get('active_streams', 0)
+                merged['speed_down'] += engine.get('speed_down', 0)
+                merged['peers'] += engine.get('peers', 0)
+        
+        status['engines'] = list(engines.values())
+        status['workers'] = workers
+        return status
+    
     async def handle_status(self, request: web.Request) -> web.Response:
-        """Handle /ace/status endpoint"""
+        """Handle /ace/status endpoint (aggregated over all workers unless local=1)"""
         stream_id = request.query.get('id', '')
         infohash = request.query.get('infohash', '')
+        local = request.query.get('local') == '1'
+        
+        # Global status
+        if not stream_id and not infohash:
+            if local or len(self.worker_ports) <= 1:
+                return web.json_response(await self._local_status())
+            return web.json_response(await self._aggregated_status())
+        
+        # Specific stream status, answered by the worker owning the stream
+        key = stream_id or infohash
+        owner_port = None if local else self._owner_port(key)
+        if owner_port is not None:
+            timeout = aiohttp.ClientTimeout(total=self.no_response_timeout)
+            url = f"http://{self.peer_host}:{owner_port}/ace/status"
+            try:
+                async with self.session.get(url, params={'id': key, 'local': '1'}, timeout=timeout) as response:
+                    return web.Response(status=response.status, body=await response.read(),
+                                        content_type=response.content_type)
+            except aiohttp.ClientError as e:
+                logger.warning(f"Streaming worker on port {owner_port} unavailable: {e}")
+                return web.Response(status=503, text="Streaming worker not available")
         
         async with self.streams_lock:
-            # Global status
-            if not stream_id and not infohash:
-                status = {
-                    'streams': len(self.streams)
-                }
-                return web.json_response(status)
-            
-            # Specific stream status
-            key = stream_id or infohash
             if key in self.streams:
                 ongoing = self.streams[key]
                 async with ongoing.lock:
                     status = {
                         'clients': len(ongoing.clients),
                         'stream_id': key,
-                        'stat_url': ongoing.acestream.stat_url
+                        'source': ongoing.source,
+                        'engine': ongoing.engine.key if ongoing.engine else None,
+                        'stat_url': ongoing.acestream.stat_url,
+                        'buffer': ongoing.buffer_stats(),
+                        'ts': ongoing.ts_stats(),
+                        'lingering': ongoing.linger_handle is not None,
+                        'linger_saves': ongoing.linger_saves,
+                        'reconnects': ongoing.reconnects,
+                        'skips': ongoing.skips,
+                        'hls': ongoing.hls.stats() if ongoing.hls else None,
+                        'last_reconnect': ongoing.last_reconnect.isoformat() if ongoing.last_reconnect else None
                     }
                 return web.json_response(status)
             else:
                 return web.Response(status=404, text="Stream not found")
     
+    async def startup_snapshot(self, key: Optional[str] = None) -> Dict[str, dict]:
+        """Start latency statistics per stream key, as plain data"""
+        return self.startup_stats.snapshot(key)
+    
+    async def handle_startup(self, request: web.Request) -> web.Response:
+        """Handle /ace/startup endpoint: start latency statistics (all workers unless local=1)"""
+        key = request.query.get('id') or request.query.get('infohash') or None
+        snapshot = await self.startup_snapshot(key)
+        if request.query.get('local') == '1' or len(self.worker_ports) <= 1:
+            return web.json_response(snapshot)
+        
+        # A channel may have been started on several workers, if their number changed
+        path = "/ace/startup?local=1" + (f"&{urlencode({'id': key})}" if key else "")
+        peers = [port for index, port in enumerate(self.worker_ports) if index != self.worker_index]
+        results = await asyncio.gather(*(self._peer_json(port, path) for port in peers), return_exceptions=True)
+        for port, result in zip(peers, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Startup statistics of worker on port {port} unavailable: {result}")
+                continue
+            for channel_key, stats in result.items():
+                snapshot.setdefault(channel_key, stats)
+        return web.json_response(snapshot)
+    
+    async def metrics_snapshot(self) -> List[dict]:
+        """Metrics of this process as plain data (one entry, see render_prometheus)"""
+        snapshot = self.metrics.to_dict(len(self.streams), self.startup_stats.overall_snapshot(),
+                                        self.buffer_budget.snapshot())
+        if self.worker_ports:
+            snapshot['worker'] = self.worker_index
+        return [snapshot]
+    
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """
+        Handle /metrics endpoint: Prometheus text format, all workers unless local=1
+        (format=json returns the raw snapshots)
+        """
+        snapshots = await self.metrics_snapshot()
+        if request.query.get('local') != '1' and len(self.worker_ports) > 1:
+            peers = [port for index, port in enumerate(self.worker_ports) if index != self.worker_index]
+            path = "/metrics?local=1&format=json"
+            results = await asyncio.gather(*(self._peer_json(port, path) for port in peers),
+                                           return_exceptions=True)
+            for port, result in zip(peers, results):
+                if isinstance(result, BaseException):
+                    logger.warning(f"Metrics of worker on port {port} unavailable: {result}")
+                    continue
+                snapshots.extend(result)
+        
+        if request.query.get('format') == 'json':
+            return web.json_response(snapshots)
+        return web.Response(body=render_prometheus(snapshots).encode(),
+                            headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+    
+    async def _measure_loop_lag(self):
+        """Event loop lag: how late a sleep of loop_lag_interval wakes up"""
+        loop = asyncio.get_event_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.loop_lag_interval)
+            self.metrics.observe_loop_lag(max(0.0, loop.time() - started - self.loop_lag_interval))
+    
+    async def handle_warm(self, request: web.Request) -> web.Response:
+        """Handle POST /ace/warm: JSON list of AceStream ids to keep warm (pre-warmer, loopback only)"""
+        if request.remote not in ('127.0.0.1', '::1', self.peer_host):
+            return web.Response(status=403, text="Forbidden")
+        try:
+            keys = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="Expected a JSON list of stream ids")
+        if not isinstance(keys, list):
+            return web.Response(status=400, text="Expected a JSON list of stream ids")
+        return web.json_response(await self.set_warm([str(key) for key in keys]))
+    
+    async def handle_streams(self, request: web.Request) -> web.Response:
+        """Handle /ace/streams endpoint: streams_snapshot() of this worker, for the management API"""
+        return web.json_response(await self.streams_snapshot())
+    
     async def start(self):
         """Start the aiohttp streaming server"""
-        self.session = ClientSession()
+        if self.performance_profile:
+            self.session = ClientSession(connector=upstream_connector(self.upstream_limit_per_host))
+        else:
+            self.session = ClientSession()
+        self.hls_proxy.session = self.session
+        if self._owns_engine_pool:
+            await self.engine_pool.start()
+        self._loop_lag_task = asyncio.create_task(self._measure_loop_lag())
+        self.idle_tracker.start()
         
         self.app = web.Application()
         self.app.router.add_get('/ace/getstream', self.handle_getstream)
         self.app.router.add_get('/ace/getstream/', self.handle_getstream)
         self.app.router.add_get('/ace/status', self.handle_status)
+        self.app.router.add_get('/ace/streams', self.handle_streams)
+        self.app.router.add_get('/ace/startup', self.handle_startup)
+        self.app.router.add_get('/metrics', self.handle_metrics)
+        self.app.router.add_post('/ace/warm', self.handle_warm)
+        self.app.router.add_get('/ace/hls/{key}/index.m3u8', self.handle_hls_playlist)
+        self.app.router.add_get(r'/ace/hls/{key}/{sequence:\d+}.ts', self.handle_hls_segment)
+        self.app.router.add_get('/ace/manifest.m3u8', self.handle_manifest)
+        self.app.router.add_get(r'/ace/manifest/{key}/{epoch:\d+}/{sequence:\d+}.ts',
+                                self.handle_manifest_segment)
         
         self.runner = web.AppRunner(self.app)
         await self.runner.setup()
         
-        self.site = web.TCPSite(self.runner, self.listen_host, self.listen_port)
-        await self.site.start()
-        
-        logger.info(f"Aiohttp streaming server started on {self.listen_host}:{self.listen_port}")
-        logger.info(f"Connecting to AceStream at {self.scheme}://{self.acestream_host}:{self.acestream_port}")
-        logger.info(f"Using NATIVE PYACEXY pattern (direct write, no queues)")
+        if self.worker_ports:
+            # Shared port, the kernel spreads connections over workers; plus this worker's own port
+            self.site = web.TCPSite(self.runner, self.listen_host, self.listen_port, reuse_port=True)
+            await self.site.start()
+            private_port = self.worker_ports[self.worker_index]
+            self.private_site = web.TCPSite(self.runner, self.listen_host, private_port)
+            await self.private_site.start()
+            logger.info(f"Streaming worker {self.worker_index} started on {self.listen_host}:{self.listen_port} "
+                        f"(own port {private_port})")
+        else:
+            self.site = web.TCPSite(self.runner, self.listen_host, self.listen_port)
+            await self.site.start()
+            logger.info(f"Aiohttp streaming server started on {self.listen_host}:{self.listen_port}")
+        logger.info(f"Connecting to AceStream engine(s): {', '.join(e.base_url for e in self.engine_pool.engines)}")
+        logger.info(f"Using ring buffer fan-out ({self.buffer_size} bytes per stream, one writer per client)")
     
     async def stop(self):
         """Stop the aiohttp streaming server"""
         logger.info("Stopping aiohttp streaming server...")
         
+        if self._loop_lag_task:
+            self._loop_lag_task.cancel()
+            self._loop_lag_task = None
+        await self.idle_tracker.stop()
+        
         # Close all streams
+        fetch_tasks = []
         async with self.streams_lock:
             for stream in list(self.streams.values()):
+                if stream.linger_handle:
+                    stream.linger_handle.cancel()
                 stream.done.set()
+                stream.wake_writers()
                 if stream.fetch_task and not stream.fetch_task.done():
                     stream.fetch_task.cancel()
+                    fetch_tasks.append(stream.fetch_task)
+        
+        # Let readers send method=stop before the session goes away
+        if fetch_tasks:
+            await asyncio.gather(*fetch_tasks, return_exceptions=True)
+        await self.hls_proxy.stop()
         
         if self.session:
             await self.session.close()
         
+        if self._owns_engine_pool:
+            await self.engine_pool.stop()
+        
         if self.runner:
             await self.runner.cleanup()
         
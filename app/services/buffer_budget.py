@@ -0,0 +1,93 @@
+"""
+Process-wide memory budget for stream buffers
+"""
+import logging
+import threading
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class BufferBudgetExceeded(Exception):
+    """No buffer memory left for a new stream or client"""
+    pass
+
+
+class BufferAllocation:
+    """Buffer memory granted to one stream (or client queue)"""
+
+    __slots__ = ('key', 'size')
+
+    def __init__(self, key: str, size: int):
+        self.key = key
+        self.size = size
+
+
+class BufferBudget:
+    """
+    Accounts the memory of every stream buffer against one limit
+
+    A buffer gets the size it asks for while the budget allows it. Past that it
+    is shrunk to whatever is left, down to its minimum size (a shorter backlog
+    for late joiners and slow clients), and below the minimum reserve() fails:
+    the caller can free memory (evict idle streams) and retry, or reject the
+    stream. A limit of 0 only accounts, it never shrinks or rejects.
+
+    Thread-safe, so a streaming server on its own thread and the API can share it.
+    """
+
+    def __init__(self, limit: int = 0, packet_size: int = 188):
+        self.limit = limit
+        self.packet_size = packet_size  # Shrunk sizes stay whole MPEG-TS packets
+        self.used = 0
+        self.allocations: Set[BufferAllocation] = set()
+        self.shrunk = 0
+        self.rejected = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> Optional[int]:
+        """Bytes left, or None without a limit"""
+        return None if self.limit <= 0 else max(0, self.limit - self.used)
+
+    def reserve(self, key: str, size: int, minimum: int) -> Optional[BufferAllocation]:
+        """Grant up to size bytes (at least minimum) to key, or None when they do not fit"""
+        with self._lock:
+            granted = size
+            available = self.available
+            if available is not None and available < size:
+                granted = available - available % self.packet_size
+                if granted < minimum:
+                    return None
+                self.shrunk += 1
+                logger.warning(f"Buffer budget almost used up, {key} gets {granted} of {size} bytes")
+            allocation = BufferAllocation(key, granted)
+            self.allocations.add(allocation)
+            self.used += granted
+            return allocation
+
+    def release(self, allocation: Optional[BufferAllocation]):
+        """Return the memory of an allocation (safe to call more than once)"""
+        if allocation is None:
+            return
+        with self._lock:
+            if allocation in self.allocations:
+                self.allocations.discard(allocation)
+                self.used -= allocation.size
+
+    def snapshot(self) -> dict:
+        """Usage as plain data, with the bytes held per stream"""
+        with self._lock:
+            per_stream: Dict[str, int] = {}
+            for allocation in self.allocations:
+                per_stream[allocation.key] = per_stream.get(allocation.key, 0) + allocation.size
+            return {
+                'limit': self.limit,
+                'used': self.used,
+                'available': self.available,
+                'shrunk': self.shrunk,
+                'rejected': self.rejected,
+                'evicted': self.evicted,
+                'streams': per_stream,
+            }
@@ -0,0 +1,349 @@
+"""
+Channel liveness checks: which channels are online, written back to the channels table
+"""
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from sqlalchemy import or_, update
+
+from app.models import Channel
+from app.services.engine_pool import AceEngine, EnginePool
+from app.services.stream_info_cache import StreamInfoCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChannelCheckResult:
+    """Outcome of one channel check"""
+    channel_id: int
+    is_online: bool
+    error: Optional[str]
+    checked_at: datetime
+
+    def to_mapping(self) -> dict:
+        """Row for a bulk UPDATE of the channels table"""
+        return {
+            "id": self.channel_id,
+            "is_online": self.is_online,
+            "last_error": self.error,
+            "last_checked": self.checked_at,
+        }
+
+
+def channels_to_check(db, max_age: Optional[float] = None, acestream: bool = True) -> List[Tuple[int, str, str]]:
+    """
+    Active channels to check, never checked first, then the least recently checked
+
+    Args:
+        max_age: Only channels not checked for this many seconds (None: all of them)
+        acestream: Include AceStream channels (False without an engine)
+
+    Returns:
+        (channel id, kind, target) tuples, kind "ace" (target: content id) or "http" (target: URL)
+    """
+    query = db.query(Channel.id, Channel.acestream_id, Channel.stream_url).filter(Channel.is_active == True)
+    if max_age is not None:
+        cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+        query = query.filter(or_(Channel.last_checked.is_(None), Channel.last_checked < cutoff))
+    query = query.order_by(Channel.last_checked.is_not(None), Channel.last_checked, Channel.id)
+
+    targets = []
+    for channel_id, acestream_id, stream_url in query:
+        if acestream_id:
+            if acestream:
+                targets.append((channel_id, "ace", acestream_id))
+        elif stream_url and stream_url.startswith(("http://", "https://")):
+            targets.append((channel_id, "http", stream_url))
+    return targets
+
+
+def persist_check_results(db, results: List[ChannelCheckResult]) -> int:
+    """Write a batch of check results in one bulk UPDATE, returns the number of rows"""
+    if not results:
+        return 0
+    db.execute(update(Channel), [result.to_mapping() for result in results])
+    db.commit()
+    return len(results)
+
+
+class ChannelChecker:
+    """
+    Checks whether channels can be played
+
+    AceStream channels are started on an engine with getstream?format=json and
+    stopped again right away (method=stop); HTTP channels get a HEAD request, or
+    a one byte range GET when the server does not answer HEAD. Channels that are
+    being streamed right now, or started recently, are online without a check,
+    channels that failed to start moments ago are offline (StreamInfoCache,
+    shared with the streaming server, which in turn learns from the checks).
+
+    A round puts every channel due for a check, stalest first, on a queue served
+    by `concurrency` workers. At most `per_host` checks run against one engine
+    (or one HTTP host) at a time, so a round never starts hundreds of sessions
+    on an engine that is also serving viewers. Results are written back every
+    `batch_size` channels.
+    """
+
+    def __init__(
+        self,
+        engine_pool: Optional[EnginePool] = None,
+        streaming_server=None,
+        stream_info_cache: Optional[StreamInfoCache] = None,
+        interval: float = 3600.0,
+        concurrency: int = 16,
+        per_host: int = 4,
+        timeout: float = 20.0,
+        batch_size: int = 50,
+    ):
+        self.engine_pool = engine_pool
+        self.streaming_server = streaming_server
+        self.stream_info_cache = stream_info_cache or StreamInfoCache()
+        self.interval = interval
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.endpoint = "/ace/getstream"
+
+        self.running = False
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._round: Optional[asyncio.Task] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._engine_checks: Dict[str, int] = {}  # Engine key -> checks in flight
+        self.progress: dict = {}
+
+    async def start(self):
+        self.session = aiohttp.ClientSession()
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+        if self._round and not self._round.done():
+            self._round.cancel()
+            try:
+                await self._round
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    @property
+    def checking(self) -> bool:
+        return self._round is not None and not self._round.done()
+
+    def trigger(self, max_age: Optional[float] = None) -> bool:
+        """Start a round in the background; False when one is already running"""
+        if self.checking:
+            return False
+        self._round = asyncio.create_task(self.check_channels(max_age))
+        self._round.add_done_callback(self._round_done)
+        return True
+
+    @staticmethod
+    def _round_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Channel check failed: {task.exception()}")
+
+    def snapshot(self) -> dict:
+        """Progress of the current or last round"""
+        return {"running": self.checking, **self.progress}
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return limit
+
+    async def _streaming_keys(self) -> set:
+        """Keys of the streams being served right now"""
+        if self.streaming_server is None:
+            return set()
+        try:
+            return {stream["stream_id"] for stream in await self.streaming_server.streams_snapshot()}
+        except Exception as e:
+            logger.warning(f"Could not list active streams: {e}")
+            return set()
+
+    async def check_channels(self, max_age: Optional[float] = None) -> dict:
+        """
+        Run one check round and write the results back
+
+        Args:
+            max_age: Only check channels not checked for this many seconds (None: all)
+        """
+        from app.utils.auth import SessionLocal
+
+        db = SessionLocal()
+        try:
+            targets = channels_to_check(db, max_age, acestream=self.engine_pool is not None)
+        finally:
+            db.close()
+
+        started = datetime.utcnow()
+        self.progress = {
+            "started_at": started.isoformat(),
+            "finished_at": None,
+            "total": len(targets),
+            "checked": 0,
+            "online": 0,
+            "offline": 0,
+        }
+        if not targets:
+            self.progress["finished_at"] = started.isoformat()
+            return self.progress
+        logger.info(f"Checking {len(targets)} channel(s)")
+
+        streaming = await self._streaming_keys()
+        queue: asyncio.Queue = asyncio.Queue()
+        for target in targets:
+            queue.put_nowait(target)
+        pending: List[ChannelCheckResult] = []
+
+        async def worker():
+            while True:
+                try:
+                    channel_id, kind, target = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                cached = self.stream_info_cache.failure(target)
+                if target in streaming or self.stream_info_cache.started_recently(target):
+                    is_online, error = True, None
+                elif cached is not None:
+                    is_online, error = False, cached.error
+                else:
+                    is_online, error = await self._check(kind, target)
+                    if is_online:
+                        self.stream_info_cache.record_success(target)
+                    else:
+                        self.stream_info_cache.record_failure(target, error)
+                pending.append(ChannelCheckResult(channel_id, is_online, error, datetime.utcnow()))
+                self.progress["checked"] += 1
+                self.progress["online" if is_online else "offline"] += 1
+                if len(pending) >= self.batch_size:
+                    self._flush(pending)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(targets)))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            self._flush(pending)
+
+        self.progress["finished_at"] = datetime.utcnow().isoformat()
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        logger.info(f"Channel check finished in {elapsed:.1f}s: {self.progress['online']} online, "
+                    f"{self.progress['offline']} offline")
+        return self.progress
+
+    def _flush(self, pending: List[ChannelCheckResult]):
+        """Write the pending results and empty the list"""
+        from app.utils.auth import SessionLocal
+
+        if not pending:
+            return
+        batch = pending[:]
+        pending.clear()
+        db = SessionLocal()
+        try:
+            persist_check_results(db, batch)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error saving channel check results: {e}")
+        finally:
+            db.close()
+
+    async def _check(self, kind: str, target: str) -> Tuple[bool, Optional[str]]:
+        try:
+            if kind == "ace":
+                return await self._check_acestream(target)
+            return await self._check_http(target)
+        except asyncio.TimeoutError:
+            return False, "Timeout"
+        except aiohttp.ClientError as e:
+            return False, str(e) or type(e).__name__
+        except ValueError as e:
+            return False, f"Invalid response: {e}"
+
+    def _pick_engine(self) -> AceEngine:
+        """Healthy engine with the fewest checks in flight"""
+        candidates = [e for e in self.engine_pool.engines if e.healthy] or self.engine_pool.engines
+        return min(candidates, key=lambda e: self._engine_checks.get(e.key, 0))
+
+    async def _check_acestream(self, content_id: str) -> Tuple[bool, Optional[str]]:
+        """Start the channel on an engine and stop it again"""
+        engine = self._pick_engine()
+        self._engine_checks[engine.key] = self._engine_checks.get(engine.key, 0) + 1
+        try:
+            async with self._host_limit(engine.key):
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+                params = {"format": "json", "id": content_id, "pid": str(uuid.uuid4())}
+                url = f"{engine.base_url}{self.endpoint}"
+                async with self.session.get(url, params=params, timeout=timeout) as response:
+                    if response.status != 200:
+                        return False, f"HTTP {response.status}"
+                    data = await response.json(content_type=None)
+                if not isinstance(data, dict):
+                    return False, "Invalid response from AceStream"
+                if data.get("error"):
+                    return False, str(data["error"])
+                resp = data.get("response")
+                command_url = resp.get("command_url") if isinstance(resp, dict) else None
+                if not command_url:
+                    return False, "Invalid response from AceStream"
+                await self._stop_acestream(command_url)
+                return True, None
+        finally:
+            self._engine_checks[engine.key] -= 1
+
+    async def _stop_acestream(self, command_url: str):
+        try:
+            timeout = aiohttp.ClientTimeout(total=5)
+            async with self.session.get(f"{command_url}?method=stop", timeout=timeout) as response:
+                await response.read()
+        except Exception as e:
+            logger.debug(f"Error stopping check session {command_url}: {e}")
+
+    async def _check_http(self, url: str) -> Tuple[bool, Optional[str]]:
+        """HEAD the URL, or GET its first byte when HEAD is refused, reset or times out"""
+        async with self._host_limit(urlsplit(url).netloc):
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            try:
+                async with self.session.head(url, allow_redirects=True, timeout=timeout) as response:
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.debug(f"HEAD {url} failed ({e!r}), trying GET")
+                status = None
+            if status is None or status >= 400:
+                headers = {"Range": "bytes=0-0"}
+                async with self.session.get(url, headers=headers, timeout=timeout) as response:
+                    status = response.status
+            if status >= 400:
+                return False, f"HTTP {status}"
+            return True, None
+
+    async def auto_check_loop(self):
+        """Automatic check loop: channels not checked for `interval` seconds, stalest first"""
+        logger.info(f"Channel check loop started (interval: {self.interval}s)")
+
+        while self.running:
+            try:
+                self.trigger(self.interval)
+                await asyncio.wait([self._round])
+                await asyncio.sleep(min(self.interval, 300))
+            except asyncio.CancelledError:
+                logger.info("Channel check loop cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error in channel check loop: {e}")
+                await asyncio.sleep(60)
+
+        logger.info("Channel check loop stopped")
@@ -0,0 +1,395 @@
+"""
+Proxy and cache for the engines' own HLS output (/ace/manifest.m3u8)
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin
+
+import aiohttp
+
+from app.services.engine_pool import AceEngine, EnginePool
+from app.services.hls import HLSUnavailable
+from app.services.metrics import StreamingMetrics
+from app.services.stream_info_cache import StreamInfoCache
+
+logger = logging.getLogger(__name__)
+
+# Engine segment URLs remembered per session (a playlist lists far fewer)
+MAX_SEGMENT_URLS = 64
+
+# (stream key, session epoch, media sequence number)
+SegmentKey = Tuple[str, int, int]
+
+
+class SegmentCache:
+    """Least recently used segments, bounded in bytes"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evicted = 0
+        self._segments: "OrderedDict[SegmentKey, bytes]" = OrderedDict()
+
+    def get(self, key: SegmentKey) -> Optional[bytes]:
+        data = self._segments.get(key)
+        if data is not None:
+            self._segments.move_to_end(key)
+        return data
+
+    def put(self, key: SegmentKey, data: bytes):
+        if len(data) > self.max_bytes or key in self._segments:
+            return
+        self._segments[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, oldest = self._segments.popitem(last=False)
+            self.size -= len(oldest)
+            self.evicted += 1
+
+    def discard_stream(self, stream_key: str):
+        """Forget every segment of a stream"""
+        for key in [key for key in self._segments if key[0] == stream_key]:
+            self.size -= len(self._segments.pop(key))
+
+    def snapshot(self) -> dict:
+        return {
+            'max_bytes': self.max_bytes,
+            'bytes': self.size,
+            'segments': len(self._segments),
+            'evicted': self.evicted,
+        }
+
+
+class EngineHLSSession:
+    """One engine HLS session (manifest.m3u8) shared by all viewers of a stream"""
+
+    def __init__(self, key: str, engine: AceEngine, manifest_url: str, command_url: str, stat_url: str,
+                 epoch: int):
+        self.key = key
+        self.engine = engine
+        self.manifest_url = manifest_url
+        self.command_url = command_url
+        self.stat_url = stat_url
+        self.epoch = epoch  # In segment URIs: they differ between two sessions of a stream
+        self.created_at = datetime.now()
+        self.segment_urls: "OrderedDict[int, str]" = OrderedDict()  # Media sequence -> engine URL
+        self.sequences: Dict[str, int] = {}  # Engine URL -> media sequence
+        self.next_sequence = 0
+        self.playlist: Optional[str] = None  # Rewritten playlist
+        self.playlist_expires = 0.0
+        self.playlist_ttl = 1.0
+        self.refresh: Optional[asyncio.Future] = None  # Playlist fetch in flight
+        self.handle: Optional[asyncio.TimerHandle] = None
+        self.stopped = False
+        self.last_request = time.monotonic()
+        self.viewers: Dict[Tuple[str, str, str], Tuple[datetime, float]] = {}  # -> (first seen, last seen)
+
+    def seen(self, ip: str, user_agent: str, username: str):
+        self.last_request = now = time.monotonic()
+        viewer = (ip, user_agent, username)
+        first_seen = self.viewers[viewer][0] if viewer in self.viewers else datetime.now()
+        self.viewers[viewer] = (first_seen, now)
+
+    def active_viewers(self, timeout: float) -> List[dict]:
+        cutoff = time.monotonic() - timeout
+        for viewer in [v for v, (_, last_seen) in self.viewers.items() if last_seen < cutoff]:
+            del self.viewers[viewer]
+        return [{
+            'username': username,
+            'ip': ip,
+            'user_agent': user_agent,
+            'connected_at': first_seen.isoformat(),
+        } for (ip, user_agent, username), (first_seen, _) in self.viewers.items()]
+
+
+class EngineHLSProxy:
+    """
+    Serves the HLS output of the engines (/ace/manifest.m3u8) to any number of viewers
+
+    Every stream gets one engine session, whatever the number of viewers. Its
+    playlist is fetched at most once per half target duration and rewritten
+    so that segment URIs point at this server: manifest/{key}/{epoch}/{sequence}.ts,
+    relative to /ace/manifest.m3u8. Each engine segment is fetched once
+    (concurrent requests wait for the same fetch) into an LRU cache bounded
+    in bytes, and every viewer is served from memory. The epoch (session
+    start, Unix time, increasing) and our own sequence numbers keep segment
+    URIs unique across engine sessions, so they can be cached for good.
+
+    A session is stopped on the engine when its playlist and segments have
+    not been requested for idle_timeout seconds. Start failures go through
+    the StreamInfoCache shared with the TS streams.
+    """
+
+    def __init__(self, engine_pool: EnginePool, stream_info_cache: StreamInfoCache,
+                 metrics: StreamingMetrics, cache_bytes: int = 64 * 1024 * 1024,
+                 idle_timeout: float = 30.0, timeout: float = 10.0):
+        self.engine_pool = engine_pool
+        self.stream_info_cache = stream_info_cache
+        self.metrics = metrics
+        self.cache = SegmentCache(cache_bytes)
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.endpoint = "/ace/manifest.m3u8"
+        self.session: Optional[aiohttp.ClientSession] = None  # The streaming server's, set on start
+        self.sessions: Dict[str, EngineHLSSession] = {}
+        self._pending: Dict[str, asyncio.Future] = {}  # Single-flight session start per key
+        self._inflight: Dict[SegmentKey, asyncio.Future] = {}  # Single-flight segment fetch
+        self._stopping: Set[asyncio.Task] = set()
+        self._epoch = 0
+
+    @staticmethod
+    def _pool_key(key: str) -> str:
+        """Engine pool key of a session (the TS stream of the same id is a separate session)"""
+        return f"hls:{key}"
+
+    async def playlist(self, key: str, client_ip: str, user_agent: str, username: str = "Anonymous",
+                       extra_params: Optional[dict] = None) -> str:
+        """
+        Rewritten engine playlist of a stream, starting an engine session if needed
+
+        Raises:
+            StreamUnavailable: If the engine failed to start the stream moments ago
+            HLSUnavailable: If the engine did not deliver a playlist
+            Exception: If the engine could not start the stream
+        """
+        self.metrics.hls_proxy_playlists += 1
+        session = await self._get_or_create(key, extra_params or {})
+        session.seen(client_ip, user_agent, username)
+        try:
+            return await self._current_playlist(session)
+        except (HLSUnavailable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await self._fail_session(session, e)
+            if session.playlist is None:
+                raise
+        # The engine dropped a session that was working (engine restart): start a new one, once
+        logger.warning(f"Engine HLS session {key} broke, starting a new one")
+        session = await self._get_or_create(key, extra_params or {})
+        session.seen(client_ip, user_agent, username)
+        try:
+            return await self._current_playlist(session)
+        except (HLSUnavailable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await self._fail_session(session, e)
+            raise
+
+    async def _current_playlist(self, session: EngineHLSSession) -> str:
+        """The session's playlist, refreshed from the engine when it expired (single-flight)"""
+        if session.playlist is None or time.monotonic() >= session.playlist_expires:
+            if session.refresh is None or session.refresh.done():
+                session.refresh = asyncio.ensure_future(self._refresh(session))
+            await asyncio.shield(session.refresh)
+        return session.playlist
+
+    async def _fail_session(self, session: EngineHLSSession, error: Exception):
+        """Drop a session the engine no longer serves; a session that never delivered counts as a start failure"""
+        if session.stopped:
+            return
+        logger.warning(f"Engine HLS session {session.key} failed: {error}")
+        self.metrics.engine_errors += 1
+        if session.playlist is None:
+            self.stream_info_cache.record_failure(session.key, str(error))
+        await self._stop_session(session)
+
+    async def segment(self, key: str, epoch: int, sequence: int) -> Optional[bytes]:
+        """
+        A segment, from the cache or fetched once from the engine; None when unknown
+
+        Raises:
+            HLSUnavailable: If the engine did not deliver it
+        """
+        segment_key = (key, epoch, sequence)
+        session = self.sessions.get(key)
+        if session is not None:
+            session.last_request = time.monotonic()
+        data = self.cache.get(segment_key)
+        if data is None:
+            future = self._inflight.get(segment_key)
+            if future is None:
+                if session is None or session.epoch != epoch or sequence not in session.segment_urls:
+                    return None
+                future = asyncio.ensure_future(self._fetch_segment(segment_key, session.segment_urls[sequence]))
+                self._inflight[segment_key] = future
+                future.add_done_callback(lambda _: self._inflight.pop(segment_key, None))
+            try:
+                data = await asyncio.shield(future)
+            except (HLSUnavailable, aiohttp.ClientError, asyncio.TimeoutError):
+                if session is not None:
+                    session.playlist_expires = 0.0  # Check the session on the next playlist request
+                raise
+        self.metrics.hls_proxy_segments_served += 1
+        self.metrics.hls_proxy_bytes += len(data)
+        return data
+
+    async def _fetch_segment(self, segment_key: SegmentKey, url: str) -> bytes:
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with self.session.get(url, timeout=timeout) as response:
+            if response.status != 200:
+                raise HLSUnavailable(f"Engine returned {response.status} for segment {segment_key[2]}")
+            data = await response.read()
+        self.metrics.hls_proxy_segments_fetched += 1
+        self.metrics.upstream_bytes += len(data)
+        self.cache.put(segment_key, data)
+        return data
+
+    async def _refresh(self, session: EngineHLSSession):
+        """Fetch and rewrite the engine playlist"""
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with self.session.get(session.manifest_url, timeout=timeout) as response:
+            if response.status != 200:
+                raise HLSUnavailable(f"Engine returned {response.status} for the playlist of {session.key}")
+            text = await response.text()
+        self.metrics.hls_proxy_playlists_fetched += 1
+        session.playlist = self._rewrite(session, text)
+        session.playlist_expires = time.monotonic() + session.playlist_ttl
+
+    def _rewrite(self, session: EngineHLSSession, text: str) -> str:
+        """
+        Point the segment URIs of an engine playlist at this server, remembering the engine URLs
+
+        Media sequence numbers are our own, one per engine segment URL in order of
+        appearance: they keep increasing whatever the engine puts (or omits) in
+        #EXT-X-MEDIA-SEQUENCE, so a cached segment is never served under another's URI.
+        """
+        lines = []
+        first_sequence = None
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                continue
+            if line.startswith("#EXT-X-TARGETDURATION:"):
+                try:
+                    session.playlist_ttl = max(0.5, float(line.split(":", 1)[1]) / 2)
+                except ValueError:
+                    logger.debug(f"Malformed engine playlist tag for {session.key}: {line}")
+            elif line and not line.startswith("#"):
+                url = urljoin(session.manifest_url, line)
+                sequence = session.sequences.get(url)
+                if sequence is None:
+                    sequence = session.sequences[url] = session.next_sequence
+                    session.segment_urls[sequence] = url
+                    session.next_sequence += 1
+                if first_sequence is None:
+                    first_sequence = sequence
+                line = f"manifest/{session.key}/{session.epoch}/{sequence}.ts"
+            lines.append(line)
+        while len(session.segment_urls) > MAX_SEGMENT_URLS:
+            _, url = session.segment_urls.popitem(last=False)
+            session.sequences.pop(url, None)
+        media_sequence = f"#EXT-X-MEDIA-SEQUENCE:{session.next_sequence if first_sequence is None else first_sequence}"
+        lines.insert(1 if lines and lines[0] == "#EXTM3U" else 0, media_sequence)
+        return "\n".join(lines) + "\n"
+
+    async def _get_or_create(self, key: str, extra_params: dict) -> EngineHLSSession:
+        """The session of key, started on an engine if needed (single-flight)"""
+        session = self.sessions.get(key)
+        if session is not None:
+            return session
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        error = self.stream_info_cache.failure(key)
+        if error is not None:
+            self.metrics.starts_refused += 1
+            raise error
+
+        pending = self._pending[key] = asyncio.get_event_loop().create_future()
+        engine = self.engine_pool.place(self._pool_key(key))
+        logger.info(f"Starting engine HLS session for {key} on engine {engine.key}")
+        try:
+            session = await self._start(key, extra_params, engine)
+            self.engine_pool.attach(self._pool_key(key), engine, session.stat_url)
+            self.sessions[key] = session
+            self._schedule_expiry(session)
+            pending.set_result(session)
+            return session
+        except asyncio.CancelledError:
+            self.engine_pool.detach(self._pool_key(key), engine)
+            pending.cancel()
+            raise
+        except Exception as e:
+            self.engine_pool.detach(self._pool_key(key), engine)
+            self.engine_pool.report_failure(engine)
+            self.metrics.engine_errors += 1
+            self.stream_info_cache.record_failure(key, str(e))
+            pending.set_exception(e)
+            pending.exception()  # Mark as retrieved when nobody else was waiting
+            raise
+        finally:
+            self._pending.pop(key, None)
+
+    async def _start(self, key: str, extra_params: dict, engine: AceEngine) -> EngineHLSSession:
+        """Ask the engine for the HLS output of a stream (manifest.m3u8?format=json)"""
+        params = dict(extra_params, format='json', pid=str(uuid.uuid4()), id=key)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with self.session.get(f"{engine.base_url}{self.endpoint}", params=params,
+                                    timeout=timeout) as response:
+            if response.status != 200:
+                raise Exception(f"AceStream returned {response.status}: {await response.text()}")
+            data = await response.json(content_type=None)
+        if data.get('error'):
+            raise Exception(f"AceStream error: {data['error']}")
+        if 'response' not in data:
+            raise Exception("Invalid response from AceStream")
+        resp = data['response']
+        self.stream_info_cache.record_success(key)
+        # Sessions started within the same second still get different epochs
+        self._epoch = max(int(time.time()), self._epoch + 1)
+        return EngineHLSSession(key, engine, resp['playback_url'], resp.get('command_url', ''),
+                                resp.get('stat_url', ''), self._epoch)
+
+    def _schedule_expiry(self, session: EngineHLSSession, delay: Optional[float] = None):
+        loop = asyncio.get_event_loop()
+        session.handle = loop.call_later(delay or self.idle_timeout, self._expire, session)
+
+    def _expire(self, session: EngineHLSSession):
+        """Expiry timer callback: stop the session when nobody requested it for idle_timeout"""
+        idle = time.monotonic() - session.last_request
+        if idle < self.idle_timeout:
+            self._schedule_expiry(session, self.idle_timeout - idle)
+            return
+        logger.info(f"No requests for engine HLS session {session.key} in {self.idle_timeout:.0f}s, stopping")
+        task = asyncio.ensure_future(self._stop_session(session))
+        self._stopping.add(task)
+        task.add_done_callback(self._stopping.discard)
+
+    async def _stop_session(self, session: EngineHLSSession):
+        if session.stopped:
+            return
+        session.stopped = True
+        if session.handle:
+            session.handle.cancel()
+            session.handle = None
+        if self.sessions.get(session.key) is session:
+            del self.sessions[session.key]
+        self.cache.discard_stream(session.key)
+        self.engine_pool.detach(self._pool_key(session.key), session.engine)
+        if not session.command_url:
+            return
+        try:
+            timeout = aiohttp.ClientTimeout(total=5)
+            async with self.session.get(f"{session.command_url}?method=stop", timeout=timeout) as response:
+                await response.read()
+        except Exception as e:
+            logger.warning(f"Exception while stopping engine HLS session {session.key}: {e}")
+
+    async def stop(self):
+        """Stop every engine session"""
+        await asyncio.gather(*(self._stop_session(session) for session in list(self.sessions.values())),
+                             *self._stopping, return_exceptions=True)
+
+    def snapshot(self) -> List[dict]:
+        """Engine HLS sessions as streams_snapshot entries"""
+        return [{
+            'stream_id': session.key,
+            'source': 'engine_hls',
+            'clients': session.active_viewers(self.idle_timeout),
+            'created_at': session.created_at.isoformat(),
+            'is_active': True,
+            'warm': False,
+            'hls_viewers': [],
+        } for session in self.sessions.values()]
@@ -0,0 +1,248 @@
+"""
+AceStream engine pool with health checks and load-aware stream placement
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import ClientSession
+
+logger = logging.getLogger(__name__)
+
+
+async def check_engine_health(session: ClientSession, base_url: str) -> dict:
+    """Check AceStream engine health status"""
+    try:
+        url = f"{base_url}/webui/api/service?method=get_version"
+        timeout = aiohttp.ClientTimeout(total=5)
+
+        async with session.get(url, timeout=timeout) as response:
+            if response.status != 200:
+                return {
+                    "status": "error",
+                    "available": False,
+                    "message": f"HTTP {response.status}"
+                }
+
+            data = await response.json()
+
+            # Check if error is null (successful response)
+            if data.get("error") is None:
+                return {
+                    "status": "healthy",
+                    "available": True,
+                    "version": data.get("result", {}).get("version", "unknown"),
+                    "platform": data.get("result", {}).get("platform", "unknown")
+                }
+            else:
+                return {
+                    "status": "error",
+                    "available": False,
+                    "message": data.get("error", "Unknown error")
+                }
+    except asyncio.TimeoutError:
+        return {
+            "status": "timeout",
+            "available": False,
+            "message": "Connection timeout"
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "available": False,
+            "message": str(e)
+        }
+
+
+class AceEngine:
+    """One AceStream engine with its last known health and load"""
+
+    def __init__(self, host: str, port: int, scheme: str = "http"):
+        self.host = host
+        self.port = port
+        self.scheme = scheme
+        self.base_url = f"{scheme}://{host}:{port}"
+
+        self.healthy = True  # Optimistic until the first health check
+        self.health: dict = {}
+        self.failures = 0  # Consecutive stream start failures
+        self.streams: Dict[str, str] = {}  # Stream key -> stat_url of streams placed here
+        self.speed_down = 0  # Sum of speed_down (KB/s) over its streams
+        self.peers = 0
+        self.last_checked: Optional[datetime] = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def load(self) -> Tuple[int, int]:
+        """Placement score, lower is better: active streams, then download speed"""
+        return (len(self.streams), self.speed_down)
+
+    def to_dict(self) -> dict:
+        return {
+            "engine": self.key,
+            "healthy": self.healthy,
+            "status": self.health.get("status", "unknown"),
+            "version": self.health.get("version"),
+            "active_streams": len(self.streams),
+            "speed_down": self.speed_down,
+            "peers": self.peers,
+            "last_checked": self.last_checked.isoformat() if self.last_checked else None,
+        }
+
+
+class EnginePool:
+    """
+    Pool of AceStream engines
+
+    New streams are placed on the healthy engine with the lowest live load
+    (streams served, then download speed polled from each stream's stat_url).
+    A stream stays pinned to its engine for as long as it is attached.
+
+    Thread-safe, so a streaming server on its own thread and the API can share it:
+    place() picks and pins an engine in one step, so starts on both loops see
+    each other's load.
+    """
+
+    def __init__(
+        self,
+        engines: List[Tuple[str, int]],
+        check_interval: float = 30.0,
+        max_failures: int = 3,
+        scheme: str = "http",
+    ):
+        if not engines:
+            raise ValueError("At least one AceStream engine is required")
+        self.engines = [AceEngine(host, port, scheme) for host, port in engines]
+        self.check_interval = check_interval
+        self.max_failures = max_failures
+        self.session: Optional[ClientSession] = None
+        self._check_task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()  # Guards engine.streams, health flags and failure counts
+
+    @property
+    def primary(self) -> AceEngine:
+        return self.engines[0]
+
+    async def start(self):
+        """Start periodic health and load checks"""
+        if self.session is not None:
+            return
+        self.session = ClientSession()
+        await self.refresh()
+        self._check_task = asyncio.create_task(self._check_loop())
+        logger.info(f"Engine pool started with {len(self.engines)} engine(s): "
+                    f"{', '.join(e.key for e in self.engines)}")
+
+    async def stop(self):
+        if self._check_task:
+            self._check_task.cancel()
+            self._check_task = None
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    def engine_for(self, key: str) -> Optional[AceEngine]:
+        """Engine currently serving a stream, if any"""
+        with self._lock:
+            return self._engine_for(key)
+
+    def _engine_for(self, key: str) -> Optional[AceEngine]:
+        for engine in self.engines:
+            if key in engine.streams:
+                return engine
+        return None
+
+    def select(self, key: str) -> AceEngine:
+        """Pick the engine for a stream: the pinned one, else the least loaded healthy one"""
+        with self._lock:
+            return self._select(key)
+
+    def _select(self, key: str) -> AceEngine:
+        pinned = self._engine_for(key)
+        if pinned is not None:
+            return pinned
+        candidates = [e for e in self.engines if e.healthy] or self.engines
+        return min(candidates, key=lambda e: e.load())
+
+    def place(self, key: str) -> AceEngine:
+        """Pick the engine for a new stream and pin the stream to it at once"""
+        with self._lock:
+            engine = self._select(key)
+            engine.streams.setdefault(key, "")
+            engine.failures = 0
+            return engine
+
+    def attach(self, key: str, engine: AceEngine, stat_url: str = ""):
+        """Pin a stream to the engine that serves it"""
+        with self._lock:
+            engine.streams[key] = stat_url
+            engine.failures = 0
+
+    def detach(self, key: str, engine: Optional[AceEngine] = None):
+        """Unpin a stream (its engine session has been stopped)"""
+        engines = [engine] if engine else self.engines
+        with self._lock:
+            for e in engines:
+                e.streams.pop(key, None)
+
+    def report_failure(self, engine: AceEngine):
+        """Count a failed stream start; too many in a row take the engine out of rotation"""
+        with self._lock:
+            engine.failures += 1
+            if not (engine.healthy and engine.failures >= self.max_failures and len(self.engines) > 1):
+                return
+            engine.healthy = False
+        logger.warning(f"AceStream engine {engine.key} marked unhealthy after {engine.failures} failures")
+
+    async def refresh(self):
+        """Check health and load of all engines"""
+        await asyncio.gather(*(self._refresh_engine(engine) for engine in self.engines))
+
+    async def _refresh_engine(self, engine: AceEngine):
+        health = await check_engine_health(self.session, engine.base_url)
+        with self._lock:
+            engine.health = health
+            was_healthy = engine.healthy
+            engine.healthy = health.get("available", False)
+            if engine.healthy:
+                engine.failures = 0
+            stat_urls = list(engine.streams.values())
+        if was_healthy != engine.healthy:
+            logger.info(f"AceStream engine {engine.key} is now {'healthy' if engine.healthy else 'unhealthy'}")
+
+        speed_down = 0
+        peers = 0
+        timeout = aiohttp.ClientTimeout(total=5)
+        for stat_url in stat_urls:
+            if not stat_url:
+                continue
+            try:
+                async with self.session.get(stat_url, timeout=timeout) as response:
+                    if response.status != 200:
+                        continue
+                    data = await response.json(content_type=None)
+                    stats = data.get("response") or {}
+                    speed_down += int(stats.get("speed_down") or 0)
+                    peers += int(stats.get("peers") or 0)
+            except Exception as e:
+                logger.debug(f"Error polling {stat_url}: {e}")
+        engine.speed_down = speed_down
+        engine.peers = peers
+        engine.last_checked = datetime.utcnow()
+
+    async def _check_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error checking AceStream engines: {e}")
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return [engine.to_dict() for engine in self.engines]
@@ -0,0 +1,295 @@
+"""
+HLS packaging of a shared MPEG-TS stream: keyframe-aligned segments and a rolling playlist
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from app.services.buffer_budget import BufferAllocation, BufferBudget
+from app.services.mpegts import TS_PACKET_SIZE, TSInspector
+
+logger = logging.getLogger(__name__)
+
+# Segments kept when buffer memory runs low
+MIN_HLS_WINDOW = 3
+
+# Segments still served after they left the playlist, for players one reload behind
+EXTRA_SEGMENTS = 2
+
+# Segments never exceed this many times segment_seconds (the advertised target duration),
+# they are cut without a keyframe when they reach it
+MAX_SEGMENT_FACTOR = 2
+
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+
+
+class HLSUnavailable(Exception):
+    """The HLS rendition of a stream has no segment to offer (yet)"""
+    pass
+
+
+def with_uri_prefix(playlist: str, prefix: str) -> str:
+    """Playlist with its (relative) segment URIs prefixed, for serving it from another path"""
+    return "\n".join(
+        prefix + line if line and not line.startswith("#") else line
+        for line in playlist.split("\n")
+    )
+
+
+class HLSSegment:
+    """One cut segment: PAT/PMT followed by the stream from a keyframe on"""
+
+    __slots__ = ('sequence', 'data', 'duration', 'discontinuity', 'allocation')
+
+    def __init__(self, sequence: int, data: bytes, duration: float, discontinuity: bool):
+        self.sequence = sequence
+        self.data = data
+        self.duration = duration
+        self.discontinuity = discontinuity  # First segment after an upstream reconnect
+        self.allocation: Optional[BufferAllocation] = None
+
+
+class HLSPackager:
+    """
+    Cuts the aligned TS output of one stream into HLS segments
+
+    Fed with every chunk the stream publishes (whole 188-byte packets). A
+    segment ends on the first keyframe (random access point found by the
+    stream's TSInspector) after segment_seconds of stream, or without one when
+    it reaches the target duration, MAX_SEGMENT_FACTOR times that (audio only,
+    scrambled video, long GOPs). The target duration is fixed for the life of
+    the playlist. Durations come from the stream byte rate, measured from PCR.
+    Every segment starts with the cached PAT/PMT, so it decodes on its own.
+
+    The newest `window` segments are listed in the playlist. All viewers are
+    served the same bytes objects and the playlist is rendered once per new
+    segment, so a viewer costs a lookup per request and nothing per byte.
+    Media sequence numbers start at the current Unix time: segment URIs are
+    never reused when a stream restarts, and stay cacheable by a CDN.
+
+    Segment memory is accounted in the buffer budget; when it runs out, older
+    segments are dropped down to MIN_HLS_WINDOW.
+    """
+
+    def __init__(self, key: str, inspector: TSInspector, byte_rate: Callable[[], float],
+                 segment_seconds: float = 4.0, window: int = 6, budget: Optional[BufferBudget] = None):
+        self.key = key
+        self.inspector = inspector
+        self.byte_rate = byte_rate
+        self.segment_seconds = segment_seconds
+        self.window = window
+        self.budget = budget
+        self.segments: Deque[HLSSegment] = deque()
+        self.sequence = int(time.time())  # Media sequence number of the segment being cut
+        # Must not change once the playlist is out (RFC 8216 4.3.3.1)
+        self.target_duration = max(1, math.ceil(segment_seconds * MAX_SEGMENT_FACTOR))
+        self.segments_cut = 0
+        self.closed = False
+        self.last_request = time.monotonic()
+        self.viewers: Dict[Tuple[str, str, str], Tuple[datetime, float]] = {}  # -> (first seen, last seen)
+        self._parts: List[bytes] = []
+        self._size = 0
+        self._started = False  # False while waiting for the first keyframe
+        self._waited = 0  # Bytes skipped while waiting for it
+        self._discontinuity = False
+        self._dropped_discontinuities = 0
+        self._playlist: Optional[str] = None
+        self._changed = asyncio.Event()
+
+    def _seconds(self, size: int) -> float:
+        byte_rate = self.byte_rate()
+        return size / byte_rate if byte_rate > 0 else 0.0
+
+    def _keyframes(self, start: int, end: int) -> List[int]:
+        """Random access points in [start, end), oldest first"""
+        points = []
+        for point in reversed(self.inspector.random_access_points):
+            if point < start:
+                break
+            if point < end:
+                points.append(point)
+        points.reverse()
+        return points
+
+    def feed(self, packets, offset: int):
+        """Add published packets, offset being the absolute stream offset of their first byte"""
+        if self.closed:
+            return
+        view = memoryview(packets)
+        end = offset + len(view)
+        keyframes = self._keyframes(offset, end)
+
+        pos = offset
+        if not self._started:
+            if keyframes:
+                pos = keyframes.pop(0)
+            else:
+                self._waited += len(view)
+                if self._seconds(self._waited) < MAX_SEGMENT_FACTOR * self.segment_seconds:
+                    return
+            self._started = True
+
+        for point in keyframes:
+            if self._seconds(self._size + point - pos) >= self.segment_seconds:
+                self._append(view[pos - offset:point - offset])
+                self._cut()
+                pos = point
+        self._append(view[pos - offset:])
+
+    def _max_size(self) -> int:
+        """Bytes in a segment of target_duration at the current byte rate (0 while unknown)"""
+        size = int(self.target_duration * self.byte_rate()) // TS_PACKET_SIZE * TS_PACKET_SIZE
+        return max(size, TS_PACKET_SIZE) if size > 0 else 0
+
+    def _append(self, data: memoryview):
+        """Add data to the current segment, cutting it whenever it reaches the target duration"""
+        max_size = self._max_size()
+        while max_size and self._size + len(data) >= max_size:
+            room = max_size - self._size
+            if room > 0:
+                self._parts.append(bytes(data[:room]))
+                self._size += room
+                data = data[room:]
+            self._cut()
+        if data:
+            self._parts.append(bytes(data))
+            self._size += len(data)
+
+    def _cut(self):
+        """Turn the data gathered since the last cut into a segment"""
+        if not self._size:
+            return
+        duration = self._seconds(self._size) or self.segment_seconds
+        segment = HLSSegment(self.sequence, self.inspector.psi_header() + b"".join(self._parts),
+                             duration, self._discontinuity)
+        self.sequence += 1
+        self.segments_cut += 1
+        self._parts = []
+        self._size = 0
+        self._discontinuity = False
+
+        self._account(segment)
+        self.segments.append(segment)
+        while len(self.segments) > self.window + EXTRA_SEGMENTS:
+            self._drop_oldest()
+        self._playlist = None
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _account(self, segment: HLSSegment):
+        """Reserve the segment in the buffer budget, dropping old segments if needed"""
+        if self.budget is None:
+            return
+        size = len(segment.data)
+        allocation = self.budget.reserve(self.key, size, size)
+        while allocation is None and len(self.segments) >= MIN_HLS_WINDOW:
+            self._drop_oldest()
+            allocation = self.budget.reserve(self.key, size, size)
+        if allocation is None:
+            logger.debug(f"Buffer budget exhausted, HLS segment {segment.sequence} of {self.key} not accounted")
+        segment.allocation = allocation
+
+    def _drop_oldest(self):
+        segment = self.segments.popleft()
+        if self.budget is not None:
+            self.budget.release(segment.allocation)
+        if segment.discontinuity:
+            self._dropped_discontinuities += 1
+
+    def discontinuity(self):
+        """The upstream was reconnected: close the current segment, the next one starts on a keyframe"""
+        self._cut()
+        self._started = False
+        self._waited = 0
+        self._discontinuity = True
+
+    def close(self):
+        """Release all segments and wake up waiting requests"""
+        self.closed = True
+        while self.segments:
+            self._drop_oldest()
+        self._parts = []
+        self._playlist = None
+        self._changed.set()
+
+    async def wait_for_segment(self, timeout: float) -> bool:
+        """Wait until there is at least one segment, False on timeout or when closed"""
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while not self.segments and not self.closed:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return bool(self.segments)
+
+    def playlist(self) -> str:
+        """Live media playlist of the newest `window` segments (relative segment URIs)"""
+        if self._playlist is None:
+            listed = list(self.segments)[-self.window:]
+            discontinuities = self._dropped_discontinuities + sum(
+                1 for segment in list(self.segments)[:-self.window] if segment.discontinuity
+            )
+            lines = [
+                "#EXTM3U",
+                "#EXT-X-VERSION:3",
+                f"#EXT-X-TARGETDURATION:{self.target_duration}",
+                f"#EXT-X-MEDIA-SEQUENCE:{listed[0].sequence if listed else self.sequence}",
+                f"#EXT-X-DISCONTINUITY-SEQUENCE:{discontinuities}",
+            ]
+            for segment in listed:
+                if segment.discontinuity:
+                    lines.append("#EXT-X-DISCONTINUITY")
+                lines.append(f"#EXTINF:{segment.duration:.3f},")
+                lines.append(f"{segment.sequence}.ts")
+            self._playlist = "\n".join(lines) + "\n"
+        return self._playlist
+
+    def segment(self, sequence: int) -> Optional[bytes]:
+        """Data of a segment still held, or None"""
+        if not self.segments:
+            return None
+        index = sequence - self.segments[0].sequence
+        if 0 <= index < len(self.segments):
+            return self.segments[index].data
+        return None
+
+    def touch(self):
+        """A playlist or segment was requested"""
+        self.last_request = time.monotonic()
+
+    def seen(self, ip: str, user_agent: str, username: str):
+        """A viewer fetched the playlist"""
+        self.touch()
+        now = self.last_request
+        viewer = (ip, user_agent, username)
+        first_seen = self.viewers[viewer][0] if viewer in self.viewers else datetime.now()
+        self.viewers[viewer] = (first_seen, now)
+
+    def active_viewers(self, timeout: float) -> List[dict]:
+        """Viewers who fetched the playlist in the last timeout seconds, forgetting the others"""
+        cutoff = time.monotonic() - timeout
+        for viewer in [v for v, (_, last_seen) in self.viewers.items() if last_seen < cutoff]:
+            del self.viewers[viewer]
+        return [{
+            'username': username,
+            'ip': ip,
+            'user_agent': user_agent,
+            'connected_at': first_seen.isoformat(),
+        } for (ip, user_agent, username), (first_seen, _) in self.viewers.items()]
+
+    def stats(self) -> dict:
+        return {
+            'segments': len(self.segments),
+            'segments_cut': self.segments_cut,
+            'target_duration': self.target_duration,
+            'media_sequence': self.segments[0].sequence if self.segments else self.sequence,
+            'bytes': sum(len(segment.data) for segment in self.segments),
+        }
@@ -0,0 +1,108 @@
+"""
+Idle client detection on a hashed timer wheel, off the per-chunk path
+"""
+import asyncio
+import logging
+from typing import Callable, Hashable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class IdleEntry:
+    """One tracked client (returned by IdleTracker.track, passed back to untrack)"""
+
+    __slots__ = ('probe', 'on_idle', 'marker', 'misses', 'slot')
+
+    def __init__(self, probe: Callable[[], Optional[Hashable]], on_idle: Callable[[], None]):
+        self.probe = probe
+        self.on_idle = on_idle
+        self.marker: object = IdleTracker._UNSEEN
+        self.misses = 0
+        self.slot: Optional[int] = None
+
+
+class IdleTracker:
+    """
+    Finds clients that stopped making progress, without timestamps per chunk
+
+    Writers keep nothing but their own progress (a ring cursor, a chunk count);
+    each tracked client supplies a probe returning that progress marker, or
+    None while it has nothing to do (waiting for upstream data). A background
+    task advances a wheel of `slots` buckets every `resolution` seconds and
+    probes only the clients in the current bucket, so every client is looked at
+    once per timeout / 2 and the cost depends on the number of clients, not on
+    the chunk rate. A client whose marker did not change over two consecutive
+    checks (between timeout and 1.5 x timeout without progress) is handed to
+    its on_idle callback and forgotten.
+    """
+
+    _UNSEEN = object()
+
+    def __init__(self, timeout: float = 30.0, resolution: float = 1.0):
+        self.timeout = timeout
+        self.resolution = resolution
+        self.slots = max(1, int(round(timeout / 2 / resolution)))
+        self._wheel: List[Set[IdleEntry]] = [set() for _ in range(self.slots)]
+        self._position = 0  # Next bucket to check
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self._wheel)
+
+    def track(self, probe: Callable[[], Optional[Hashable]], on_idle: Callable[[], None]) -> IdleEntry:
+        """Start watching a client, first checked one period from now"""
+        entry = IdleEntry(probe, on_idle)
+        self._schedule(entry)
+        return entry
+
+    def untrack(self, entry: Optional[IdleEntry]):
+        """Stop watching a client (safe to call more than once)"""
+        if entry is not None and entry.slot is not None:
+            self._wheel[entry.slot].discard(entry)
+            entry.slot = None
+
+    def _schedule(self, entry: IdleEntry):
+        # The bucket just before the position is the one checked last, a full period away
+        entry.slot = (self._position - 1) % self.slots
+        self._wheel[entry.slot].add(entry)
+
+    def tick(self):
+        """Check the clients of the current bucket and move to the next one"""
+        due = self._wheel[self._position]
+        self._wheel[self._position] = set()
+        self._position = (self._position + 1) % self.slots
+
+        for entry in due:
+            entry.slot = None
+            marker = entry.probe()
+            if marker is None or marker != entry.marker:
+                entry.marker = marker
+                entry.misses = 0
+            else:
+                entry.misses += 1
+                if entry.misses >= 2:
+                    try:
+                        entry.on_idle()
+                    except Exception as e:
+                        logger.error(f"Error removing idle client: {e}")
+                    continue
+            self._schedule(entry)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.resolution)
+            self.tick()
+
+    def start(self):
+        """Start the background task on the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
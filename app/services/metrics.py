@@ -0,0 +1,239 @@
+"""
+Streaming metrics: counters updated in O(1) on the hot path, Prometheus text output
+"""
+import bisect
+from typing import Dict, List, Optional, Tuple
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; write latency and event loop lag are mostly well below 100 ms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram (bucket counts are not cumulative until rendered)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': dict(zip([str(bound) for bound in self.bounds] + ['+Inf'], self.counts)),
+        }
+
+
+class StreamingMetrics:
+    """
+    Counters and gauges of one streaming server process
+
+    Every field is updated where the event happens (one addition), so a
+    scrape only copies numbers: no locks are taken and no stream or client
+    is walked.
+    """
+
+    def __init__(self):
+        # Counters
+        self.upstream_bytes = 0  # Read from engines / direct HTTP sources
+        self.client_bytes = 0  # Handed to client writers
+        self.client_writes = 0  # Writes those bytes took (one send each, unless the socket is backed up)
+        self.streams_started = 0
+        self.clients_connected = 0
+        self.clients_dropped = 0  # Too slow, lapped by the ring buffer
+        self.clients_stale = 0  # No completed write for too long
+        self.client_skips = 0  # Lagging clients moved forward to a keyframe
+        self.skipped_bytes = 0  # Stream data those clients never received
+        self.reconnects = 0
+        self.engine_errors = 0  # Failed stream info requests, playback errors and timeouts
+        self.starts_refused = 0  # Stream starts answered from a cached engine failure
+        self.cold_starts = 0  # Viewers who had to wait for an upstream session to start
+        self.prewarm_started = 0  # Upstream sessions started by the pre-warmer
+        self.prewarm_hits = 0  # Viewers who found their stream pre-warmed
+        self.prewarm_unused = 0  # Pre-warmed sessions that ended without a viewer
+        self.hls_playlists = 0  # HLS playlist requests
+        self.hls_segments_served = 0  # HLS segment requests answered from the segment window
+        self.hls_bytes = 0  # HLS segment bytes sent
+        self.hls_proxy_playlists = 0  # Engine HLS playlist requests
+        self.hls_proxy_playlists_fetched = 0  # Engine HLS playlists fetched from engines
+        self.hls_proxy_segments_served = 0  # Engine HLS segments sent to viewers
+        self.hls_proxy_segments_fetched = 0  # Engine HLS segments fetched from engines
+        self.hls_proxy_bytes = 0  # Engine HLS segment bytes sent
+
+        # Gauges
+        self.clients = 0
+        self.loop_lag = 0.0  # Last measured event loop lag (seconds)
+
+        # Histograms
+        self.write_latency = Histogram()  # Time a client writer takes to send one chunk (sampled)
+        self.loop_lag_seconds = Histogram()
+
+    def client_attached(self):
+        self.clients_connected += 1
+        self.clients += 1
+
+    def client_detached(self):
+        self.clients -= 1
+
+    def observe_loop_lag(self, lag: float):
+        self.loop_lag = lag
+        self.loop_lag_seconds.observe(lag)
+
+    def to_dict(self, streams: int = 0, startup: Optional[Dict[str, dict]] = None,
+                buffers: Optional[dict] = None) -> dict:
+        """Plain data snapshot; gauges owned by the server are passed in"""
+        return {
+            'upstream_bytes': self.upstream_bytes,
+            'client_bytes': self.client_bytes,
+            'client_writes': self.client_writes,
+            'streams_started': self.streams_started,
+            'clients_connected': self.clients_connected,
+            'clients_dropped': self.clients_dropped,
+            'clients_stale': self.clients_stale,
+            'client_skips': self.client_skips,
+            'skipped_bytes': self.skipped_bytes,
+            'reconnects': self.reconnects,
+            'engine_errors': self.engine_errors,
+            'starts_refused': self.starts_refused,
+            'cold_starts': self.cold_starts,
+            'prewarm_started': self.prewarm_started,
+            'prewarm_hits': self.prewarm_hits,
+            'prewarm_unused': self.prewarm_unused,
+            'hls_playlists': self.hls_playlists,
+            'hls_segments_served': self.hls_segments_served,
+            'hls_bytes': self.hls_bytes,
+            'hls_proxy_playlists': self.hls_proxy_playlists,
+            'hls_proxy_playlists_fetched': self.hls_proxy_playlists_fetched,
+            'hls_proxy_segments_served': self.hls_proxy_segments_served,
+            'hls_proxy_segments_fetched': self.hls_proxy_segments_fetched,
+            'hls_proxy_bytes': self.hls_proxy_bytes,
+            'streams': streams,
+            'clients': self.clients,
+            'loop_lag': round(self.loop_lag, 6),
+            'write_latency': self.write_latency.to_dict(),
+            'loop_lag_seconds': self.loop_lag_seconds.to_dict(),
+            'startup': startup or {},
+            'buffers': buffers or {},
+        }
+
+
+# name, type, help, snapshot field
+_SCALARS = (
+    ('acestream_upstream_bytes_total', 'counter', 'Bytes read from AceStream engines and direct HTTP sources',
+     'upstream_bytes'),
+    ('acestream_client_bytes_total', 'counter', 'Bytes written to clients', 'client_bytes'),
+    ('acestream_client_writes_total', 'counter', 'Writes to clients', 'client_writes'),
+    ('acestream_streams_started_total', 'counter', 'Upstream sessions started', 'streams_started'),
+    ('acestream_clients_connected_total', 'counter', 'Clients attached to a stream', 'clients_connected'),
+    ('acestream_clients_dropped_total', 'counter', 'Clients disconnected for falling behind the buffer',
+     'clients_dropped'),
+    ('acestream_clients_stale_total', 'counter', 'Clients removed after too long without a completed write',
+     'clients_stale'),
+    ('acestream_client_skips_total', 'counter', 'Lagging clients moved forward to the newest keyframe',
+     'client_skips'),
+    ('acestream_client_skipped_bytes_total', 'counter', 'Stream bytes skipped by lagging clients',
+     'skipped_bytes'),
+    ('acestream_reconnects_total', 'counter', 'Upstream reconnects with clients attached', 'reconnects'),
+    ('acestream_engine_errors_total', 'counter',
+     'Failed stream info requests, upstream errors and upstream timeouts', 'engine_errors'),
+    ('acestream_stream_starts_refused_total', 'counter',
+     'Stream starts refused without asking the engine, after a recent failure', 'starts_refused'),
+    ('acestream_cold_starts_total', 'counter', 'Viewers who waited for an upstream session to start',
+     'cold_starts'),
+    ('acestream_prewarm_started_total', 'counter', 'Upstream sessions started by the pre-warmer',
+     'prewarm_started'),
+    ('acestream_prewarm_hits_total', 'counter', 'Viewers who found their stream pre-warmed', 'prewarm_hits'),
+    ('acestream_prewarm_unused_total', 'counter', 'Pre-warmed sessions that ended without a viewer',
+     'prewarm_unused'),
+    ('acestream_hls_playlists_total', 'counter', 'HLS playlist requests', 'hls_playlists'),
+    ('acestream_hls_segments_served_total', 'counter', 'HLS segments served from the segment window',
+     'hls_segments_served'),
+    ('acestream_hls_bytes_total', 'counter', 'HLS segment bytes sent', 'hls_bytes'),
+    ('acestream_hls_proxy_playlists_total', 'counter', 'Engine HLS playlist requests', 'hls_proxy_playlists'),
+    ('acestream_hls_proxy_playlists_fetched_total', 'counter', 'Engine HLS playlists fetched from engines',
+     'hls_proxy_playlists_fetched'),
+    ('acestream_hls_proxy_segments_served_total', 'counter', 'Engine HLS segments sent to viewers',
+     'hls_proxy_segments_served'),
+    ('acestream_hls_proxy_segments_fetched_total', 'counter', 'Engine HLS segments fetched from engines',
+     'hls_proxy_segments_fetched'),
+    ('acestream_hls_proxy_bytes_total', 'counter', 'Engine HLS segment bytes sent', 'hls_proxy_bytes'),
+    ('acestream_streams', 'gauge', 'Active streams', 'streams'),
+    ('acestream_clients', 'gauge', 'Connected clients', 'clients'),
+    ('acestream_event_loop_lag_seconds', 'gauge', 'Last measured event loop lag', 'loop_lag'),
+)
+
+# Buffer budget (see BufferBudget.snapshot)
+_BUFFER_SCALARS = (
+    ('acestream_buffer_bytes', 'gauge', 'Memory held by stream buffers', 'used'),
+    ('acestream_buffer_budget_bytes', 'gauge', 'Memory budget for stream buffers (0: unlimited)', 'limit'),
+    ('acestream_buffers_shrunk_total', 'counter', 'Stream buffers created smaller than configured', 'shrunk'),
+    ('acestream_streams_evicted_total', 'counter', 'Lingering streams stopped to free buffer memory', 'evicted'),
+    ('acestream_streams_rejected_total', 'counter', 'Streams refused for lack of buffer memory', 'rejected'),
+)
+
+_HISTOGRAMS = (
+    ('acestream_client_write_seconds', 'Time taken to write one chunk to a client (one write in 16)', 'write_latency'),
+    ('acestream_event_loop_lag_distribution_seconds', 'Event loop lag', 'loop_lag_seconds'),
+)
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def _render_histogram(lines: List[str], name: str, labels: Dict[str, str], data: dict):
+    cumulative = 0
+    for bound, count in data['buckets'].items():
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+    lines.append(f"{name}_sum{_labels(labels)} {data['sum']}")
+    lines.append(f"{name}_count{_labels(labels)} {data['count']}")
+
+
+def render_prometheus(snapshots: List[dict]) -> str:
+    """
+    Prometheus text exposition of one or more StreamingMetrics snapshots
+
+    Snapshots carrying a 'worker' index (multi-worker mode) get a worker label.
+    """
+    def labels_of(snapshot: dict) -> Dict[str, str]:
+        worker = snapshot.get('worker')
+        return {'worker': str(worker)} if worker is not None else {}
+
+    lines: List[str] = []
+    for name, metric_type, help_text, field in _SCALARS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for snapshot in snapshots:
+            lines.append(f"{name}{_labels(labels_of(snapshot))} {snapshot[field]}")
+
+    for name, metric_type, help_text, field in _BUFFER_SCALARS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for snapshot in snapshots:
+            lines.append(f"{name}{_labels(labels_of(snapshot))} {snapshot['buffers'].get(field, 0)}")
+
+    for name, help_text, field in _HISTOGRAMS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for snapshot in snapshots:
+            _render_histogram(lines, name, labels_of(snapshot), snapshot[field])
+
+    name = 'acestream_stream_start_seconds'
+    lines.append(f"# HELP {name} Stream start time per phase (all channels)")
+    lines.append(f"# TYPE {name} histogram")
+    for snapshot in snapshots:
+        for phase, data in snapshot['startup'].items():
+            _render_histogram(lines, name, {**labels_of(snapshot), 'phase': phase}, data)
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,212 @@
+"""
+Lightweight MPEG-TS inspection for the streaming fan-out
+"""
+from collections import deque
+from typing import Dict, Deque, List, Optional, Set
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+
+PAT_PID = 0x0000
+PCR_CLOCK = 27000000  # PCR ticks per second
+PCR_WRAP = (1 << 33) * 300
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x24, 0x42, 0xEA}
+
+# Per header-byte lookup tables, used with bytes.translate() on strided slices
+# so that only interesting packets are visited from Python code
+_ADAPTATION_TABLE = bytes(1 if (b >> 4) & 0x2 else 0 for b in range(256))
+_PUSI_TABLE = bytes(1 if b & 0x40 else 0 for b in range(256))
+
+
+def _psi_section(packet: bytes) -> Optional[bytes]:
+    """Return the PSI section starting in a packet with payload_unit_start_indicator set"""
+    start = 4
+    if packet[3] & 0x20:
+        start += 1 + packet[4]
+    if start >= TS_PACKET_SIZE:
+        return None
+    start += 1 + packet[start]  # pointer_field
+    if start + 3 > TS_PACKET_SIZE:
+        return None
+    section = packet[start:]
+    section_length = ((section[1] & 0x0F) << 8) | section[2]
+    if 3 + section_length > len(section):
+        return None  # Section spans several packets, not cached
+    return section[:3 + section_length]
+
+
+class TSInspector:
+    """
+    Inspects an MPEG-TS byte stream delivered in arbitrary chunks
+
+    - Realigns output on 188-byte packet boundaries: only whole packets are
+      returned, partial packets are carried over and garbage bytes between
+      packets are dropped while sync is re-acquired.
+    - Caches the latest PAT and PMT packets so joining clients can be given
+      the program tables before any other data.
+    - Remembers offsets of keyframes (random_access_indicator on the video PID).
+    - Tracks PCR on the PCR PID to measure the real stream bitrate.
+
+    Offsets are absolute positions in the aligned output, so they can be used
+    directly as ring buffer cursors when the output is published unchanged.
+    """
+
+    def __init__(self, max_random_access_points: int = 256):
+        self._carry = b''
+        self.output_offset = 0  # Absolute offset of the next aligned output byte
+        self.dropped_bytes = 0
+        self.random_access_points: Deque[int] = deque(maxlen=max_random_access_points)
+
+        self.pat_packet: Optional[bytes] = None
+        self.pmt_packets: Dict[int, bytes] = {}
+        self._pmt_pids: Set[int] = set()
+        self._video_pids: Set[int] = set()
+        self.pcr_pid: Optional[int] = None
+
+        self.bitrate: Optional[float] = None  # bits/second measured from PCR
+        self._pcr_start: Optional[int] = None
+        self._pcr_start_offset = 0
+
+    def feed(self, data) -> bytes:
+        """Inspect a chunk and return the whole, aligned packets it completes"""
+        buf = self._carry + bytes(data) if self._carry else bytes(data)
+        self._carry = b''
+        size = len(buf)
+        parts: List[bytes] = []
+        pos = 0
+
+        while pos < size:
+            if buf[pos] != TS_SYNC_BYTE:
+                new_pos = self._resync(buf, pos)
+                self.dropped_bytes += new_pos - pos
+                pos = new_pos
+                continue
+
+            count = (size - pos) // TS_PACKET_SIZE
+            if count == 0:
+                self._carry = buf[pos:]
+                break
+
+            # Count packets in a row whose sync byte is in place
+            syncs = buf[pos:pos + count * TS_PACKET_SIZE:TS_PACKET_SIZE]
+            aligned = count - len(syncs.lstrip(b'\x47'))
+            run = buf[pos:pos + aligned * TS_PACKET_SIZE]
+            self._inspect(run)
+            parts.append(run)
+            pos += len(run)
+
+        if len(parts) == 1:
+            return parts[0]
+        return b''.join(parts)
+
+    def discontinuity(self):
+        """
+        The source restarted (new upstream session): drop the partial packet
+        carried over and restart the PCR bitrate measurement
+        """
+        self._carry = b''
+        self._pcr_start = None
+
+    def psi_header(self) -> bytes:
+        """Latest PAT followed by the PMTs, or empty if not seen yet"""
+        if self.pat_packet is None:
+            return b''
+        return self.pat_packet + b''.join(self.pmt_packets.values())
+
+    @staticmethod
+    def _resync(buf: bytes, pos: int) -> int:
+        """Find the next position that looks like a packet start"""
+        size = len(buf)
+        pos = buf.find(b'\x47', pos + 1)
+        while pos != -1:
+            following = pos + TS_PACKET_SIZE
+            if following >= size or buf[following] == TS_SYNC_BYTE:
+                return pos
+            pos = buf.find(b'\x47', pos + 1)
+        return size
+
+    def _inspect(self, run: bytes):
+        """Inspect a run of aligned packets and advance the output offset"""
+        base = self.output_offset
+        self.output_offset += len(run)
+
+        # Packets starting a PSI section or PES: look for PAT/PMT
+        pusi = run[1::TS_PACKET_SIZE].translate(_PUSI_TABLE)
+        index = pusi.find(1)
+        while index != -1:
+            p = index * TS_PACKET_SIZE
+            pid = ((run[p + 1] & 0x1F) << 8) | run[p + 2]
+            if pid == PAT_PID:
+                self._on_pat(run[p:p + TS_PACKET_SIZE])
+            elif pid in self._pmt_pids:
+                self._on_pmt(pid, run[p:p + TS_PACKET_SIZE])
+            index = pusi.find(1, index + 1)
+
+        # Packets with an adaptation field: keyframes and PCR
+        adaptation = run[3::TS_PACKET_SIZE].translate(_ADAPTATION_TABLE)
+        index = adaptation.find(1)
+        while index != -1:
+            p = index * TS_PACKET_SIZE
+            if run[p + 4] > 0:
+                flags = run[p + 5]
+                pid = ((run[p + 1] & 0x1F) << 8) | run[p + 2]
+                if flags & 0x40 and (not self._video_pids or pid in self._video_pids):
+                    self.random_access_points.append(base + p)
+                if flags & 0x10 and run[p + 4] >= 7:
+                    if self.pcr_pid is None:
+                        self.pcr_pid = pid
+                    if pid == self.pcr_pid:
+                        self._on_pcr(run, p, base + p)
+            index = adaptation.find(1, index + 1)
+
+    def _on_pat(self, packet: bytes):
+        """Cache PAT and learn the PMT PIDs"""
+        section = _psi_section(packet)
+        if section is None or section[0] != 0x00:
+            return
+        pmt_pids = set()
+        for i in range(8, len(section) - 4, 4):
+            program_number = (section[i] << 8) | section[i + 1]
+            if program_number != 0:
+                pmt_pids.add(((section[i + 2] & 0x1F) << 8) | section[i + 3])
+        self.pat_packet = packet
+        if pmt_pids != self._pmt_pids:
+            self._pmt_pids = pmt_pids
+            self.pmt_packets = {pid: pkt for pid, pkt in self.pmt_packets.items() if pid in pmt_pids}
+
+    def _on_pmt(self, pid: int, packet: bytes):
+        """Cache PMT and learn the PCR and video PIDs"""
+        section = _psi_section(packet)
+        if section is None or section[0] != 0x02 or len(section) < 16:
+            return
+        self.pmt_packets[pid] = packet
+        self.pcr_pid = ((section[8] & 0x1F) << 8) | section[9]
+        i = 12 + (((section[10] & 0x0F) << 8) | section[11])
+        end = len(section) - 4  # CRC32
+        video_pids = set()
+        while i + 5 <= end:
+            if section[i] in VIDEO_STREAM_TYPES:
+                video_pids.add(((section[i + 1] & 0x1F) << 8) | section[i + 2])
+            i += 5 + (((section[i + 3] & 0x0F) << 8) | section[i + 4])
+        self._video_pids = video_pids
+
+    def _on_pcr(self, run: bytes, p: int, offset: int):
+        """Update the bitrate estimate from bytes elapsed between PCR samples"""
+        pcr_base = ((run[p + 6] << 25) | (run[p + 7] << 17) | (run[p + 8] << 9)
+                    | (run[p + 9] << 1) | (run[p + 10] >> 7))
+        pcr = pcr_base * 300 + (((run[p + 10] & 0x01) << 8) | run[p + 11])
+
+        if self._pcr_start is None:
+            self._pcr_start, self._pcr_start_offset = pcr, offset
+            return
+
+        elapsed = (pcr - self._pcr_start) % PCR_WRAP
+        if elapsed == 0:
+            return
+        if elapsed > 10 * PCR_CLOCK:
+            # Discontinuity (channel change, encoder restart): start over
+            self._pcr_start, self._pcr_start_offset = pcr, offset
+            return
+        if elapsed >= PCR_CLOCK:
+            self.bitrate = (offset - self._pcr_start_offset) * 8 * PCR_CLOCK / elapsed
+            self._pcr_start, self._pcr_start_offset = pcr, offset
@@ -0,0 +1,73 @@
+"""
+High-performance profile of the streaming server: uvloop, client socket and upstream connector tuning
+"""
+import asyncio
+import logging
+import socket
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Idle engine connections (stream info, stat and command requests) are kept this long for reuse
+UPSTREAM_KEEPALIVE = 30.0
+
+
+def uvloop_policy():
+    """uvloop's event loop policy, or None when uvloop is not installed"""
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("uvloop is not installed, using the default asyncio event loop")
+        return None
+    return uvloop.EventLoopPolicy()
+
+
+def new_event_loop(performance: bool = False) -> asyncio.AbstractEventLoop:
+    """A new event loop: uvloop in the performance profile when available"""
+    policy = uvloop_policy() if performance else None
+    if policy is not None:
+        return policy.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def install_event_loop(performance: bool = False):
+    """Make the loops created from now on in this process uvloop loops (performance profile)"""
+    policy = uvloop_policy() if performance else None
+    if policy is not None:
+        asyncio.set_event_loop_policy(policy)
+
+
+def tune_client_socket(transport: asyncio.BaseTransport, send_buffer: int = 0):
+    """
+    TCP_NODELAY and a fixed send buffer on a viewer connection
+
+    A send buffer of 0 keeps the kernel's autotuning. A fixed size caps the
+    memory a stalled viewer pins in the kernel and lets the server see
+    backpressure earlier.
+    """
+    sock = transport.get_extra_info('socket') if transport else None
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if send_buffer > 0:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer)
+    except (OSError, AttributeError) as e:
+        logger.debug(f"Could not tune client socket: {e}")
+
+
+def upstream_connector(limit_per_host: int = 0) -> aiohttp.TCPConnector:
+    """
+    Connector for engine and direct HTTP upstreams
+
+    Every stream holds one long-lived connection, so the total is not capped
+    (aiohttp caps it at 100 by default, which queues the 101st stream);
+    limit_per_host (0: unlimited) protects a single engine instead.
+    """
+    return aiohttp.TCPConnector(
+        limit=0,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=UPSTREAM_KEEPALIVE,
+        ttl_dns_cache=300,
+    )
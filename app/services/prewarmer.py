@@ -0,0 +1,166 @@
+"""
+Pre-warming: keep the channels viewers are likely to zap to attached upstream
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.models import Channel
+
+logger = logging.getLogger(__name__)
+
+# neighbors: the channels next to the ones being watched, in playlist order
+# popular:   the most watched channels (viewer time, decaying)
+# mixed:     neighbors first, the rest of the budget for popular channels
+PREWARM_STRATEGIES = ("neighbors", "popular", "mixed")
+
+
+def channel_order(db) -> Dict[str, Tuple[int, List[str]]]:
+    """
+    Playlist position of every active AceStream channel
+
+    Returns:
+        Content id -> (index, ids of its category in display order)
+    """
+    rows = db.query(Channel.acestream_id, Channel.category_id).filter(
+        Channel.is_active == True, Channel.acestream_id.is_not(None)
+    ).order_by(Channel.category_id, Channel.display_order, Channel.name).all()
+
+    categories: Dict[Optional[int], List[str]] = {}
+    for acestream_id, category_id in rows:
+        categories.setdefault(category_id, []).append(acestream_id)
+    order = {}
+    for ids in categories.values():
+        for index, acestream_id in enumerate(ids):
+            order[acestream_id] = (index, ids)
+    return order
+
+
+class PreWarmer:
+    """
+    Keeps up to `streams` likely next channels attached upstream without viewers
+
+    Every `interval` seconds the streams being watched are sampled: their
+    neighbors in the playlist (next, then previous, in the same category) and
+    the channels with the most viewer time (halved every `half_life` seconds)
+    become the warm set, which the streaming server reconciles (set_warm). A
+    viewer joining a warm stream gets data at once instead of waiting for the
+    engine; the streaming server counts those joins (prewarm hits) against the
+    viewers who still had to wait (cold starts), and the warm sessions that
+    ended without a viewer (unused).
+    """
+
+    def __init__(self, streaming_server, streams: int = 4, strategy: str = "mixed",
+                 interval: float = 10.0, half_life: float = 3600.0, order_ttl: float = 300.0):
+        if strategy not in PREWARM_STRATEGIES:
+            raise ValueError(f"Unknown pre-warm strategy: {strategy}")
+        self.streaming_server = streaming_server
+        self.streams = streams
+        self.strategy = strategy
+        self.interval = interval
+        self.half_life = half_life
+        self.order_ttl = order_ttl
+        self.running = False
+        self.popularity: Dict[str, float] = {}  # Content id -> decayed viewer seconds
+        self.warm: List[str] = []
+        self._order: Dict[str, Tuple[int, List[str]]] = {}
+        self._order_loaded = 0.0
+        self._last_sample: Optional[float] = None
+
+    async def start(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+        if self.warm:
+            try:
+                await self.streaming_server.set_warm([])
+            except Exception as e:
+                logger.warning(f"Error releasing pre-warmed streams: {e}")
+            self.warm = []
+
+    def _channel_order(self) -> Dict[str, Tuple[int, List[str]]]:
+        from app.utils.auth import SessionLocal
+
+        if time.monotonic() - self._order_loaded > self.order_ttl:
+            db = SessionLocal()
+            try:
+                self._order = channel_order(db)
+                self._order_loaded = time.monotonic()
+            finally:
+                db.close()
+        return self._order
+
+    def _sample(self, watching: Dict[str, int]):
+        """Add the viewer time since the last sample to the popularity scores"""
+        now = time.monotonic()
+        elapsed = self.interval if self._last_sample is None else now - self._last_sample
+        self._last_sample = now
+        decay = 0.5 ** (elapsed / self.half_life)
+        for key in list(self.popularity):
+            self.popularity[key] *= decay
+            if self.popularity[key] < 1.0:
+                del self.popularity[key]
+        for key, viewers in watching.items():
+            self.popularity[key] = self.popularity.get(key, 0.0) + viewers * elapsed
+
+    def choose(self, watching: Dict[str, int], order: Dict[str, Tuple[int, List[str]]]) -> List[str]:
+        """Warm set for the streams being watched (content id -> viewers)"""
+        chosen: List[str] = []
+
+        def add(key: str):
+            if len(chosen) < self.streams and key not in watching and key not in chosen:
+                chosen.append(key)
+
+        if self.strategy in ("neighbors", "mixed"):
+            for key in sorted(watching, key=watching.get, reverse=True):
+                position = order.get(key)
+                if position is None:
+                    continue
+                index, ids = position
+                if len(ids) > 1:
+                    add(ids[(index + 1) % len(ids)])
+                    add(ids[(index - 1) % len(ids)])
+        if self.strategy in ("popular", "mixed"):
+            for key in sorted(self.popularity, key=self.popularity.get, reverse=True):
+                if key in order:
+                    add(key)
+        return chosen
+
+    async def refresh(self) -> List[str]:
+        """Sample the streams being watched and update the warm set"""
+        watching = {
+            stream["stream_id"]: len(stream["clients"]) + len(stream.get("hls_viewers", []))
+            for stream in await self.streaming_server.streams_snapshot()
+            if stream["source"] == "acestream" and (stream["clients"] or stream.get("hls_viewers"))
+        }
+        self._sample(watching)
+        wanted = self.choose(watching, self._channel_order())
+        self.warm = await self.streaming_server.set_warm(wanted)
+        return self.warm
+
+    def snapshot(self) -> dict:
+        return {
+            "streams": self.streams,
+            "strategy": self.strategy,
+            "warm": list(self.warm),
+        }
+
+    async def auto_warm_loop(self):
+        """Automatic pre-warming loop"""
+        logger.info(f"Pre-warm loop started ({self.streams} stream(s), {self.strategy}, "
+                    f"interval: {self.interval}s)")
+
+        while self.running:
+            try:
+                await asyncio.sleep(self.interval)
+                if self.running:
+                    await self.refresh()
+            except asyncio.CancelledError:
+                logger.info("Pre-warm loop cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error in pre-warm loop: {e}")
+
+        logger.info("Pre-warm loop stopped")
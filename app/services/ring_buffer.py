@@ -0,0 +1,77 @@
+"""
+Preallocated ring buffer shared by all clients of a stream
+"""
+from typing import Optional
+
+
+class RingBuffer:
+    """
+    Fixed-size byte ring buffer with absolute offsets
+
+    The writer appends bytes at ``head`` (total bytes ever written). Readers keep
+    a plain integer cursor (an absolute offset) and get zero-copy memoryviews of
+    the data between their cursor and ``head``. Memory stays at ``capacity``
+    bytes regardless of how many readers there are.
+
+    A view is only valid until the writer laps it: a reader whose cursor falls
+    behind ``tail`` has lost data and must be moved forward or disconnected.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self.head = 0  # Absolute offset of the next byte to be written
+
+    @property
+    def tail(self) -> int:
+        """Absolute offset of the oldest byte still available"""
+        return self.head - self.capacity if self.head > self.capacity else 0
+
+    @property
+    def used(self) -> int:
+        """Number of bytes currently held"""
+        return self.head - self.tail
+
+    def write(self, data) -> None:
+        """Append data, overwriting the oldest bytes when full"""
+        size = len(data)
+        if size == 0:
+            return
+        if size > self.capacity:
+            # Only the newest capacity bytes can be kept
+            skipped = size - self.capacity
+            data = memoryview(data)[skipped:]
+            self.head += skipped
+            size = self.capacity
+
+        pos = self.head % self.capacity
+        first = min(size, self.capacity - pos)
+        self._view[pos:pos + first] = data[:first]
+        if first < size:
+            self._view[:size - first] = data[first:]
+        self.head += size
+
+    def read(self, cursor: int, max_bytes: Optional[int] = None) -> memoryview:
+        """
+        Get a contiguous view starting at cursor (empty when cursor is at head)
+
+        The view stops at head or at the physical end of the buffer, whichever
+        comes first, so a reader may need two calls to cross the wrap point.
+
+        Raises:
+            IndexError: If cursor has been overwritten or is ahead of head
+        """
+        if cursor < self.tail or cursor > self.head:
+            raise IndexError(f"Cursor {cursor} outside buffer [{self.tail}, {self.head}]")
+        pos = cursor % self.capacity
+        size = min(self.head - cursor, self.capacity - pos)
+        if max_bytes is not None:
+            size = min(size, max_bytes)
+        return self._view[pos:pos + size]
+
+    def lag(self, cursor: int) -> int:
+        """Number of bytes between cursor and head"""
+        return self.head - cursor
@@ -0,0 +1,54 @@
+"""
+What to do with a client that falls behind the shared stream buffer
+"""
+from typing import Optional
+
+# skip:       jump the client forward to the newest keyframe (brief glitch)
+# disconnect: drop the client once the buffer laps it (the player reconnects)
+SLOW_CLIENT_POLICIES = ("skip", "disconnect")
+
+
+class SlowClientPolicy:
+    """
+    Lag limit and recovery point for clients of a ring buffer stream
+
+    With "skip", a client more than max_lag_seconds behind the live edge (at
+    most max_lag_fraction of the buffer, so it is caught before being lapped)
+    is moved to the newest random access point in the buffer, or to the live
+    edge when there is none. Its upstream session, and every other viewer of
+    the channel, are not affected.
+    """
+
+    def __init__(self, mode: str = "skip", max_lag_seconds: float = 10.0, max_lag_fraction: float = 0.75):
+        if mode not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy: {mode}")
+        self.mode = mode
+        self.max_lag_seconds = max_lag_seconds
+        self.max_lag_fraction = max_lag_fraction
+
+    def max_lag(self, ongoing) -> int:
+        """
+        Bytes a client of ongoing may lag behind before it is recovered
+
+        Evaluated when a client joins and after every skip, not per chunk.
+        """
+        capacity = ongoing.buffer.capacity
+        if self.mode != "skip":
+            return capacity  # Only a lapped client is handled
+        limit = int(capacity * self.max_lag_fraction)
+        byte_rate = ongoing.byte_rate()
+        if byte_rate > 0:
+            limit = min(limit, int(self.max_lag_seconds * byte_rate))
+        return max(limit, 1)
+
+    def recover(self, ongoing, cursor: int) -> Optional[int]:
+        """New cursor for a client that fell behind, or None to disconnect it"""
+        if self.mode != "skip":
+            return None
+        buffer = ongoing.buffer
+        random_access_points = ongoing.inspector.random_access_points
+        if random_access_points:
+            latest = random_access_points[-1]
+            if max(cursor, buffer.tail) < latest < buffer.head:
+                return latest
+        return buffer.head
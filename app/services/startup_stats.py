@@ -0,0 +1,211 @@
+"""
+Stream start latency: per-channel phase timings and startup statistics
+"""
+import asyncio
+import bisect
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import or_
+
+from app.models import Channel
+
+logger = logging.getLogger(__name__)
+
+# Phases of a stream start, in order
+#   info:        engine getstream?format=json (AceStream sources only)
+#   connect:     playback URL request until response headers (stream "started")
+#   first_chunk: response headers until the first data chunk
+#   total:       start requested until the first data chunk
+STARTUP_PHASES = ("info", "connect", "first_chunk", "total")
+
+# Histogram bucket upper bounds, in seconds (the last bucket is unbounded)
+STARTUP_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class PhaseStats:
+    """Durations of one start phase: recent samples for percentiles, all-time histogram"""
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.buckets = [0] * (len(STARTUP_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.buckets[bisect.bisect_left(STARTUP_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def to_dict(self) -> dict:
+        values = sorted(self.samples)
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'p50': round(_percentile(values, 0.50), 3) if values else None,
+            'p95': round(_percentile(values, 0.95), 3) if values else None,
+            'max': round(values[-1], 3) if values else None,
+            'buckets': dict(zip([str(bound) for bound in STARTUP_BUCKETS] + ['+Inf'], self.buckets)),
+        }
+
+
+class ChannelStartupStats:
+    """Start timings of one stream key"""
+
+    def __init__(self, source: str, window: int):
+        self.source = source
+        self.phases = {phase: PhaseStats(window) for phase in STARTUP_PHASES}
+        self.failures = 0
+        self.last_started: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            'source': self.source,
+            'starts': self.phases['total'].count,
+            'failures': self.failures,
+            'last_started': self.last_started.isoformat() if self.last_started else None,
+            'last_error': self.last_error,
+            'phases': {phase: stats.to_dict() for phase, stats in self.phases.items()},
+        }
+
+
+class StartupStats:
+    """
+    In-memory start latency statistics per stream key (AceStream id or URL)
+
+    Percentiles cover the last `window` starts of a channel, histograms every
+    start since the process started.
+    """
+
+    def __init__(self, window: int = 50):
+        self.window = window
+        self.channels: Dict[str, ChannelStartupStats] = {}
+        self.overall = {phase: PhaseStats(window) for phase in STARTUP_PHASES}  # All channels
+
+    def _channel(self, key: str, source: str) -> ChannelStartupStats:
+        stats = self.channels.get(key)
+        if stats is None:
+            stats = self.channels[key] = ChannelStartupStats(source, self.window)
+        return stats
+
+    def record(self, key: str, source: str, timings: Dict[str, float]):
+        """Record a successful start: seconds spent in each phase that applied"""
+        stats = self._channel(key, source)
+        for phase, seconds in timings.items():
+            stats.phases[phase].add(seconds)
+            self.overall[phase].add(seconds)
+        stats.last_started = datetime.now()
+        total = timings.get('total', 0.0)
+        phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items() if phase != 'total')
+        logger.info(f"Stream {key} started in {total:.2f}s ({phases})")
+
+    def record_failure(self, key: str, source: str, error: str):
+        """Record a start that never delivered data"""
+        stats = self._channel(key, source)
+        stats.failures += 1
+        stats.last_error = error
+        logger.info(f"Stream {key} failed to start: {error}")
+
+    def overall_snapshot(self) -> Dict[str, dict]:
+        """Statistics of all channels together, per phase"""
+        return {phase: stats.to_dict() for phase, stats in self.overall.items()}
+    
+    def snapshot(self, key: Optional[str] = None) -> Dict[str, dict]:
+        """Statistics as plain data, for one key or all of them"""
+        if key is not None:
+            stats = self.channels.get(key)
+            return {key: stats.to_dict()} if stats else {}
+        return {channel_key: stats.to_dict() for channel_key, stats in self.channels.items()}
+
+
+def persist_startup_stats(db, snapshot: Dict[str, dict]) -> int:
+    """
+    Store rolling p50/p95 start times on the matching channels
+
+    Returns:
+        Number of channels updated
+    """
+    if not snapshot:
+        return 0
+    keys = list(snapshot)
+    channels = db.query(Channel).filter(
+        or_(Channel.acestream_id.in_(keys), Channel.stream_url.in_(keys))
+    ).all()
+
+    updated = 0
+    for channel in channels:
+        stats = snapshot.get(channel.acestream_id) or snapshot.get(channel.stream_url)
+        total = stats['phases']['total'] if stats else None
+        if not total or total['p50'] is None:
+            continue
+        channel.startup_p50 = total['p50']
+        channel.startup_p95 = total['p95']
+        channel.startup_samples = total['count']
+        channel.startup_failures = stats['failures']
+        updated += 1
+    db.commit()
+    return updated
+
+
+class StartupStatsService:
+    """Periodically copies startup statistics of the streaming server to the channels table"""
+
+    def __init__(self, streaming_server, interval: float = 300.0):
+        self.streaming_server = streaming_server
+        self.interval = interval
+        self.running = False
+
+    async def start(self):
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+        await self.persist()
+
+    async def persist(self) -> int:
+        """Persist the current statistics now"""
+        from app.utils.auth import SessionLocal
+
+        try:
+            snapshot = await self.streaming_server.startup_snapshot()
+        except Exception as e:
+            logger.error(f"Error getting startup statistics: {e}")
+            return 0
+
+        db = SessionLocal()
+        try:
+            updated = persist_startup_stats(db, snapshot)
+            if updated:
+                logger.info(f"Startup statistics saved for {updated} channel(s)")
+            return updated
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error saving startup statistics: {e}")
+            return 0
+        finally:
+            db.close()
+
+    async def auto_persist_loop(self):
+        """Automatic persistence loop"""
+        logger.info(f"Startup statistics loop started (interval: {self.interval}s)")
+        
+        while self.running:
+            try:
+                await asyncio.sleep(self.interval)
+                if self.running:
+                    await self.persist()
+            except asyncio.CancelledError:
+                logger.info("Startup statistics loop cancelled")
+                break
+        
+        logger.info("Startup statistics loop stopped")
@@ -0,0 +1,128 @@
+"""
+Recent outcomes of stream info requests (getstream?format=json) per stream key
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class StreamUnavailable(Exception):
+    """The engine failed to start this stream moments ago, it is not asked again yet"""
+
+    def __init__(self, key: str, error: str, retry_after: float):
+        super().__init__(f"{error} (cached, retry in {retry_after:.0f}s)")
+        self.key = key
+        self.error = error
+        self.retry_after = retry_after
+
+
+class _Outcome:
+    __slots__ = ('ok_until', 'failed_until', 'failures', 'error')
+
+    def __init__(self):
+        self.ok_until = 0.0
+        self.failed_until = 0.0
+        self.failures = 0  # In a row
+        self.error = ""
+
+
+class StreamInfoCache:
+    """
+    Negative cache of stream info requests, with a short memory of successes
+
+    A key whose info request failed (engine error, dead id, timeout) is refused
+    without asking the engine for failure_ttl seconds, doubling with every
+    failure in a row up to max_failure_ttl: a dead channel costs the engine one
+    request per period instead of one per player retry. A success clears it.
+
+    Stream info itself is not reused: its playback and command URLs belong to
+    one engine session and die with it. Successes are only remembered for
+    success_ttl seconds, so a liveness check can tell a channel that started
+    recently without starting it again.
+
+    Thread-safe, so a streaming server on its own thread and the API can share it.
+    """
+
+    def __init__(self, failure_ttl: float = 30.0, max_failure_ttl: float = 300.0,
+                 success_ttl: float = 300.0, max_entries: int = 10000):
+        self.failure_ttl = failure_ttl
+        self.max_failure_ttl = max(max_failure_ttl, failure_ttl)
+        self.success_ttl = success_ttl
+        self.max_entries = max_entries
+        self.refused = 0  # Requests answered from a cached failure
+        self._outcomes: "OrderedDict[str, _Outcome]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def failure(self, key: str) -> Optional[StreamUnavailable]:
+        """The cached failure of key, or None when the engine may be asked"""
+        with self._lock:
+            outcome = self._outcomes.get(key)
+            if outcome is None:
+                return None
+            retry_after = outcome.failed_until - time.monotonic()
+            if retry_after <= 0:
+                return None
+            self.refused += 1
+            return StreamUnavailable(key, outcome.error, retry_after)
+
+    def check(self, key: str):
+        """
+        Raises:
+            StreamUnavailable: If key failed recently
+        """
+        error = self.failure(key)
+        if error is not None:
+            raise error
+
+    def started_recently(self, key: str) -> bool:
+        with self._lock:
+            outcome = self._outcomes.get(key)
+            return outcome is not None and outcome.ok_until > time.monotonic()
+
+    def record_success(self, key: str):
+        with self._lock:
+            outcome = self._outcome(key)
+            outcome.ok_until = time.monotonic() + self.success_ttl
+            outcome.failed_until = 0.0
+            outcome.failures = 0
+            outcome.error = ""
+
+    def record_failure(self, key: str, error: str):
+        if self.failure_ttl <= 0:
+            return
+        with self._lock:
+            outcome = self._outcome(key)
+            outcome.failures += 1
+            ttl = min(self.max_failure_ttl, self.failure_ttl * 2 ** (outcome.failures - 1))
+            outcome.failed_until = time.monotonic() + ttl
+            outcome.ok_until = 0.0
+            outcome.error = error
+
+    def forget(self, key: str):
+        with self._lock:
+            self._outcomes.pop(key, None)
+
+    def _outcome(self, key: str) -> _Outcome:
+        """Entry of key, moved to the newest end; the oldest entries go past max_entries"""
+        outcome = self._outcomes.pop(key, None) or _Outcome()
+        self._outcomes[key] = outcome
+        while len(self._outcomes) > self.max_entries:
+            self._outcomes.popitem(last=False)
+        return outcome
+
+    def snapshot(self) -> dict:
+        """Cache state as plain data"""
+        now = time.monotonic()
+        with self._lock:
+            failing = {key: {'error': outcome.error, 'failures': outcome.failures,
+                             'retry_in': round(outcome.failed_until - now, 1)}
+                       for key, outcome in self._outcomes.items() if outcome.failed_until > now}
+            started = sum(1 for outcome in self._outcomes.values() if outcome.ok_until > now)
+        return {
+            'failure_ttl': self.failure_ttl,
+            'max_failure_ttl': self.max_failure_ttl,
+            'refused': self.refused,
+            'started_recently': started,
+            'failing': failing,
+        }
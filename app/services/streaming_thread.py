@@ -0,0 +1,126 @@
+"""
+Run the aiohttp streaming server on its own event loop in a dedicated thread
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Dict, List, Optional
+from urllib.parse import urlencode
+
+from app.services.aiohttp_streaming_server import AiohttpStreamingServer
+from app.services.performance import new_event_loop
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingServerThread:
+    """
+    AiohttpStreamingServer isolated from the FastAPI event loop
+
+    FastAPI handlers that block their loop (synchronous SQLAlchemy queries,
+    bcrypt, large playlist/EPG generation) no longer delay video delivery: the
+    streaming server accepts clients, reads upstreams and writes to viewers on
+    its own loop. The control plane talks to it only through coroutines
+    submitted to that loop (call()), and gets plain data back.
+
+    Viewers cannot be attached in-process from the FastAPI loop (attachable is
+    False): FastAPI routes redirect them to the streaming port instead.
+    """
+
+    attachable = False
+
+    def __init__(self, public_url: str = "", **server_kwargs):
+        self.public_url = public_url.rstrip("/")
+        self.server_kwargs = server_kwargs
+        self.listen_host = server_kwargs.get("listen_host", "127.0.0.1")
+        self.listen_port = server_kwargs.get("listen_port", 8001)
+        self.server: Optional[AiohttpStreamingServer] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._start_error: Optional[BaseException] = None
+
+    async def start(self):
+        """Start the thread and wait until the server is listening"""
+        self._thread = threading.Thread(target=self._run, name="streaming-server", daemon=True)
+        self._thread.start()
+        await asyncio.get_running_loop().run_in_executor(None, self._ready.wait)
+        if self._start_error is not None:
+            raise self._start_error
+        logger.info("Streaming server running in its own thread and event loop")
+
+    def _run(self):
+        self.loop = new_event_loop(self.server_kwargs.get("performance_profile", False))
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = AiohttpStreamingServer(**self.server_kwargs)
+            self.loop.run_until_complete(self.server.start())
+        except BaseException as e:
+            self._start_error = e
+            self._ready.set()
+            self.loop.close()
+            return
+
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    async def call(self, coro: Awaitable[Any]) -> Any:
+        """Run a coroutine on the streaming loop and wait for its result"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return await asyncio.wrap_future(future)
+
+    @property
+    def buffer_budget(self):
+        """Buffer budget of the server (thread-safe, shared with the API side)"""
+        return self.server.buffer_budget if self.server else None
+
+    @property
+    def stream_info_cache(self):
+        """Recent stream start outcomes of the server (thread-safe, shared with the API side)"""
+        return self.server.stream_info_cache if self.server else None
+    
+    async def streams_snapshot(self) -> List[dict]:
+        return await self.call(self.server.streams_snapshot())
+
+    async def startup_snapshot(self, key: Optional[str] = None) -> Dict[str, dict]:
+        return await self.call(self.server.startup_snapshot(key))
+
+    async def metrics_snapshot(self) -> List[dict]:
+        return await self.call(self.server.metrics_snapshot())
+
+    async def set_warm(self, keys: List[str]) -> List[str]:
+        return await self.call(self.server.set_warm(keys))
+
+    def stream_url(self, host: str, params: dict) -> str:
+        """
+        URL of /ace/getstream on the streaming port, for redirecting a viewer
+        
+        Uses public_url when set, else the host the viewer used to reach us.
+        """
+        base = self.public_url or f"http://{host}:{self.listen_port}"
+        return f"{base}/ace/getstream?{urlencode(params)}"
+
+    def hls_url(self, host: str, key: str, params: dict) -> str:
+        """URL of the HLS playlist of a stream on the streaming port (see stream_url)"""
+        base = self.public_url or f"http://{host}:{self.listen_port}"
+        return f"{base}/ace/hls/{key}/index.m3u8?{urlencode(params)}"
+
+    def manifest_url(self, host: str, params: dict) -> str:
+        """URL of the engine HLS playlist of a stream on the streaming port (see stream_url)"""
+        base = self.public_url or f"http://{host}:{self.listen_port}"
+        return f"{base}/ace/manifest.m3u8?{urlencode(params)}"
+
+    async def stop(self):
+        """Stop the server and its loop, then join the thread"""
+        if self._thread is None or self.server is None:
+            return
+        try:
+            await self.call(self.server.stop())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+            self._thread = None
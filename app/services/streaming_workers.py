@@ -0,0 +1,249 @@
+"""
+Run the aiohttp streaming server as several worker processes on one port
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+import socket
+import sys
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import aiohttp
+
+from app.services.aiohttp_streaming_server import AiohttpStreamingServer, worker_for
+from app.services.engine_pool import EnginePool
+from app.services.performance import install_event_loop
+
+logger = logging.getLogger(__name__)
+
+
+def _run_worker(index: int, worker_ports: List[int], engines: List[Tuple[str, int]],
+                engine_check_interval: float, server_kwargs: dict, ready):
+    """Worker process entry point: serve until SIGTERM"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker {index} - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)],
+        force=True
+    )
+
+    async def serve():
+        engine_pool = EnginePool(engines, check_interval=engine_check_interval)
+        server = AiohttpStreamingServer(
+            engine_pool=engine_pool, worker_index=index, worker_ports=worker_ports, **server_kwargs
+        )
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, stopping.set)
+        loop.add_signal_handler(signal.SIGINT, stopping.set)
+        try:
+            await engine_pool.start()
+            await server.start()
+        except BaseException as e:
+            ready.put(f"{type(e).__name__}: {e}")
+            await server.stop()
+            await engine_pool.stop()
+            return
+        ready.put(None)
+        await stopping.wait()
+        await server.stop()
+        await engine_pool.stop()
+
+    install_event_loop(server_kwargs.get("performance_profile", False))
+    asyncio.run(serve())
+
+
+class StreamingWorkerPool:
+    """
+    N AiohttpStreamingServer processes sharing the streaming port (SO_REUSEPORT)
+
+    Stream state is per process, so every stream id belongs to exactly one worker
+    (worker_for, rendezvous hashing): a worker that receives a viewer for a stream
+    it does not own redirects the player to the owner's own port, and one upstream
+    pull keeps serving all viewers of a channel. Each worker also listens on
+    worker_port + index, and answers /ace/status with the totals of all workers.
+
+    Like StreamingServerThread, viewers cannot be attached in-process (attachable
+    is False): FastAPI routes redirect them to the owning worker.
+    """
+
+    attachable = False
+
+    def __init__(
+        self,
+        workers: int,
+        worker_port: int,
+        engines: List[Tuple[str, int]],
+        engine_check_interval: float = 30.0,
+        public_url: str = "",
+        **server_kwargs
+    ):
+        self.workers = workers
+        self.worker_ports = [worker_port + index for index in range(workers)]
+        self.engines = engines
+        self.engine_check_interval = engine_check_interval
+        self.public_url = public_url.rstrip("/")
+        # Every worker gets an equal share of the buffer budget
+        if server_kwargs.get("buffer_budget"):
+            server_kwargs["buffer_budget"] = max(1, server_kwargs["buffer_budget"] // workers)
+        if server_kwargs.get("hls_proxy_cache_bytes"):
+            server_kwargs["hls_proxy_cache_bytes"] = max(1, server_kwargs["hls_proxy_cache_bytes"] // workers)
+        self.server_kwargs = server_kwargs
+        self.listen_host = server_kwargs.get("listen_host", "127.0.0.1")
+        self.listen_port = server_kwargs.get("listen_port", 8001)
+        self.peer_host = "127.0.0.1" if self.listen_host in ("", "0.0.0.0", "::") else self.listen_host
+        self._processes: List[multiprocessing.Process] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        """Start the worker processes and wait until all of them are listening"""
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("Multiple streaming workers need SO_REUSEPORT, not available on this platform")
+
+        context = multiprocessing.get_context("spawn")
+        loop = asyncio.get_running_loop()
+        readies = []
+        for index in range(self.workers):
+            ready = context.Queue()
+            process = context.Process(
+                target=_run_worker,
+                args=(index, self.worker_ports, self.engines, self.engine_check_interval,
+                      self.server_kwargs, ready),
+                name=f"streaming-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+            readies.append(ready)
+
+        def wait_ready(ready) -> Optional[str]:
+            try:
+                return ready.get(timeout=30)
+            except queue.Empty:
+                return "not listening after 30s"
+
+        errors = await asyncio.gather(*(loop.run_in_executor(None, wait_ready, ready) for ready in readies))
+        failed = [f"worker {index}: {error}" for index, error in enumerate(errors) if error]
+        if failed:
+            await self.stop()
+            raise RuntimeError(f"Streaming workers failed to start ({'; '.join(failed)})")
+
+        self._session = aiohttp.ClientSession()
+        logger.info(f"{self.workers} streaming workers running on port {self.listen_port} "
+                    f"(own ports {self.worker_ports[0]}-{self.worker_ports[-1]})")
+
+    async def _gather_workers(self, path: str, params: Optional[dict] = None) -> list:
+        """GET a JSON document from every worker; unavailable workers are skipped"""
+        timeout = aiohttp.ClientTimeout(total=5)
+
+        async def worker_json(port: int):
+            url = f"http://{self.peer_host}:{port}{path}"
+            async with self._session.get(url, params=params, timeout=timeout) as response:
+                response.raise_for_status()
+                return await response.json()
+
+        results = await asyncio.gather(*(worker_json(port) for port in self.worker_ports),
+                                       return_exceptions=True)
+        documents = []
+        for index, result in enumerate(results):
+            if isinstance(result, BaseException):
+                logger.warning(f"{path} of streaming worker {index} unavailable: {result}")
+                continue
+            documents.append(result)
+        return documents
+
+    async def streams_snapshot(self) -> List[dict]:
+        """Streams of all workers, as plain data"""
+        snapshot = []
+        for streams in await self._gather_workers("/ace/streams"):
+            snapshot.extend(streams)
+        return snapshot
+
+    async def metrics_snapshot(self) -> List[dict]:
+        """Metrics of all workers, one snapshot each"""
+        snapshots = []
+        for worker_snapshots in await self._gather_workers("/metrics", {'local': '1', 'format': 'json'}):
+            snapshots.extend(worker_snapshots)
+        return snapshots
+
+    async def startup_snapshot(self, key: Optional[str] = None) -> Dict[str, dict]:
+        """Start latency statistics of all workers, as plain data"""
+        params = {'local': '1'}
+        if key:
+            params['id'] = key
+        snapshot: Dict[str, dict] = {}
+        for stats in await self._gather_workers("/ace/startup", params):
+            for channel_key, channel_stats in stats.items():
+                snapshot.setdefault(channel_key, channel_stats)
+        return snapshot
+
+    async def set_warm(self, keys: List[str]) -> List[str]:
+        """Hand every worker the keys it owns to keep warm, returns the keys warm now"""
+        owned: List[List[str]] = [[] for _ in self.worker_ports]
+        for key in keys:
+            owned[worker_for(key, self.workers)].append(key)
+        timeout = aiohttp.ClientTimeout(total=30)
+
+        async def worker_warm(port: int, worker_keys: List[str]) -> List[str]:
+            url = f"http://{self.peer_host}:{port}/ace/warm"
+            async with self._session.post(url, json=worker_keys, timeout=timeout) as response:
+                response.raise_for_status()
+                return await response.json()
+
+        results = await asyncio.gather(*(worker_warm(port, worker_keys)
+                                         for port, worker_keys in zip(self.worker_ports, owned)),
+                                       return_exceptions=True)
+        warm = []
+        for index, result in enumerate(results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Pre-warming on streaming worker {index} failed: {result}")
+                continue
+            warm.extend(result)
+        return warm
+
+    def stream_url(self, host: str, params: dict) -> str:
+        """
+        URL of /ace/getstream on the worker owning the stream, for redirecting a viewer
+
+        With public_url set, the shared port behind it routes the viewer instead.
+        """
+        if self.public_url:
+            return f"{self.public_url}/ace/getstream?{urlencode(params)}"
+        key = params.get("id") or params.get("infohash", "")
+        port = self.worker_ports[worker_for(key, self.workers)]
+        return f"http://{host}:{port}/ace/getstream?{urlencode(params)}"
+
+    def hls_url(self, host: str, key: str, params: dict) -> str:
+        """URL of the HLS playlist of a stream on the worker owning it (see stream_url)"""
+        if self.public_url:
+            return f"{self.public_url}/ace/hls/{key}/index.m3u8?{urlencode(params)}"
+        port = self.worker_ports[worker_for(key, self.workers)]
+        return f"http://{host}:{port}/ace/hls/{key}/index.m3u8?{urlencode(params)}"
+
+    def manifest_url(self, host: str, params: dict) -> str:
+        """URL of the engine HLS playlist of a stream on the worker owning it (see stream_url)"""
+        if self.public_url:
+            return f"{self.public_url}/ace/manifest.m3u8?{urlencode(params)}"
+        key = params.get("id") or params.get("infohash", "")
+        port = self.worker_ports[worker_for(key, self.workers)]
+        return f"http://{host}:{port}/ace/manifest.m3u8?{urlencode(params)}"
+
+    async def stop(self):
+        """Stop all workers (each one stops its engine sessions first)"""
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, 10)
+            if process.is_alive():
+                logger.warning(f"Streaming worker {process.name} did not stop, killing it")
+                process.kill()
+        self._processes = []
@@ -1,6 +1,7 @@
 """
 Authentication utilities
 """
+import logging
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -11,6 +12,8 @@ from sqlalchemy.orm import Session
 from app.models import User
 from app.config import get_config
 
+logger = logging.getLogger(__name__)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
@@ -119,6 +122,30 @@ def init_db():
     # Create all tables
     from app.models import Base
     Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine, Base.metadata)
+
+
+def add_missing_columns(engine, metadata):
+    """
+    Add nullable columns introduced after a table was created
+    
+    create_all() only creates missing tables, so existing databases would
+    otherwise fail on every query that selects a new column.
+    """
+    from sqlalchemy import inspect, text
+    
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            logger.info(f"Added column {table.name}.{column.name}")
 
 
 def get_db():
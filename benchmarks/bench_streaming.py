@@ -0,0 +1,528 @@
+"""
+Streaming server benchmarks
+
+Runs the aiohttp streaming server against a fake AceStream engine on localhost,
+so results only depend on this project's code, not on P2P conditions.
+
+Usage:
+    python benchmarks/bench_streaming.py startup --channels 20 --info-delay 0.5
+    python benchmarks/bench_streaming.py fanout --viewers 20 --duration 10
+    python benchmarks/bench_streaming.py stall --block 2
+    python benchmarks/bench_streaming.py workers --workers 4 --channels 8 --viewers 5
+    python benchmarks/bench_streaming.py coalesce --viewers 50 --delays 0,20,50
+    python benchmarks/bench_streaming.py profile --viewers 100 --bitrate 20000000
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.aiohttp_streaming_server import AiohttpStreamingServer  # noqa: E402
+from app.services.streaming_thread import StreamingServerThread  # noqa: E402
+from app.services.streaming_workers import StreamingWorkerPool  # noqa: E402
+
+ENGINE_PORT = 26878
+FRONT_PORT = 26880
+STREAMING_PORT = 26881
+TS_PACKET_SIZE = 188
+
+
+class FakeEngine:
+    """Minimal AceStream engine: JSON getstream, a TS playback URL and method=stop"""
+
+    def __init__(self, port: int = ENGINE_PORT, info_delay: float = 0.0, bitrate: int = 8_000_000,
+                 interval: float = 0.02):
+        self.port = port
+        self.info_delay = info_delay
+        self.bitrate = bitrate
+        self.interval = interval  # Seconds between two writes of the playback stream
+        self.info_requests = 0
+        self.runner = None
+
+    async def handle_getstream(self, request: web.Request) -> web.Response:
+        self.info_requests += 1
+        await asyncio.sleep(self.info_delay)
+        stream_id = request.query.get('id') or request.query.get('infohash')
+        base = f"http://127.0.0.1:{self.port}"
+        return web.json_response({
+            'response': {
+                'playback_url': f"{base}/play/{stream_id}",
+                'stat_url': f"{base}/stat/{stream_id}",
+                'command_url': f"{base}/cmd/{stream_id}",
+            },
+            'error': None,
+        })
+
+    async def handle_play(self, request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        await response.prepare(request)
+        interval = self.interval
+        packets = max(1, int(self.bitrate / 8 * interval) // TS_PACKET_SIZE)
+        packet = bytes([0x47, 0x01, 0x00, 0x10]) + bytes(TS_PACKET_SIZE - 4)
+        payload = packet * packets
+        try:
+            while True:
+                await response.write(payload)
+                await asyncio.sleep(interval)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+    async def handle_cmd(self, request: web.Request) -> web.Response:
+        return web.json_response({'response': 'ok', 'error': None})
+
+    async def handle_stat(self, request: web.Request) -> web.Response:
+        return web.json_response({'response': {'peers': 1, 'speed_down': 0}, 'error': None})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/ace/getstream', self.handle_getstream)
+        app.router.add_get('/play/{stream_id}', self.handle_play)
+        app.router.add_get('/cmd/{stream_id}', self.handle_cmd)
+        app.router.add_get('/stat/{stream_id}', self.handle_stat)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', self.port).start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+async def read_first_bytes(session: aiohttp.ClientSession, url: str) -> float:
+    """Open a stream and return seconds until the first body bytes arrive"""
+    started = time.perf_counter()
+    async with session.get(url) as response:
+        await response.content.readany()
+    return time.perf_counter() - started
+
+
+async def bench_startup(args):
+    """N different channels requested at the same time"""
+    engine = FakeEngine(info_delay=args.info_delay)
+    await engine.start()
+    server = AiohttpStreamingServer(
+        acestream_host='127.0.0.1',
+        acestream_port=ENGINE_PORT,
+        listen_port=STREAMING_PORT,
+        linger_seconds=0,
+    )
+    await server.start()
+    try:
+        url = f"http://127.0.0.1:{STREAMING_PORT}/ace/getstream?id=channel{{}}"
+        async with aiohttp.ClientSession() as session:
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*(
+                read_first_bytes(session, url.format(i)) for i in range(args.channels)
+            ))
+            elapsed = time.perf_counter() - started
+        startup = await server.startup_snapshot()
+    finally:
+        await server.stop()
+        await engine.stop()
+
+    latencies.sort()
+    print(f"channels started:      {args.channels}")
+    print(f"engine info delay:     {args.info_delay:.2f}s")
+    print(f"engine info requests:  {engine.info_requests}")
+    print(f"wall time:             {elapsed:.2f}s (fully serialized would be >= "
+          f"{args.channels * args.info_delay:.2f}s)")
+    print(f"time to first byte:    p50 {latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s")
+    for phase in ('info', 'connect', 'first_chunk', 'total'):
+        p50s = sorted(stats['phases'][phase]['p50'] for stats in startup.values())
+        print(f"server {phase + ' p50':<15} {p50s[len(p50s) // 2]:.3f}s (median over channels)")
+
+
+async def loopback_stream(url: str, chunk_size: int = 1024):
+    """
+    The previous FastAPI paths over loopback: StreamHelper.receive_stream for
+    Xtream /live (1 KiB chunks) and the /ace/getstream proxy (8 KiB chunks)
+    """
+    timeout = aiohttp.ClientTimeout(sock_read=60)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(url) as response:
+            async for data in response.content.iter_chunked(chunk_size):
+                yield data
+
+
+async def run_viewers(url: str, viewers: int, duration: float) -> int:
+    async def viewer(session):
+        received = 0
+        deadline = time.monotonic() + duration
+        async with session.get(url) as response:
+            async for data in response.content.iter_any():
+                received += len(data)
+                if time.monotonic() > deadline:
+                    break
+        return received
+
+    async with aiohttp.ClientSession() as session:
+        return sum(await asyncio.gather(*(viewer(session) for _ in range(viewers))))
+
+
+def viewers_process(url: str, viewers: int, duration: float, results):
+    results.put(asyncio.run(run_viewers(url, viewers, duration)))
+
+
+async def bench_fanout(args):
+    """CPU of this process per viewer, FastAPI stream paths over loopback vs attached in-process"""
+    engine = FakeEngine(bitrate=args.bitrate)
+    await engine.start()
+    server = AiohttpStreamingServer(
+        acestream_host='127.0.0.1',
+        acestream_port=ENGINE_PORT,
+        listen_port=STREAMING_PORT,
+    )
+    await server.start()
+
+    # Stand-in for the main (FastAPI) server: same response path for both modes
+    async def handle_loopback(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        await response.prepare(request)
+        url = f"http://127.0.0.1:{STREAMING_PORT}/ace/getstream?id={request.match_info['stream_id']}"
+        try:
+            async for data in loopback_stream(url, int(request.match_info['chunk_size'])):
+                await response.write(data)
+        except ConnectionResetError:
+            pass
+        return response
+
+    async def handle_direct(request: web.Request) -> web.StreamResponse:
+        ongoing = await server.open_stream(request.match_info['stream_id'])
+        response = web.StreamResponse()
+        await response.prepare(request)
+        chunks = server.iter_client_bytes(ongoing, request.remote, 'bench', 'bench')
+        try:
+            async for data in chunks:
+                await response.write(data)
+        except ConnectionResetError:
+            pass
+        finally:
+            await chunks.aclose()
+        return response
+
+    front = web.Application()
+    front.router.add_get('/loopback/{chunk_size}/{stream_id}', handle_loopback)
+    front.router.add_get('/direct/{stream_id}', handle_direct)
+    runner = web.AppRunner(front)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', FRONT_PORT).start()
+
+    loop = asyncio.get_event_loop()
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        modes = {
+            'loopback-1k': 'loopback/1024',  # Xtream /live before
+            'loopback-8k': 'loopback/8192',  # /ace/getstream before
+            'direct': 'direct',
+        }
+        for mode, path in modes.items():
+            queue = context.Queue()
+            url = f"http://127.0.0.1:{FRONT_PORT}/{path}/channel-{mode}"
+            process = context.Process(target=viewers_process, args=(url, args.viewers, args.duration, queue))
+            process.start()
+            # Viewers run in another process: only the server side is measured here
+            cpu_started, wall_started = time.process_time(), time.perf_counter()
+            received = await loop.run_in_executor(None, queue.get)
+            cpu = time.process_time() - cpu_started
+            wall = time.perf_counter() - wall_started
+            await loop.run_in_executor(None, process.join)
+            results.append((mode, cpu, wall, received))
+    finally:
+        await runner.cleanup()
+        await server.stop()
+        await engine.stop()
+
+    print(f"viewers:               {args.viewers} on one channel at {args.bitrate / 1e6:.1f} Mbit/s")
+    print(f"{'mode':<12} {'cpu s':>8} {'cpu %/viewer':>13} {'cpu ms/viewer-Mbit':>19} {'MB received':>12}")
+    for mode, cpu, wall, received in results:
+        per_viewer = cpu / wall / args.viewers * 100
+        mbits = received * 8 / 1e6
+        print(f"{mode:<12} {cpu:8.2f} {per_viewer:13.2f} {cpu * 1000 / mbits:19.3f} {received / 1e6:12.1f}")
+
+
+async def measure_stall(duration: float, heavy_at: float) -> float:
+    """Watch a stream and return the longest gap between chunks, calling /heavy meanwhile"""
+    engine = FakeEngine()
+    await engine.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async def viewer():
+                max_gap = 0.0
+                last = None
+                deadline = time.monotonic() + duration
+                async with session.get(f"http://127.0.0.1:{STREAMING_PORT}/ace/getstream?id=stall") as response:
+                    async for _ in response.content.iter_any():
+                        now = time.monotonic()
+                        if last is not None:
+                            max_gap = max(max_gap, now - last)
+                        last = now
+                        if now > deadline:
+                            break
+                return max_gap
+
+            async def heavy_request():
+                await asyncio.sleep(heavy_at)
+                async with session.get(f"http://127.0.0.1:{FRONT_PORT}/heavy") as response:
+                    await response.read()
+
+            max_gap, _ = await asyncio.gather(viewer(), heavy_request())
+            await asyncio.sleep(0.5)  # Let the server stop its engine session
+            return max_gap
+    finally:
+        await engine.stop()
+
+
+def stall_process(duration: float, heavy_at: float, results):
+    results.put(asyncio.run(measure_stall(duration, heavy_at)))
+
+
+async def bench_stall(args):
+    """Longest delivery gap while an API handler blocks the main event loop"""
+    # Stand-in for an async def FastAPI handler doing synchronous work (SQLAlchemy, bcrypt)
+    async def handle_heavy(request: web.Request) -> web.Response:
+        time.sleep(args.block)
+        return web.Response(text='done')
+
+    front = web.Application()
+    front.router.add_get('/heavy', handle_heavy)
+    runner = web.AppRunner(front)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', FRONT_PORT).start()
+
+    loop = asyncio.get_event_loop()
+    context = multiprocessing.get_context('spawn')
+    results = []
+    server_kwargs = dict(acestream_host='127.0.0.1', acestream_port=ENGINE_PORT, listen_port=STREAMING_PORT,
+                         linger_seconds=0)
+    try:
+        for mode in ('inline', 'thread'):
+            if mode == 'thread':
+                server = StreamingServerThread(**server_kwargs)
+            else:
+                server = AiohttpStreamingServer(**server_kwargs)
+            await server.start()
+            try:
+                # Engine and viewer live in another process, only this loop is blocked
+                queue = context.Queue()
+                process = context.Process(target=stall_process, args=(args.duration, 2.0, queue))
+                process.start()
+                results.append((mode, await loop.run_in_executor(None, queue.get)))
+                await loop.run_in_executor(None, process.join)
+            finally:
+                await server.stop()
+    finally:
+        await runner.cleanup()
+
+    print(f"blocking API request:  {args.block:.1f}s on the main event loop")
+    for mode, max_gap in results:
+        print(f"{mode:<8} longest gap between stream chunks: {max_gap * 1000:.0f} ms")
+
+
+async def bench_workers(args):
+    """Viewers of several channels through the shared port of N streaming workers"""
+    engine = FakeEngine()
+    await engine.start()
+    pool = StreamingWorkerPool(
+        workers=args.workers,
+        worker_port=STREAMING_PORT + 1,
+        engines=[('127.0.0.1', ENGINE_PORT)],
+        acestream_host='127.0.0.1',
+        acestream_port=ENGINE_PORT,
+        listen_port=STREAMING_PORT,
+        linger_seconds=0,
+    )
+    await pool.start()
+    try:
+        # Viewers land on any worker; the ones that do not own the channel redirect them
+        async def viewer(session, channel):
+            url = f"http://127.0.0.1:{STREAMING_PORT}/ace/getstream?id=channel{channel}"
+            received = 0
+            deadline = time.monotonic() + args.duration
+            async with session.get(url) as response:
+                port = response.url.port
+                async for data in response.content.iter_any():
+                    received += len(data)
+                    if time.monotonic() > deadline:
+                        break
+            return channel, port, received
+
+        async with aiohttp.ClientSession() as session:
+            async def status_while_watching():
+                await asyncio.sleep(args.duration / 2)
+                async with session.get(f"http://127.0.0.1:{STREAMING_PORT}/ace/status") as response:
+                    return await response.json()
+
+            viewers = [viewer(session, channel) for channel in range(args.channels) for _ in range(args.viewers)]
+            status, *results = await asyncio.gather(status_while_watching(), *viewers)
+    finally:
+        await pool.stop()
+        await engine.stop()
+
+    print(f"workers:               {args.workers}")
+    print(f"channels x viewers:    {args.channels} x {args.viewers}")
+    print(f"engine sessions:       {engine.info_requests} (one per channel expected)")
+    print(f"redirected viewers:    {sum(1 for _, port, _ in results if port != STREAMING_PORT)}/{len(results)}")
+    print(f"aggregated status:     {status['streams']} streams, per worker "
+          f"{[worker.get('streams') for worker in status['workers']]}")
+    print(f"MB received:           {sum(received for _, _, received in results) / 1e6:.1f}")
+
+
+async def bench_coalesce(args):
+    """Writes and CPU per viewer of /ace/getstream with different write coalescing delays"""
+    engine = FakeEngine(bitrate=args.bitrate, interval=args.engine_interval)
+    await engine.start()
+    loop = asyncio.get_event_loop()
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        for delay_ms in (int(delay) for delay in args.delays.split(',')):
+            server = AiohttpStreamingServer(
+                acestream_host='127.0.0.1',
+                acestream_port=ENGINE_PORT,
+                listen_port=STREAMING_PORT,
+                chunk_size=args.chunk_size,
+                write_coalesce_delay=delay_ms / 1000,
+            )
+            await server.start()
+            try:
+                queue = context.Queue()
+                url = f"http://127.0.0.1:{STREAMING_PORT}/ace/getstream?id=channel-{delay_ms}"
+                process = context.Process(target=viewers_process, args=(url, args.viewers, args.duration, queue))
+                process.start()
+                # Viewers run in another process: only the server side is measured here
+                writes_started = server.metrics.client_writes
+                cpu_started, wall_started = time.process_time(), time.perf_counter()
+                received = await loop.run_in_executor(None, queue.get)
+                cpu = time.process_time() - cpu_started
+                wall = time.perf_counter() - wall_started
+                writes = server.metrics.client_writes - writes_started
+                await loop.run_in_executor(None, process.join)
+                results.append((delay_ms, cpu, wall, writes, received))
+            finally:
+                await server.stop()
+    finally:
+        await engine.stop()
+
+    print(f"viewers:               {args.viewers} on one channel at {args.bitrate / 1e6:.1f} Mbit/s, "
+          f"{args.chunk_size} byte upstream chunks")
+    print(f"{'delay ms':>8} {'writes/s/viewer':>16} {'KB/write':>9} {'cpu %/viewer':>13} "
+          f"{'cpu ms/viewer-Mbit':>19} {'MB received':>12}")
+    for delay_ms, cpu, wall, writes, received in results:
+        per_viewer = cpu / wall / args.viewers * 100
+        mbits = received * 8 / 1e6
+        print(f"{delay_ms:>8} {writes / wall / args.viewers:16.1f} {received / max(writes, 1) / 1024:9.1f} "
+              f"{per_viewer:13.2f} {cpu * 1000 / mbits:19.3f} {received / 1e6:12.1f}")
+
+
+async def bench_profile(args):
+    """Throughput and CPU of the streaming server (own thread) with the default and performance profiles"""
+    engine = FakeEngine(bitrate=args.bitrate)
+    await engine.start()
+    loop = asyncio.get_event_loop()
+    context = multiprocessing.get_context('spawn')
+    results = []
+    try:
+        for profile in ('default', 'performance'):
+            server = StreamingServerThread(
+                acestream_host='127.0.0.1',
+                acestream_port=ENGINE_PORT,
+                listen_port=STREAMING_PORT,
+                performance_profile=profile == 'performance',
+                socket_send_buffer=args.send_buffer,
+            )
+            await server.start()
+            try:
+                url = f"http://127.0.0.1:{STREAMING_PORT}/ace/getstream?id=channel-{profile}"
+                queue = context.Queue()
+                # Several viewer processes, so the clients are not the bottleneck
+                share = max(1, args.viewers // args.processes)
+                processes = [context.Process(target=viewers_process, args=(url, share, args.duration, queue))
+                             for _ in range(args.processes)]
+                for process in processes:
+                    process.start()
+                cpu_started, wall_started = time.process_time(), time.perf_counter()
+                received = 0
+                for _ in processes:
+                    received += await loop.run_in_executor(None, queue.get)
+                cpu = time.process_time() - cpu_started
+                wall = time.perf_counter() - wall_started
+                for process in processes:
+                    await loop.run_in_executor(None, process.join)
+                results.append((profile, type(server.loop).__module__, cpu, wall, received, share * len(processes)))
+            finally:
+                await server.stop()
+    finally:
+        await engine.stop()
+
+    print(f"channel:               {args.bitrate / 1e6:.1f} Mbit/s, send buffer "
+          f"{args.send_buffer or 'autotuned'} in the performance profile")
+    print(f"{'profile':<12} {'loop':<20} {'viewers':>8} {'Mbit/s out':>11} {'cpu %':>7} {'cpu ms/viewer-Mbit':>19}")
+    for profile, loop_module, cpu, wall, received, viewers in results:
+        mbits = received * 8 / 1e6
+        print(f"{profile:<12} {loop_module:<20} {viewers:>8} {mbits / wall:11.0f} {cpu / wall * 100:7.1f} "
+              f"{cpu * 1000 / mbits:19.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    startup = subparsers.add_parser('startup', help='parallel start of different channels')
+    startup.add_argument('--channels', type=int, default=20)
+    startup.add_argument('--info-delay', type=float, default=0.5,
+                         help='simulated engine delay for getstream?format=json (seconds)')
+    startup.set_defaults(func=bench_startup)
+
+    fanout = subparsers.add_parser('fanout', help='CPU per viewer of the FastAPI stream paths')
+    fanout.add_argument('--viewers', type=int, default=20)
+    fanout.add_argument('--duration', type=float, default=10.0, help='seconds per mode')
+    fanout.add_argument('--bitrate', type=int, default=8_000_000, help='channel bitrate (bits/second)')
+    fanout.set_defaults(func=bench_fanout)
+
+    stall = subparsers.add_parser('stall', help='delivery gaps while an API handler blocks the event loop')
+    stall.add_argument('--block', type=float, default=2.0, help='seconds the API handler blocks')
+    stall.add_argument('--duration', type=float, default=6.0, help='seconds watched per mode')
+    stall.set_defaults(func=bench_stall)
+
+    workers = subparsers.add_parser('workers', help='stream affinity across streaming worker processes')
+    workers.add_argument('--workers', type=int, default=4)
+    workers.add_argument('--channels', type=int, default=8)
+    workers.add_argument('--viewers', type=int, default=5, help='viewers per channel')
+    workers.add_argument('--duration', type=float, default=4.0, help='seconds watched')
+    workers.set_defaults(func=bench_workers)
+
+    coalesce = subparsers.add_parser('coalesce', help='writes and CPU per viewer with write coalescing')
+    coalesce.add_argument('--viewers', type=int, default=50)
+    coalesce.add_argument('--duration', type=float, default=10.0, help='seconds per delay')
+    coalesce.add_argument('--delays', default='0,20,50', help='coalescing delays to compare (ms)')
+    coalesce.add_argument('--chunk-size', type=int, default=8192, help='upstream read size (bytes)')
+    coalesce.add_argument('--bitrate', type=int, default=8_000_000, help='channel bitrate (bits/second)')
+    coalesce.add_argument('--engine-interval', type=float, default=0.005,
+                          help='seconds between engine writes (P2P data arrives in small bursts)')
+    coalesce.set_defaults(func=bench_coalesce)
+
+    profile = subparsers.add_parser('profile', help='throughput with the default and performance profiles')
+    profile.add_argument('--viewers', type=int, default=100)
+    profile.add_argument('--processes', type=int, default=4, help='viewer processes')
+    profile.add_argument('--duration', type=float, default=10.0, help='seconds per profile')
+    profile.add_argument('--bitrate', type=int, default=20_000_000, help='channel bitrate (bits/second)')
+    profile.add_argument('--send-buffer', type=int, default=0, help='SO_SNDBUF of viewer sockets (0: autotuned)')
+    profile.set_defaults(func=bench_profile)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
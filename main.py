@@ -22,8 +22,14 @@ from app.config import get_config
 from app.utils.auth import create_user
 from app.services.aceproxy_service import AceProxyService
 from app.services.aiohttp_streaming_server import AiohttpStreamingServer
+from app.services.streaming_thread import StreamingServerThread
+from app.services.streaming_workers import StreamingWorkerPool
+from app.services.engine_pool import EnginePool
 from app.services.scraper_service import ImprovedScraperService
 from app.services.epg_service import EPGService
+from app.services.startup_stats import StartupStatsService
+from app.services.channel_checker import ChannelChecker
+from app.services.prewarmer import PreWarmer
 from app.api import xtream
 from app.api import dashboard
 from app.api import api_endpoints
@@ -63,14 +69,19 @@ logger = logging.getLogger(__name__)
 # Global services
 aceproxy_service: AceProxyService = None
 aiohttp_streaming_server: AiohttpStreamingServer = None
+engine_pool: EnginePool = None
 scraper_service: ImprovedScraperService = None  # Using improved scraper
 epg_service: EPGService = None
+startup_stats_service: StartupStatsService = None
+channel_checker: ChannelChecker = None
+prewarmer: PreWarmer = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
-    global aceproxy_service, aiohttp_streaming_server, scraper_service, epg_service
+    global aceproxy_service, aiohttp_streaming_server, engine_pool, scraper_service, epg_service
+    global startup_stats_service, channel_checker, prewarmer
     
     logger.info("Starting Unified IPTV AceStream Platform...")
     
@@ -122,8 +133,14 @@ async def lifespan(app: FastAPI):
         
         # Initialize services
         if config.acestream_enabled:
+            engine_pool = EnginePool(
+                config.get_acestream_engines_list(),
+                check_interval=config.acestream_engine_check_interval,
+            )
+            await engine_pool.start()
+            
             logger.info("Starting aiohttp streaming server (native pyacexy pattern)...")
-            aiohttp_streaming_server = AiohttpStreamingServer(
+            streaming_kwargs = dict(
                 acestream_host=config.acestream_engine_host,
                 acestream_port=config.acestream_engine_port,
                 listen_host=config.acestream_streaming_host,
@@ -131,7 +148,45 @@ async def lifespan(app: FastAPI):
                 chunk_size=config.acestream_chunk_size,
                 empty_timeout=config.acestream_empty_timeout,
                 no_response_timeout=config.acestream_no_response_timeout,
+                buffer_size=config.acestream_buffer_size,
+                backlog_seconds=config.acestream_backlog_seconds,
+                backlog_bytes=config.acestream_backlog_bytes,
+                linger_seconds=config.acestream_linger_seconds,
+                engine_pool=engine_pool,
+                reconnect_attempts=config.acestream_reconnect_attempts,
+                reconnect_delay=config.acestream_reconnect_delay,
+                slow_client_policy=config.acestream_slow_client_policy,
+                skip_lag_seconds=config.acestream_skip_lag_seconds,
+                buffer_budget=config.acestream_buffer_budget,
+                write_coalesce_delay=config.acestream_write_coalesce_ms / 1000,
+                performance_profile=config.acestream_performance_profile,
+                socket_send_buffer=config.acestream_socket_send_buffer,
+                upstream_limit_per_host=config.acestream_engine_connections_per_host,
+                info_failure_ttl=config.acestream_info_failure_ttl,
+                info_failure_max_ttl=config.acestream_info_failure_max_ttl,
+                hls_segment_seconds=config.acestream_hls_segment_seconds,
+                hls_window=config.acestream_hls_window,
+                hls_proxy_cache_bytes=config.acestream_hls_proxy_cache_size,
             )
+            if config.acestream_streaming_workers > 1:
+                # Worker processes on a shared port, each channel owned by one of them
+                streaming_kwargs.pop("engine_pool")
+                aiohttp_streaming_server = StreamingWorkerPool(
+                    workers=config.acestream_streaming_workers,
+                    worker_port=config.acestream_streaming_worker_port or config.acestream_streaming_port + 1,
+                    engines=config.get_acestream_engines_list(),
+                    engine_check_interval=config.acestream_engine_check_interval,
+                    public_url=config.acestream_streaming_public_url,
+                    **streaming_kwargs,
+                )
+            elif config.acestream_streaming_thread:
+                # Own thread and event loop: blocking API handlers cannot stall video delivery
+                aiohttp_streaming_server = StreamingServerThread(
+                    public_url=config.acestream_streaming_public_url,
+                    **streaming_kwargs,
+                )
+            else:
+                aiohttp_streaming_server = AiohttpStreamingServer(**streaming_kwargs)
             await aiohttp_streaming_server.start()
             
             # Keep old AceProxyService for compatibility (stats, management API)
@@ -139,16 +194,38 @@ async def lifespan(app: FastAPI):
             aceproxy_service = AceProxyService(
                 acestream_host=config.acestream_engine_host,
                 acestream_port=config.acestream_engine_port,
-                timeout=config.acestream_timeout
+                timeout=config.acestream_timeout,
+                engine_pool=engine_pool,
+                buffer_budget=getattr(aiohttp_streaming_server, "buffer_budget", None),
+                stream_info_cache=getattr(aiohttp_streaming_server, "stream_info_cache", None),
             )
             await aceproxy_service.start()
             
+            # Save per-channel start times (p50/p95) to the database periodically
+            startup_stats_service = StartupStatsService(
+                aiohttp_streaming_server,
+                interval=config.acestream_startup_stats_interval,
+            )
+            await startup_stats_service.start()
+            
+            # Opt-in: keep likely next channels attached upstream without viewers
+            if config.acestream_prewarm_streams > 0:
+                prewarmer = PreWarmer(
+                    aiohttp_streaming_server,
+                    streams=config.acestream_prewarm_streams,
+                    strategy=config.acestream_prewarm_strategy,
+                    interval=config.acestream_prewarm_interval,
+                )
+                await prewarmer.start()
+            
             # Store in app state
             app.state.aceproxy_service = aceproxy_service
             app.state.aiohttp_streaming_server = aiohttp_streaming_server
+            app.state.prewarmer = prewarmer
         else:
             app.state.aceproxy_service = None
             app.state.aiohttp_streaming_server = None
+            app.state.prewarmer = None
         
         logger.info("Starting Scraper service...")
         scraper_service = ImprovedScraperService(
@@ -160,9 +237,27 @@ async def lifespan(app: FastAPI):
         epg_service = EPGService(db)
         await epg_service.start()
         
+        logger.info("Starting channel checker...")
+        channel_checker = ChannelChecker(
+            engine_pool=engine_pool,
+            streaming_server=aiohttp_streaming_server,
+            stream_info_cache=aceproxy_service.stream_info_cache if aceproxy_service else None,
+            interval=config.channel_check_interval,
+            concurrency=config.channel_check_concurrency,
+            per_host=config.channel_check_per_host,
+            timeout=config.channel_check_timeout,
+        )
+        await channel_checker.start()
+        
         # Start background tasks
         asyncio.create_task(scraper_service.auto_scrape_loop())
         asyncio.create_task(epg_service.auto_update_loop())
+        if startup_stats_service:
+            asyncio.create_task(startup_stats_service.auto_persist_loop())
+        if config.channel_check_interval:
+            asyncio.create_task(channel_checker.auto_check_loop())
+        if prewarmer:
+            asyncio.create_task(prewarmer.auto_warm_loop())
         
         logger.info("All services started successfully")
         
@@ -174,18 +269,30 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down services...")
     
+    if startup_stats_service:
+        await startup_stats_service.stop()
+    
+    if prewarmer:
+        await prewarmer.stop()
+    
     if aiohttp_streaming_server:
         await aiohttp_streaming_server.stop()
     
     if aceproxy_service:
         await aceproxy_service.stop()
     
+    if engine_pool:
+        await engine_pool.stop()
+    
     if scraper_service:
         await scraper_service.stop()
     
     if epg_service:
         await epg_service.stop()
     
+    if channel_checker:
+        await channel_checker.stop()
+    
     logger.info("Shutdown complete")
 
 
@@ -247,9 +354,7 @@ async def health_check(request: Request):
     active_streams_count = 0
     if config.acestream_enabled and aiohttp_streaming_server:
         try:
-            # Quick lock to get count only
-            async with aiohttp_streaming_server.streams_lock:
-                active_streams_count = len(aiohttp_streaming_server.streams)
+            active_streams_count = len(await aiohttp_streaming_server.streams_snapshot())
         except Exception as e:
             logger.error(f"Error getting stream count: {e}")
     